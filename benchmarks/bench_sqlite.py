@@ -0,0 +1,103 @@
+"""
+Benchmarks the url tracking db at archive scale.
+
+Builds a throwaway db with --rows known auctions through utils.insert_urls, then times utils.filter_urls
+on candidate batches of increasing size (half known, half new) against the old single `IN (?, ?, ...)`
+query, plus stage_urls and mark_uploaded on the new urls.
+
+    uv run benchmarks/bench_sqlite.py
+    uv run benchmarks/bench_sqlite.py --rows 5000000 --output benchmarks/results/sqlite.json
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, '..', 'src'))
+
+
+def make_url(n:int) -> str:
+    return f"https://carsandbids.com/auctions/{n:08x}/2004-porsche-911-carrera"
+
+
+def filter_urls_in_list(cursor, urls:list) -> list:
+    """The previous filter_urls: one placeholder per url."""
+    auctions = {url.split("/")[-2]: url for url in urls}
+    auction_ids = list(auctions)
+    placeholders = ",".join('?' for _ in auction_ids)
+    cursor.execute(f"SELECT auction_id FROM urls WHERE auction_id in ({placeholders});", auction_ids)
+    existing_ids = {row[0] for row in cursor.fetchall()}
+    return [auctions[id] for id in auction_ids if id not in existing_ids]
+
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return result, round(time.perf_counter() - start, 4)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite url tracking benchmark")
+    parser.add_argument("--rows", type=int, default=1_000_000, help="Known auctions to load. Default is 1,000,000")
+    parser.add_argument("--candidates", type=int, nargs='+', default=[100, 1_000, 10_000, 100_000, 1_000_000], help="Candidate batch sizes to filter")
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, 'bench.db')
+        os.environ['SQLITE_DB_PATH'] = db_path
+        sys.path.insert(0, SRC_DIR)
+        os.chdir(tmp)
+        import sqlite_setup
+        import utils
+
+        sqlite_setup.init_db(db_path)
+        conn, cursor = utils.db_connection(db_path)
+        results = {'rows': args.rows, 'sqlite': sqlite3.sqlite_version, 'filter': []}
+
+        inserted, seconds = timed(lambda: utils.insert_urls(cursor, (make_url(n) for n in range(args.rows))))
+        conn.commit()
+        results['insert'] = {'rows': inserted, 'seconds': seconds, 'rows_per_sec': round(inserted / seconds)}
+        print(f"insert_urls: {inserted} rows in {seconds}s ({results['insert']['rows_per_sec']} rows/sec)")
+
+        for size in args.candidates:
+            known = random.sample(range(args.rows), min(size // 2, args.rows))
+            candidates = [make_url(n) for n in known] + [make_url(args.rows + n) for n in range(size - len(known))]
+            random.shuffle(candidates)
+
+            new_urls, seconds = timed(lambda: utils.filter_urls(cursor, candidates))
+            assert len(new_urls) == size - len(known)
+            entry = {'candidates': size, 'new': len(new_urls), 'temp_table_seconds': seconds}
+            try:
+                _, entry['in_list_seconds'] = timed(lambda: filter_urls_in_list(cursor, candidates))
+            except sqlite3.OperationalError as e:
+                # "too many SQL variables" past SQLITE_MAX_VARIABLE_NUMBER
+                entry['in_list_seconds'] = None
+                entry['in_list_error'] = str(e)
+            results['filter'].append(entry)
+            print(f"filter_urls on {size} candidates: {seconds}s (IN list: {entry.get('in_list_error') or str(entry['in_list_seconds']) + 's'})")
+
+        new_urls = [make_url(args.rows + n) for n in range(max(args.candidates))]
+        staged, seconds = timed(lambda: utils.stage_urls(cursor, new_urls))
+        results['stage'] = {'rows': staged, 'seconds': seconds}
+        _, seconds = timed(lambda: utils.mark_uploaded(cursor, new_urls))
+        conn.commit()
+        results['mark_uploaded'] = {'rows': len(new_urls), 'seconds': seconds}
+        print(f"stage_urls: {staged} rows in {results['stage']['seconds']}s, mark_uploaded: {seconds}s")
+
+        cursor.close()
+        conn.close()
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Benchmarks startup time of the cli commands.
+
+Imports each command's modules in a fresh interpreter under `python -X importtime` and reports the cumulative
+import time and the slowest imports, then times the wall clock of a few cheap commands end to end.
+
+    uv run benchmarks/bench_startup.py
+    uv run benchmarks/bench_startup.py --repeat 10 --output benchmarks/results/startup.json
+"""
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+SRC_DIR = os.path.abspath(os.path.join(BENCHMARKS_DIR, '..', 'src'))
+
+# modules each cli command imports before doing any work
+COMMAND_IMPORTS = {
+    'cli': ['cli'],
+    'export_urls': ['cli', 'sqlite_setup', 'utils'],
+    'reparse': ['cli', 'html_archive', 'sinks'],
+    'backfill': ['cli', 'backfill'],
+    'scrape': ['cli', 'main'],
+}
+
+# commands timed end to end, run against a throwaway db
+COMMANDS = {
+    'help': ['--help'],
+    'export_urls': ['export_urls', '--file', 'auction_urls.csv'],
+}
+
+
+def parse_importtime(stderr:str) -> list:
+    """
+    Parses `-X importtime` output.
+
+    Returns:
+        list: (module, self microseconds, cumulative microseconds) per imported module.
+    """
+    imports = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, module = line[len('import time:'):].split('|')
+        # nested imports are indented two spaces per level under the one importing them
+        imports.append((module[1:].rstrip(), int(self_us), int(cumulative_us)))
+    return imports
+
+
+def import_times(modules:list, env:dict, cwd:str) -> dict:
+    """Imports modules in a fresh interpreter and returns the total and the slowest top-level imports (ms)."""
+    code = "; ".join(f"import {module}" for module in modules)
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', code], env=env, cwd=cwd, capture_output=True, text=True
+    )
+    if completed.returncode:
+        raise RuntimeError(f"importing {modules} failed:\n{completed.stderr[-2000:]}")
+    imports = parse_importtime(completed.stderr)
+    # only top level entries add up to the total
+    top_level = [(module, cumulative) for module, _, cumulative in imports if not module.startswith(' ')]
+    slowest = sorted(top_level, key=lambda entry: entry[1], reverse=True)[:5]
+    return {
+        'total_ms': round(sum(cumulative for _, cumulative in top_level) / 1000, 1),
+        'slowest': [{'module': module, 'ms': round(cumulative / 1000, 1)} for module, cumulative in slowest],
+    }
+
+
+def wall_clock(args:list, env:dict, cwd:str, repeat:int) -> dict:
+    """Median and best wall clock (ms) of `python cli.py <args>`."""
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, os.path.join(SRC_DIR, 'cli.py')] + args, env=env, cwd=cwd,
+                       capture_output=True, check=True)
+        runs.append((time.perf_counter() - start) * 1000)
+    return {'median_ms': round(statistics.median(runs), 1), 'best_ms': round(min(runs), 1)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="cli startup benchmark")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per measurement, the median is reported. Default is 5")
+    parser.add_argument("--output", type=str, default=None, help="Optional JSON file for the results")
+    args = parser.parse_args()
+
+    tmp = tempfile.mkdtemp()
+    try:
+        env = dict(os.environ, SQLITE_DB_PATH=os.path.join(tmp, 'bench.db'), LOG_FILE=os.path.join(tmp, 'logs.json'),
+                   PYTHONPATH=SRC_DIR)
+        # warm the bytecode cache so the first measurement isn't compiling
+        import_times(sorted({module for modules in COMMAND_IMPORTS.values() for module in modules}), env, tmp)
+
+        results = {'python': sys.version.split()[0], 'imports': {}, 'commands': {}}
+        for command, modules in COMMAND_IMPORTS.items():
+            runs = [import_times(modules, env, tmp) for _ in range(args.repeat)]
+            result = min(runs, key=lambda run: run['total_ms'])
+            result['median_ms'] = round(statistics.median(run['total_ms'] for run in runs), 1)
+            results['imports'][command] = result
+            slowest = ", ".join(f"{entry['module']} {entry['ms']}ms" for entry in result['slowest'])
+            print(f"import {command}: {result['median_ms']}ms (slowest: {slowest})")
+
+        for command, cli_args in COMMANDS.items():
+            result = wall_clock(cli_args, env, tmp, args.repeat)
+            results['commands'][command] = result
+            print(f"cli.py {' '.join(cli_args)}: {result['median_ms']}ms wall clock (best {result['best_ms']}ms)")
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
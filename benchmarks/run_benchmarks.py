@@ -0,0 +1,316 @@
+"""
+Offline benchmarks for the listing and detail scrapers.
+
+Serves the HTML fixtures in benchmarks/fixtures from a local HTTP server and measures:
+    - parser: parse_auction_html pages/sec per fixture and per-field selector latency
+    - http: pages/sec for listing discovery and auction scraping over the HTTP backend
+    - selenium (--selenium, needs Chrome): pages/sec and WebDriver round trips per page for
+      discovery and every extraction mode
+
+Results are written as JSON to benchmarks/results/. Pass --compare to diff against an earlier run:
+
+    uv run benchmarks/run_benchmarks.py
+    uv run benchmarks/run_benchmarks.py --selenium --compare benchmarks/results/<earlier>.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+from urllib.parse import urlparse, parse_qs
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+FIXTURES_DIR = os.path.join(BENCHMARKS_DIR, 'fixtures')
+RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+SRC_DIR = os.path.join(BENCHMARKS_DIR, '..', 'src')
+
+AUCTION_FIXTURES = ['sold', 'reserve_not_met', 'cancelled', 'no_quick_facts', 'many_bids']
+LISTING_PAGES = 3
+
+# selectors behind each auction field, for per-field extraction latency
+FIELD_SELECTORS = {
+    'auction_title': ".auction-title h1",
+    'auction_subtitle': ".d-md-flex.justify-content-between.flex-wrap h2",
+    'reserve_status': "#auction-jump h3 span",
+    'auction_status': ".current-bid.ended",
+    'auction_stats': "ul.stats li",
+    'auction_quick_facts': ".quick-facts dl dt",
+    'dougs_take': ".detail-section.dougs-take .detail-body p",
+    'auction_highlights': ".detail-section.detail-highlights .detail-body ul li",
+    'known_flaws': ".detail-section.detail-known_flaws .detail-body li",
+    'modifications': ".detail-section.detail-modifications .detail-body li",
+    'service_history': ".detail-section.detail-recent_service_history .detail-body li",
+    'included_items': ".detail-section.detail-other_items .detail-body li",
+    'ownership_history': ".detail-section.detail-ownership_history .detail-body p",
+    'seller_notes': ".detail-section.detail-seller_notes .detail-body li",
+    'auction_videos': ".detail-section.detail-videos .video-embed img.video-preview",
+    'bids': ".thread li.bid .bid-value",
+}
+
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """
+    Maps site URLs onto fixture files:
+        /past-auctions/?page=N      -> past_auctions_N.html
+        /auctions/<id>/<fixture>    -> <fixture>.html
+    """
+
+    def translate_path(self, path):
+        parsed = urlparse(path)
+        parts = [part for part in parsed.path.split('/') if part]
+        name = 'missing'
+        if parts[:1] == ['past-auctions']:
+            page = parse_qs(parsed.query).get('page', ['1'])[0]
+            name = f"past_auctions_{page}"
+        elif parts[:1] == ['auctions'] and len(parts) >= 3:
+            name = parts[2]
+        return os.path.join(FIXTURES_DIR, f"{name}.html")
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_fixture_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FixtureHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fixture_url(base_url:str, fixture:str) -> str:
+    return f"{base_url}/auctions/fx{AUCTION_FIXTURES.index(fixture):04d}/{fixture}"
+
+
+def read_fixture(name:str) -> str:
+    with open(os.path.join(FIXTURES_DIR, f"{name}.html")) as file:
+        return file.read()
+
+
+def timed(fn, iterations:int) -> list:
+    """Runs fn `iterations` times and returns the per-call wall times in seconds."""
+    times = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def summarize(times:list) -> dict:
+    total = sum(times)
+    return {
+        'runs': len(times),
+        'pages_per_sec': round(len(times) / total, 2) if total else None,
+        'mean_ms': round(statistics.mean(times) * 1000, 3),
+        'p95_ms': round(sorted(times)[int(0.95 * (len(times) - 1))] * 1000, 3),
+    }
+
+
+def bench_parser(iterations:int) -> dict:
+    from selectolax.lexbor import LexborHTMLParser
+    from parse_auction import parse_auction_html
+
+    results = {}
+    for fixture in AUCTION_FIXTURES:
+        html = read_fixture(fixture)
+        tree = LexborHTMLParser(html)
+        fields = {}
+        for field, selector in FIELD_SELECTORS.items():
+            times = timed(lambda: tree.css(selector), iterations)
+            fields[field] = round(statistics.mean(times) * 1_000_000, 2)
+
+        results[fixture] = summarize(timed(lambda: parse_auction_html(html, fixture), iterations))
+        results[fixture]['field_latency_us'] = fields
+    return results
+
+
+def bench_http(base_url:str, iterations:int) -> dict:
+    import http_fetch
+    import scrape_auction
+    import scrape_auction_urls
+
+    fetcher = http_fetch.HttpFetcher(pool_size=4)
+    try:
+        discovery = timed(lambda: scrape_auction_urls.discover_auction_urls(LISTING_PAGES, fetcher=fetcher), iterations)
+        results = {'discovery': summarize([t / LISTING_PAGES for t in discovery])}
+        for fixture in AUCTION_FIXTURES:
+            url = fixture_url(base_url, fixture)
+            results[fixture] = summarize(timed(lambda: scrape_auction.scrape_auction_http(fetcher, url), iterations))
+        return results
+    finally:
+        fetcher.close()
+
+
+class RoundTripCounter:
+    """Wraps driver.execute to count and time every WebDriver command (each one is a round trip)."""
+
+    def __init__(self, driver):
+        self.driver = driver
+        self.counts = defaultdict(int)
+        self.times = defaultdict(float)
+        self._execute = driver.execute
+
+        def execute(command, params=None):
+            start = time.perf_counter()
+            try:
+                return self._execute(command, params)
+            finally:
+                self.counts[command] += 1
+                self.times[command] += time.perf_counter() - start
+
+        driver.execute = execute
+
+    def reset(self):
+        self.counts.clear()
+        self.times.clear()
+
+    def snapshot(self) -> dict:
+        return {
+            'round_trips': sum(self.counts.values()),
+            'commands': {
+                command: {'count': count, 'total_ms': round(self.times[command] * 1000, 2)}
+                for command, count in sorted(self.counts.items(), key=lambda item: -item[1])
+            }
+        }
+
+
+def bench_selenium(base_url:str, iterations:int) -> dict:
+    import driver_setup
+    import scrape_auction
+    import scrape_auction_urls
+
+    # discovery starts drivers of its own, each one is counted
+    discovery_counters = []
+
+    def counted_driver():
+        driver = driver_setup.setup_driver()
+        discovery_counters.append(RoundTripCounter(driver))
+        return driver
+
+    scrape_auction_urls.setup_driver = counted_driver
+    try:
+        discovery = timed(lambda: scrape_auction_urls.discover_auction_urls(LISTING_PAGES, workers=1), 1)
+    finally:
+        scrape_auction_urls.setup_driver = driver_setup.setup_driver
+    results = {'discovery': summarize([t / LISTING_PAGES for t in discovery])}
+    results['discovery']['round_trips'] = sum(counter.snapshot()['round_trips'] for counter in discovery_counters)
+
+    driver = driver_setup.setup_driver()
+    counter = RoundTripCounter(driver)
+    try:
+        for mode in ('webdriver', 'page_source', 'js'):
+            for fixture in AUCTION_FIXTURES:
+                url = fixture_url(base_url, fixture)
+                counter.reset()
+                times = timed(lambda: scrape_auction.scrape_auction_data(driver, url, mode=mode), iterations)
+                entry = summarize(times)
+                round_trips = counter.snapshot()
+                round_trips['round_trips'] = round(round_trips['round_trips'] / iterations, 1)
+                entry.update(round_trips)
+                results[f"{mode}:{fixture}"] = entry
+    finally:
+        driver_setup.driver_teardown(driver)
+    return results
+
+
+def git_info() -> dict:
+    def git(*args):
+        try:
+            return subprocess.check_output(['git', *args], cwd=BENCHMARKS_DIR, text=True, stderr=subprocess.DEVNULL).strip()
+        except Exception:
+            return None
+    return {'commit': git('rev-parse', '--short', 'HEAD'), 'branch': git('rev-parse', '--abbrev-ref', 'HEAD')}
+
+
+def compare(current:dict, baseline:dict, threshold:float) -> list:
+    """
+    Returns a line per benchmark whose pages/sec dropped by more than `threshold` (0.1 = 10%) vs baseline.
+    """
+    regressions = []
+    for suite, benchmarks in current.items():
+        if suite == 'meta':
+            continue
+        for name, result in benchmarks.items():
+            old = baseline.get(suite, {}).get(name, {}).get('pages_per_sec')
+            new = result.get('pages_per_sec')
+            if not old or not new:
+                continue
+            change = (new - old) / old
+            line = f"{suite}/{name}: {old} -> {new} pages/sec ({change:+.1%})"
+            print(line)
+            if change < -threshold:
+                regressions.append(line)
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CarsnBids Scraper Benchmarks")
+    parser.add_argument("--iterations", type=int, default=50, help="Runs per benchmark (selenium uses a fifth of this)")
+    parser.add_argument("--selenium", action="store_true", help="Also benchmark the Selenium scrapers (needs Chrome)")
+    parser.add_argument("--output", type=str, default=None, help="Results JSON path. Defaults to benchmarks/results/<timestamp>-<commit>.json")
+    parser.add_argument("--compare", type=str, default=None, help="Earlier results JSON to compare against")
+    parser.add_argument("--threshold", type=float, default=0.1, help="Slowdown that counts as a regression. Default is 0.1 (10%%)")
+    args = parser.parse_args()
+
+    server = start_fixture_server()
+    base_url = f"http://127.0.0.1:{server.server_address[1]}"
+
+    # the scrapers read these at import
+    os.environ['CARSNBIDS_BASE_URL'] = base_url
+    os.environ.pop('HTML_ARCHIVE_DIR', None)
+    # measure the scrapers, not the politeness limit
+    os.environ['RATE_LIMIT_RPS'] = '0'
+    # the scrapers' logs go next to the results instead of the working directory
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    os.environ['LOG_FILE'] = os.path.join(RESULTS_DIR, 'logs.json')
+    sys.path.insert(0, os.path.abspath(SRC_DIR))
+
+    meta = git_info()
+    meta.update({
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'iterations': args.iterations,
+    })
+    results = {'meta': meta}
+
+    try:
+        print("Running parser benchmarks...")
+        results['parser'] = bench_parser(args.iterations)
+        print("Running HTTP benchmarks...")
+        results['http'] = bench_http(base_url, args.iterations)
+        if args.selenium:
+            print("Running Selenium benchmarks...")
+            results['selenium'] = bench_selenium(base_url, max(1, args.iterations // 5))
+    finally:
+        server.shutdown()
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{meta['timestamp'].replace(':', '')}-{meta['commit']}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as file:
+        json.dump(results, file, indent=2)
+    print(f"Results written to {os.path.abspath(output)}")
+
+    for suite, benchmarks in results.items():
+        if suite == 'meta':
+            continue
+        for name, result in benchmarks.items():
+            round_trips = f", {result['round_trips']} round trips" if 'round_trips' in result else ''
+            print(f"{suite}/{name}: {result['pages_per_sec']} pages/sec, mean {result['mean_ms']} ms{round_trips}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)
+        regressions = compare(results, baseline, args.threshold)
+        if regressions:
+            print("Regressions:\n" + "\n".join(regressions))
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
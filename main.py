@@ -1,5 +1,14 @@
+import os
+import runpy
+import sys
+
+
 def main():
-    print("Hello from carsnbids-scraper!")
+    """Runs src/cli.py, so `uv run main.py <command>` works from the repo root."""
+    src_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src')
+    sys.path.insert(0, src_dir)
+    sys.argv[0] = os.path.join(src_dir, 'cli.py')
+    runpy.run_path(sys.argv[0], run_name='__main__')
 
 
 if __name__ == "__main__":
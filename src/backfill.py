@@ -0,0 +1,492 @@
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+import driver_pool
+import driver_setup
+import http_fetch
+import notify
+import rate_limit
+import retries
+import scrape_auction_urls
+import sinks
+import sqlite_setup
+import utils
+import logger as logging_setup
+from logger import setup_json_logger
+from seen_index import auction_id
+
+load_dotenv()
+logger = setup_json_logger()
+
+db_path = os.getenv('SQLITE_DB_PATH')
+raw_auctions_bucket = os.getenv("RAW_AUCTIONS_BUCKET")
+output_sink = os.getenv('OUTPUT_SINK', 's3')
+ntfy_topic = os.getenv('NTFY_TOPIC')
+# runs a shard is claimed in before it's left 'dead' instead of going back to pending
+backfill_max_attempts = int(os.getenv('BACKFILL_MAX_ATTEMPTS', 5))
+
+
+def plan_shards(conn, cursor, last_page:int, shard_pages:int) -> int:
+    """
+    Splits listing pages 1..last_page into shards of `shard_pages` pages. Pages already covered by earlier
+    backfill runs keep their shards (and progress), so a bigger last_page only adds shards for the new pages.
+    Shards left running or failed by an earlier run go back to pending, unless they've already been attempted
+    BACKFILL_MAX_ATTEMPTS times. Those are marked 'dead' and left alone.
+
+    Returns:
+        int: The number of new shards.
+    """
+    covered = cursor.execute("SELECT COALESCE(MAX(last_page), 0) FROM backfill_shards").fetchone()[0]
+    shards = [
+        (first_page, min(first_page + shard_pages - 1, last_page), first_page)
+        for first_page in range(covered + 1, last_page + 1, shard_pages)
+    ]
+    cursor.executemany("INSERT INTO backfill_shards(first_page, last_page, next_page) VALUES(?, ?, ?)", shards)
+    # nothing is running yet, so these belong to workers that died or gave up
+    cursor.execute(
+        """
+            UPDATE backfill_shards
+            SET state = CASE WHEN attempts >= ? THEN 'dead' ELSE 'pending' END, worker_pid = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE state IN ('running', 'failed')
+        """,
+        (backfill_max_attempts,)
+    )
+    conn.commit()
+    return len(shards)
+
+
+def claim_shard(conn, cursor):
+    """
+    Atomically takes the next pending shard for this process.
+
+    Returns:
+        tuple: (shard_id, first_page, last_page, next_page), or None once every shard is taken.
+    """
+    # IMMEDIATE takes the write lock up front, so two workers can't read the same pending shard
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        shard = cursor.execute(
+            """
+                UPDATE backfill_shards
+                SET state = 'running', worker_pid = ?, attempts = attempts + 1, error = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE shard_id = (SELECT shard_id FROM backfill_shards WHERE state = 'pending' ORDER BY shard_id LIMIT 1)
+                RETURNING shard_id, first_page, last_page, next_page
+            """,
+            (os.getpid(),)
+        ).fetchone()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return shard
+
+
+def get_progress(cursor) -> dict:
+    """Aggregate progress over every shard."""
+    row = cursor.execute(
+        """
+            SELECT
+                COUNT(*),
+                COALESCE(SUM(state = 'done'), 0),
+                COALESCE(SUM(state = 'failed'), 0),
+                COALESCE(SUM(state = 'dead'), 0),
+                COALESCE(SUM(last_page - first_page + 1), 0),
+                COALESCE(SUM(CASE WHEN state = 'done' THEN last_page - first_page + 1
+                                  ELSE MIN(next_page, last_page + 1) - first_page END), 0),
+                COALESCE(SUM(auctions_scraped), 0),
+                COALESCE(SUM(auctions_failed), 0)
+            FROM backfill_shards
+        """
+    ).fetchone()
+    keys = ('shards', 'shards_done', 'shards_failed', 'shards_dead', 'pages', 'pages_done', 'auctions_scraped', 'auctions_failed')
+    return dict(zip(keys, row))
+
+
+def format_progress(progress:dict, baseline:dict=None, elapsed:float=0) -> str:
+    """
+    One line progress report. Throughput and ETA are based on what was done since `baseline` (the progress
+    when this run started), over `elapsed` seconds.
+    """
+    pages, pages_done = progress['pages'], progress['pages_done']
+    percent = round(pages_done / pages * 100, 1) if pages else 100.0
+    line = (
+        f"Backfill: {pages_done}/{pages} pages ({percent}%), "
+        f"{progress['shards_done']}/{progress['shards']} shards done ({progress['shards_dead']} dead), "
+        f"{progress['auctions_scraped']} auctions scraped, {progress['auctions_failed']} failed"
+    )
+    if baseline is not None and elapsed > 0:
+        pages_rate = (pages_done - baseline['pages_done']) / elapsed
+        auctions_rate = (progress['auctions_scraped'] - baseline['auctions_scraped']) / elapsed * 60
+        line += f", {round(auctions_rate, 1)} auctions/min"
+        if pages_rate > 0:
+            eta = timedelta(seconds=int((pages - pages_done) / pages_rate))
+            line += f", ETA {eta}"
+    return line
+
+
+class ShardWorker:
+    """
+    Scrapes shards in one process, with one driver (started only if a page needs JS) and, if FETCH_BACKEND
+    is 'http', one HTTP fetcher.
+
+    For each listing page of a shard, auctions not in the urls table (or dead-lettered) are recorded in
+    backfill_auctions, scraped and checkpointed, then the shard's next_page moves on. Once every page is done,
+    the shard's auctions are uploaded as one NDJSON object (backfill/auctions_shard_<id>.ndjson) and inserted
+    into the urls table. A shard that stops half way resumes from next_page, and the auctions it had already
+    scraped are written to the new upload from their checkpoint.
+
+    Listing pages go over HTTP if `listing_over_http` (see listing_pages_render), otherwise through the driver.
+    """
+
+    def __init__(self, worker_id:int, overlap:int=1, retries:int=2, timeout:int=60, listing_over_http:bool=False):
+        self.worker_id = worker_id
+        self.overlap = overlap
+        self.retries = retries
+        self.timeout = timeout
+        self.driver = None
+        self.fetcher = http_fetch.setup_fetcher(pool_size=1, user_agent=driver_setup.get_user_agent())
+        self.listing_fetcher = self.fetcher if listing_over_http else None
+        self.s3_client = None
+        self.conn = None
+        self.cursor = None
+
+    def close(self):
+        if self.driver is not None:
+            driver_setup.driver_teardown(self.driver)
+            self.driver = None
+        if self.fetcher is not None:
+            self.fetcher.close()
+        if self.cursor:
+            self.cursor.close()
+        if self.conn:
+            self.conn.close()
+
+    def listing_page(self, page:int) -> list:
+        """The auction urls on a listing page, retried with backoff. Raises if every attempt fails."""
+        for attempt in range(self.retries + 1):
+            try:
+                if self.listing_fetcher is None and self.driver is None:
+                    self.driver = driver_setup.setup_driver()
+                return scrape_auction_urls.scrape_listing_page(page, self.listing_fetcher, self.driver, self.timeout)
+            except Exception as e:
+                if attempt == self.retries:
+                    raise
+                logger.warning(f"Worker {self.worker_id}: listing page {page} failed (attempt {attempt + 1}): {e}. Retrying")
+                if self.driver is not None:
+                    driver_setup.driver_teardown(self.driver)
+                    self.driver = None
+                time.sleep(2 ** attempt)
+
+    def open_sink(self, shard_id:int):
+        file_name = f"auctions_shard_{shard_id:05d}.ndjson"
+        if self.cursor.execute(
+            "SELECT 1 FROM backfill_auctions WHERE shard_id = ? AND state = 'uploaded' LIMIT 1", (shard_id,)
+        ).fetchone():
+            # a retry of a shard that was already uploaded once, keep the earlier upload
+            file_name = f"auctions_shard_{shard_id:05d}_{datetime.now().strftime('%Y%m%dT%H%M%S')}.ndjson"
+        if output_sink == 's3':
+            if self.s3_client is None:
+                import boto3
+                self.s3_client = boto3.client("s3")
+            return sinks.S3NdjsonSink(self.s3_client, raw_auctions_bucket, key=f"backfill/{file_name}")
+        # the shard is written from scratch, checkpointed auctions included
+        return sinks.LocalNdjsonSink(os.path.join('spool', 'backfill'), file_name)
+
+    def record_failure(self, shard_id:int, url:str, error):
+        """
+        Counts a failed scrape against the auction, once per run. After RETRY_MAX_ATTEMPTS runs it's dead-lettered
+        and marked 'dead', so it no longer keeps its shard from finishing.
+        """
+        id = auction_id(url)
+        attempts = self.cursor.execute(
+            "UPDATE backfill_auctions SET attempts = attempts + 1, updated_at = CURRENT_TIMESTAMP WHERE auction_id = ? RETURNING attempts",
+            (id,)
+        ).fetchone()[0]
+        if attempts >= retries.retry_max_attempts:
+            retries.dead_letter(self.cursor, url, attempts, str(error) or type(error).__name__)
+            self.cursor.execute(
+                "UPDATE backfill_auctions SET state = 'dead', updated_at = CURRENT_TIMESTAMP WHERE auction_id = ?", (id,)
+            )
+        self.cursor.execute(
+            "UPDATE backfill_shards SET auctions_failed = auctions_failed + 1, updated_at = CURRENT_TIMESTAMP WHERE shard_id = ?",
+            (shard_id,)
+        )
+        self.conn.commit()
+
+    def scrape_discovered(self, shard_id:int, sink, failed:set):
+        """Scrapes the shard's discovered auctions, skipping the ones that already failed in this run."""
+        rows = self.cursor.execute(
+            "SELECT url FROM backfill_auctions WHERE shard_id = ? AND state = 'discovered' ORDER BY rowid",
+            (shard_id,)
+        ).fetchall()
+        for (url,) in rows:
+            if url in failed:
+                continue
+            try:
+                auction_data, self.driver = driver_pool.scrape_one(
+                    self.worker_id, url, self.driver, self.timeout, self.fetcher
+                )
+            except Exception as e:
+                logger.warning(f'Worker {self.worker_id}: error scraping {url}', exc_info=True)
+                failed.add(url)
+                self.driver = None
+                self.record_failure(shard_id, url, e)
+                continue
+
+            self.cursor.execute(
+                """
+                    UPDATE backfill_auctions
+                    SET state = 'scraped', payload = ?, updated_at = CURRENT_TIMESTAMP
+                    WHERE auction_id = ?
+                """,
+                (json.dumps(auction_data), auction_id(url))
+            )
+            self.cursor.execute(
+                "UPDATE backfill_shards SET auctions_scraped = auctions_scraped + 1, updated_at = CURRENT_TIMESTAMP WHERE shard_id = ?",
+                (shard_id,)
+            )
+            self.conn.commit()
+            sink.write(auction_data)
+
+    def run_shard(self, shard_id:int, first_page:int, last_page:int, next_page:int):
+        """
+        Scrapes pages next_page..last_page of a shard, plus `overlap` pages past it to catch auctions pushed over
+        the boundary by new listings, then uploads the shard.
+        """
+        logger.info(f"Worker {self.worker_id}: shard {shard_id} (pages {first_page}-{last_page}) from page {next_page}")
+        sink = self.open_sink(shard_id)
+        failed = set()
+        try:
+            # checkpoints of an earlier attempt at this shard
+            for (payload,) in self.cursor.execute(
+                "SELECT payload FROM backfill_auctions WHERE shard_id = ? AND state = 'scraped' ORDER BY rowid",
+                (shard_id,)
+            ).fetchall():
+                sink.write(json.loads(payload))
+            self.scrape_discovered(shard_id, sink, failed)
+
+            for page in range(next_page, last_page + self.overlap + 1):
+                page_urls = self.listing_page(page)
+                if not page_urls:
+                    logger.info(f"Worker {self.worker_id}: no auctions on page {page}, end of the archive")
+                    break
+                new_urls = utils.filter_urls(self.cursor, page_urls)
+                # auctions already claimed by another shard (through its overlap) stay with it, and the ones a run
+                # has already given up on aren't tried again
+                self.cursor.executemany(
+                    """
+                        INSERT INTO backfill_auctions(auction_id, shard_id, url)
+                        SELECT ?, ?, ? WHERE NOT EXISTS (SELECT 1 FROM auction_dead_letters WHERE auction_id = ?)
+                        ON CONFLICT(auction_id) DO NOTHING
+                    """,
+                    [(auction_id(url), shard_id, url, auction_id(url)) for url in new_urls]
+                )
+                self.conn.commit()
+                self.scrape_discovered(shard_id, sink, failed)
+                self.cursor.execute(
+                    "UPDATE backfill_shards SET next_page = ?, updated_at = CURRENT_TIMESTAMP WHERE shard_id = ?",
+                    (page + 1, shard_id)
+                )
+                self.conn.commit()
+
+            if not sink.close():
+                raise RuntimeError(f"Upload of shard {shard_id} failed")
+            sink = None
+
+            urls = [row[0] for row in self.cursor.execute(
+                "SELECT url FROM backfill_auctions WHERE shard_id = ? AND state = 'scraped'", (shard_id,)
+            ).fetchall()]
+            inserted = utils.insert_urls(self.cursor, urls)
+            self.cursor.execute(
+                """
+                    UPDATE backfill_auctions
+                    SET state = 'uploaded', payload = NULL, updated_at = CURRENT_TIMESTAMP
+                    WHERE shard_id = ? AND state = 'scraped'
+                """,
+                (shard_id,)
+            )
+            # auctions that failed are still 'discovered'. The shard stays failed until they're scraped or dead,
+            # so the next backfill run picks it up again and retries them
+            unscraped = self.cursor.execute(
+                "SELECT COUNT(*) FROM backfill_auctions WHERE shard_id = ? AND state = 'discovered'", (shard_id,)
+            ).fetchone()[0]
+            if unscraped:
+                self.cursor.execute(
+                    """
+                        UPDATE backfill_shards SET state = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP
+                        WHERE shard_id = ?
+                    """,
+                    (f"{unscraped} auctions failed to scrape", shard_id)
+                )
+            else:
+                self.cursor.execute(
+                    "UPDATE backfill_shards SET state = 'done', updated_at = CURRENT_TIMESTAMP WHERE shard_id = ?",
+                    (shard_id,)
+                )
+            self.conn.commit()
+            logger.info(
+                f"Worker {self.worker_id}: shard {shard_id} {'failed' if unscraped else 'done'}, "
+                f"{inserted} urls inserted, {unscraped} auctions left to retry"
+            )
+        finally:
+            if sink is not None:
+                sink.abort()
+
+    def run(self):
+        """Claims and scrapes shards until none are left."""
+        self.conn, self.cursor = utils.db_connection(db_path)
+        shards = 0
+        while (shard := claim_shard(self.conn, self.cursor)) is not None:
+            shard_id = shard[0]
+            try:
+                self.run_shard(*shard)
+                shards += 1
+            except Exception as e:
+                logger.error(f"Worker {self.worker_id}: shard {shard_id} failed: {e}", exc_info=True)
+                self.conn.rollback()
+                self.cursor.execute(
+                    "UPDATE backfill_shards SET state = 'failed', error = ?, updated_at = CURRENT_TIMESTAMP WHERE shard_id = ?",
+                    (str(e), shard_id)
+                )
+                self.conn.commit()
+        return shards
+
+
+def _run_worker(worker_id:int, overlap:int, processes:int=1, listing_over_http:bool=False) -> int:
+    """Process entry point: scrapes shards until none are left. Returns the number of shards completed."""
+    # one log file per process, rotation isn't safe with several processes writing to the same file
+    base, extension = os.path.splitext(logging_setup.default_log_file)
+    setup_json_logger(f"{base}.worker{worker_id}{extension}", force=True)
+    # every process has its own limiter, together they stay within RATE_LIMIT_*
+    rate_limit.limiter.share(processes)
+    worker = ShardWorker(worker_id, overlap=overlap, listing_over_http=listing_over_http)
+    try:
+        return worker.run()
+    finally:
+        worker.close()
+        logger.info(f"Worker {worker_id}: {rate_limit.summary()}")
+
+
+def listing_pages_render() -> bool:
+    """
+    Checks once, before the workers start, whether listing pages can be read over HTTP: FETCH_BACKEND is 'http'
+    and page 1 renders its auctions without JS.
+    """
+    fetcher = http_fetch.setup_fetcher(pool_size=1, user_agent=driver_setup.get_user_agent())
+    if fetcher is None:
+        return False
+    try:
+        return http_fetch.has_content(fetcher.get(scrape_auction_urls.listing_page_url(1)), ".auction-item")
+    finally:
+        fetcher.close()
+
+
+def find_last_page(listing_page) -> int:
+    """
+    Finds the last past-auctions page by doubling the page number until a page is empty, then bisecting.
+
+    Args:
+        listing_page (callable): listing_page(page) -> the page's auction urls.
+    """
+    if not listing_page(1):
+        return 0
+    low, high = 1, 2
+    while listing_page(high):
+        low, high = high, high * 2
+    # low has auctions, high doesn't
+    while high - low > 1:
+        middle = (low + high) // 2
+        if listing_page(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+
+def run_backfill(processes:int=4, pages:int=None, shard_pages:int=25, overlap:int=1, interval:int=30):
+    """
+    Scrapes the whole past-auctions archive with `processes` worker processes, each with its own driver.
+
+    The listing pages are split into shards of `shard_pages` pages, and progress is recorded per shard (and per
+    auction) in the tracking db, so the backfill can be stopped at any time and picks up where it left off when
+    run again. Auctions already in the urls table are skipped. Aggregate throughput and an ETA are logged
+    every `interval` seconds.
+
+    Args:
+        processes (int): Number of worker processes.
+        pages (int): Number of listing pages to cover. Found by probing the site if not given.
+        shard_pages (int): Listing pages per shard.
+        overlap (int): Pages each shard reads past its last page, for auctions pushed across shard
+            boundaries by new listings while the backfill runs.
+        interval (int): Seconds between progress reports.
+    """
+    sqlite_setup.init_db(db_path)
+    conn, cursor = utils.db_connection(db_path)
+    try:
+        listing_over_http = listing_pages_render()
+        logger.info(f"Listing pages {'render without JS, reading them over HTTP' if listing_over_http else 'go through Selenium'}")
+        if not pages:
+            logger.info("Looking for the last listing page")
+            probe = ShardWorker(0, listing_over_http=listing_over_http)
+            try:
+                pages = find_last_page(probe.listing_page)
+            finally:
+                probe.close()
+            logger.info(f"Found {pages} listing pages")
+        new_shards = plan_shards(conn, cursor, pages, shard_pages)
+        baseline = get_progress(cursor)
+        logger.info(f"{new_shards} new shards. {format_progress(baseline)}")
+        print(format_progress(baseline))
+
+        start_time = time.time()
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=processes, mp_context=context) as executor:
+            futures = [
+                executor.submit(_run_worker, worker_id, overlap, processes, listing_over_http)
+                for worker_id in range(1, processes + 1)
+            ]
+            pending = futures
+            while pending:
+                _, pending = wait(pending, timeout=interval)
+                line = format_progress(get_progress(cursor), baseline, time.time() - start_time)
+                logger.info(line)
+                print(line)
+
+        for worker_id, future in enumerate(futures, 1):
+            try:
+                future.result()
+            except Exception as e:
+                logger.error(f"Backfill worker {worker_id} crashed: {e}", exc_info=True)
+
+        progress = get_progress(cursor)
+        summary = format_progress(progress, baseline, time.time() - start_time)
+        if progress['shards_failed']:
+            summary += f"\n{progress['shards_failed']} shards failed. Run the backfill again to retry them"
+        if progress['shards_dead']:
+            summary += (
+                f"\n{progress['shards_dead']} shards failed {backfill_max_attempts} times and won't be retried, "
+                f"see the error column of backfill_shards"
+            )
+        logger.info(summary)
+        if ntfy_topic:
+            notify.send_notification(ntfy_topic, f"Backfill finished.\n{summary}")
+        return progress
+    finally:
+        cursor.close()
+        conn.close()
+
+
+if __name__ == "__main__":
+    # kept so `python backfill.py ...` still works, cli.py is the entry point
+    import sys
+    import cli
+
+    cli.main(['backfill'] + sys.argv[1:])
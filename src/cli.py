@@ -0,0 +1,163 @@
+"""
+Single entry point for the scraper and its utilities:
+
+    uv run cli.py scrape [--workers N] [--max-pages N] [--resume] [--pipeline]
+    uv run cli.py backfill [--processes N] [--pages N] [--status] ...
+    uv run cli.py export_urls [--file auction_urls.csv]
+    uv run cli.py import_urls [--file auction_urls.csv]
+    uv run cli.py stage {discover,scrape,publish,status} ...
+    uv run cli.py reparse [--file reparsed_auctions.ndjson] [--since YYYY-MM-DD] [--workers N]
+    uv run cli.py init_db
+    uv run cli.py driver {resolve,warm} [--port 9222]
+
+Only the standard library is imported up front. Each command imports what it needs when it runs, so the
+utility commands don't pay for Selenium, boto3, pandas or pyarrow, and `--help` returns immediately.
+"""
+import argparse
+import os
+import sys
+
+
+def scrape(args):
+    import main
+    main.run_scraper(workers=args.workers, max_pages=args.max_pages, resume=args.resume, use_pipeline=args.pipeline)
+
+
+def backfill(args):
+    import backfill
+    if args.status:
+        import utils
+        conn, cursor = utils.db_connection(backfill.db_path)
+        print(backfill.format_progress(backfill.get_progress(cursor)))
+        conn.close()
+    else:
+        backfill.run_backfill(processes=args.processes, pages=args.pages, shard_pages=args.shard_pages,
+                              overlap=args.overlap, interval=args.interval)
+
+
+def stage(args):
+    import stages
+    if args.action == 'discover':
+        batch_ids = stages.run_discover(max_pages=args.max_pages, batch_size=args.batch_size)
+        print(f"{len(batch_ids)} new url batches")
+    elif args.action == 'scrape':
+        claimed = stages.run_scrape(workers=args.workers, max_batches=args.max_batches)
+        print(f"{claimed} url batches claimed")
+    elif args.action == 'publish':
+        published = stages.run_publish(max_batches=args.max_batches)
+        print(f"{published} auctions published")
+    elif args.action == 'status':
+        import sqlite_setup
+        import utils
+        sqlite_setup.init_db(stages.db_path)
+        conn, cursor = utils.db_connection(stages.db_path)
+        print(stages.format_status(stages.get_status(cursor)))
+        conn.close()
+
+
+def export_urls(args):
+    import sqlite_setup
+    import utils
+    sqlite_setup.init_db(sqlite_setup.db_path)
+    utils.export_db_urls_to_csv(file_path=args.file)
+
+
+def import_urls(args):
+    import sqlite_setup
+    import utils
+    sqlite_setup.init_db(sqlite_setup.db_path)
+    utils.import_urls_from_csv(file_path=args.file)
+
+
+def reparse(args):
+    import html_archive
+    import sinks
+
+    # overwrites the file, like export_urls
+    sink = sinks.LocalNdjsonSink(os.path.dirname(os.path.abspath(args.file)), os.path.basename(args.file))
+    reparsed = html_archive.reparse(sink, since=args.since, workers=args.workers)
+    sink.close()
+    print(f"{reparsed} auctions reparsed into {os.path.abspath(args.file)}")
+
+
+def init_db(args):
+    import sqlite_setup
+    sqlite_setup.init_db(sqlite_setup.db_path)
+
+
+def driver(args):
+    import driver_setup
+    if args.action == 'warm':
+        driver_setup.start_warm_browser(args.port)
+    elif args.action == 'resolve':
+        print(driver_setup.resolve_chromedriver())
+        print(driver_setup.get_user_agent())
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="CarsnBids Scraper")
+    subparsers = parser.add_subparsers(dest='command', required=True, help="What you want to do")
+
+    scrape_parser = subparsers.add_parser('scrape', help="Run the daily scraper")
+    scrape_parser.add_argument("--workers", type=int, default=None, help="Number of concurrent webdrivers for auction scraping. Defaults to SCRAPER_WORKERS or 1")
+    scrape_parser.add_argument("--max-pages", type=int, default=None, help="Maximum number of listing pages to scrape. Defaults to MAX_PAGES_TO_SCRAPE or 1")
+    scrape_parser.add_argument("--resume", action="store_true", help="Skip discovery and finish the auctions left in auction_staging by a failed run")
+    scrape_parser.add_argument("--pipeline", action="store_true", default=None, help="Overlap discovery, scraping and upload. Defaults to PIPELINE_MODE")
+    scrape_parser.set_defaults(handler=scrape)
+
+    backfill_parser = subparsers.add_parser('backfill', help="Scrape the whole archive across several processes")
+    backfill_parser.add_argument("--processes", type=int, default=4, help="Number of worker processes, each with its own driver. Default is 4")
+    backfill_parser.add_argument("--pages", type=int, default=None, help="Number of listing pages to backfill. Found by probing the site if not given")
+    backfill_parser.add_argument("--shard-pages", type=int, default=25, help="Listing pages per shard. Default is 25")
+    backfill_parser.add_argument("--overlap", type=int, default=1, help="Pages each shard reads past its range. Default is 1")
+    backfill_parser.add_argument("--interval", type=int, default=30, help="Seconds between progress reports. Default is 30")
+    backfill_parser.add_argument("--status", action="store_true", help="Print the backfill progress and exit")
+    backfill_parser.set_defaults(handler=backfill)
+
+    stage_parser = subparsers.add_parser('stage', help="Run one stage of the pipeline on its own")
+    stage_subparsers = stage_parser.add_subparsers(dest='action', required=True, help="Which stage")
+    discover_parser = stage_subparsers.add_parser('discover', help="Find new auctions and split them into url batches")
+    discover_parser.add_argument("--max-pages", type=int, default=None, help="Maximum number of listing pages to scrape. Defaults to MAX_PAGES_TO_SCRAPE or 1")
+    discover_parser.add_argument("--batch-size", type=int, default=None, help="Auctions per url batch. Defaults to STAGE_BATCH_SIZE or 50")
+    stage_scrape_parser = stage_subparsers.add_parser('scrape', help="Claim url batches and scrape their auctions")
+    stage_scrape_parser.add_argument("--workers", type=int, default=None, help="Number of concurrent webdrivers. Defaults to SCRAPER_WORKERS or 1")
+    stage_scrape_parser.add_argument("--max-batches", type=int, default=None, help="Stop after this many batches. Default is every batch ready to scrape")
+    publish_parser = stage_subparsers.add_parser('publish', help="Upload the scraped batches and record their urls")
+    publish_parser.add_argument("--max-batches", type=int, default=None, help="Publish at most this many batches. Default is every scraped batch")
+    stage_subparsers.add_parser('status', help="Print the number of batches in each state")
+    stage_parser.set_defaults(handler=stage)
+
+    export_parser = subparsers.add_parser('export_urls', help="Export auction urls from DB to csv file")
+    export_parser.add_argument("--file", type=str, default='auction_urls.csv', help="CSV file path to export to")
+    export_parser.set_defaults(handler=export_urls)
+
+    import_parser = subparsers.add_parser('import_urls', help='Import auction urls from CSV to DB')
+    import_parser.add_argument("--file", type=str, default='auction_urls.csv', help="CSV file path to import from")
+    import_parser.set_defaults(handler=import_urls)
+
+    reparse_parser = subparsers.add_parser('reparse', help='Re-run the auction parser over the HTML archive')
+    reparse_parser.add_argument("--file", type=str, default='reparsed_auctions.ndjson', help="NDJSON file to write the reparsed auctions to")
+    reparse_parser.add_argument("--since", type=str, default=None, help="Only reparse pages fetched on or after this date (YYYY-MM-DD)")
+    reparse_parser.add_argument("--workers", type=int, default=None, help="Number of parser processes. Defaults to the number of cores")
+    reparse_parser.set_defaults(handler=reparse)
+
+    init_parser = subparsers.add_parser('init_db', help="Create the SQLite tables")
+    init_parser.set_defaults(handler=init_db)
+
+    driver_parser = subparsers.add_parser('driver', help="Webdriver tools")
+    driver_subparsers = driver_parser.add_subparsers(dest='action', required=True, help="What action you want to do")
+    warm_parser = driver_subparsers.add_parser('warm', help="Start a long-lived headless Chrome for runs to attach to")
+    warm_parser.add_argument("--port", type=int, default=9222, help="Remote debugging port")
+    driver_subparsers.add_parser('resolve', help="Resolve and cache chromedriver and the user agent")
+    driver_parser.set_defaults(handler=driver)
+
+    return parser
+
+
+def main(argv:list=None):
+    args = build_parser().parse_args(argv)
+    args.handler(args)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,180 @@
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import driver_setup
+import metrics
+import scrape_auction
+from logger import setup_json_logger
+
+logger = setup_json_logger()
+
+
+def _teardown(worker_id:int, driver):
+    try:
+        driver_setup.driver_teardown(driver)
+    except Exception:
+        logger.warning(f"Worker {worker_id}: error closing webdriver", exc_info=True)
+
+
+def scrape_one(worker_id:int, url:str, driver=None, timeout:int=60, fetcher=None):
+    """
+    Scrapes one auction. With a fetcher, the url is tried over plain HTTP first and `driver` is only used
+    (and started, if it's None) for pages that need JS.
+
+    If scraping fails the driver is torn down before the exception propagates, so the caller should carry
+    on with None and a fresh driver is started for its next url.
+
+    Returns:
+        tuple: (auction_data, driver) where driver is the one to reuse for the next url.
+    """
+    url_start = time.time()
+    try:
+        auction_data = None
+        if fetcher is not None:
+            auction_data = scrape_auction.scrape_auction_http(fetcher, url)
+            if auction_data is None:
+                metrics.inc('http_fallbacks_total')
+
+        if auction_data is None:
+            if driver is None:
+                logger.info(f"Worker {worker_id}: setting up webdriver")
+                driver = driver_setup.setup_driver()
+            auction_data = scrape_auction.scrape_auction_data(driver, url, timeout)
+            driver_setup.record_network_stats(driver)
+            # a page that never rendered comes back empty, which is a failure worth retrying, not an auction
+            if not auction_data.get('auction_title'):
+                raise RuntimeError(f"{url} didn't render (no auction title)")
+    except Exception:
+        metrics.inc('auctions_failed_total')
+        if driver is not None:
+            metrics.inc('driver_restarts_total')
+            _teardown(worker_id, driver)
+        raise
+
+    elapsed = time.time() - url_start
+    logger.info(f"Worker {worker_id}: auction scraping completed in {elapsed} seconds")
+    metrics.observe('auction_scrape_seconds', elapsed)
+    metrics.inc('auctions_scraped_total')
+    return auction_data, driver
+
+
+def _scrape_worker(worker_id:int, tasks:queue.Queue, results:list, timeout:int, fetcher=None, on_result=None,
+                   on_error=None) -> dict:
+    """
+    Pulls (index, url) pairs off the shared queue and scrapes them with a driver owned by this worker.
+
+    With a fetcher, each url is tried over plain HTTP first and the driver is only started
+    for pages that need JS.
+
+    With on_result, each auction is handed to the callback as soon as it's scraped and results only
+    records True for it, so finished auctions aren't kept in memory.
+
+    A failing url is recorded as None in results (and handed to on_error) and does not stop the worker.
+    If the failure leaves the driver unusable, it is torn down and a fresh one is started for the next url.
+
+    Returns:
+        dict: Per-worker stats (scraped, failed, elapsed seconds, auctions per minute).
+    """
+    stats = {'worker': worker_id, 'scraped': 0, 'failed': 0, 'elapsed': 0.0, 'auctions_per_min': 0.0}
+    driver = None
+    start_time = time.time()
+
+    try:
+        while True:
+            try:
+                index, url = tasks.get_nowait()
+            except queue.Empty:
+                break
+
+            logger.info(f'Worker {worker_id}: scraping url: {url}')
+            try:
+                auction_data, driver = scrape_one(worker_id, url, driver, timeout, fetcher)
+            except Exception as e:
+                logger.warning(f'Worker {worker_id}: error scraping {url}', exc_info=True)
+                stats['failed'] += 1
+                driver = None
+                if on_error is not None:
+                    try:
+                        on_error(url, e)
+                    except Exception:
+                        logger.warning(f'Worker {worker_id}: error recording failure of {url}', exc_info=True)
+                continue
+
+            try:
+                if on_result is not None:
+                    on_result(url, auction_data)
+                    results[index] = True
+                else:
+                    results[index] = auction_data
+                stats['scraped'] += 1
+            except Exception:
+                logger.warning(f'Worker {worker_id}: error handling result for {url}', exc_info=True)
+                stats['failed'] += 1
+    finally:
+        if driver is not None:
+            driver_setup.driver_teardown(driver)
+
+    stats['elapsed'] = round(time.time() - start_time, 2)
+    if stats['elapsed']:
+        stats['auctions_per_min'] = round(stats['scraped'] / stats['elapsed'] * 60, 2)
+    return stats
+
+
+def scrape_auctions(urls:list, workers:int=1, timeout:int=60, fetcher=None, on_result=None, on_error=None):
+    """
+    Scrapes auction details for urls across a pool of headless Chrome drivers.
+
+    Each worker thread owns one WebDriver instance and pulls urls from a shared queue, so slow
+    auctions don't hold up the others. Failures are isolated per url and per worker.
+
+    Args:
+        urls (list): Auction urls to scrape.
+        workers (int): Number of concurrent drivers. Capped at the number of urls.
+        timeout (int): Timeout passed to scrape_auction.scrape_auction_data.
+        fetcher (http_fetch.HttpFetcher): Optional HTTP backend tried before Selenium.
+        on_result (callable): Optional on_result(url, auction_data), called from the worker thread as
+            soon as each auction is scraped. Must be thread safe.
+        on_error (callable): Optional on_error(url, exception), called from the worker thread when a url
+            fails. Must be thread safe.
+
+    Returns:
+        tuple: (results, worker_stats) where results is a list aligned with urls holding the
+            auction dict (True if on_result was given), or None for urls that failed, and
+            worker_stats is a list of per-worker dicts.
+    """
+    if not urls:
+        return [], []
+
+    workers = max(1, min(int(workers), len(urls)))
+    logger.info(f"Scraping {len(urls)} auctions with {workers} worker(s)")
+
+    tasks = queue.Queue()
+    for index, url in enumerate(urls):
+        tasks.put((index, url))
+    results = [None] * len(urls)
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='scraper') as executor:
+        futures = [
+            executor.submit(_scrape_worker, worker_id, tasks, results, timeout, fetcher, on_result, on_error)
+            for worker_id in range(1, workers + 1)
+        ]
+
+    worker_stats = []
+    for future in futures:
+        try:
+            worker_stats.append(future.result())
+        except Exception as e:
+            logger.error(f"Scraper worker crashed: {e}", exc_info=True)
+
+    return results, worker_stats
+
+
+def format_worker_stats(worker_stats:list) -> str:
+    """Formats per-worker throughput as one line per worker for logs and notifications."""
+    return "\n".join(
+        f"Worker {s['worker']}: {s['scraped']} scraped, {s['failed']} failed, "
+        f"{s['elapsed']}s, {s['auctions_per_min']} auctions/min"
+        for s in worker_stats
+    )
@@ -1,36 +1,335 @@
 from selenium import webdriver
 from selenium.webdriver.chrome.service import Service as ChromeService
-from webdriver_manager.chrome import ChromeDriverManager
 from selenium.webdriver.chrome.options import Options 
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
 from selenium.common.exceptions import TimeoutException
-from fake_useragent import UserAgent
+from dotenv import load_dotenv
+import subprocess
+import threading
+import shutil
+import json
 import time
+import os
 
 
 from logger import setup_json_logger
+import metrics
+import rate_limit
+load_dotenv()
 logger = setup_json_logger()
-ua = UserAgent()
 
+# roughly when the process started, for the cold-start-to-first-page measurement
+_started_at = time.time()
+
+# driver binary and user agent resolution is cached here between runs
+driver_cache_dir = os.path.expanduser(os.getenv('DRIVER_CACHE_DIR', '~/.cache/carsnbids'))
+driver_cache_ttl = float(os.getenv('DRIVER_CACHE_TTL_HOURS', 24 * 7)) * 3600
+chromedriver_path = os.getenv('CHROMEDRIVER_PATH')        # use this binary, skip resolution entirely
+chromedriver_version = os.getenv('CHROMEDRIVER_VERSION')  # pin the version webdriver-manager resolves
+# host:port of a warm Chrome started with `python driver_setup.py warm`
+chrome_debugger_address = os.getenv('CHROME_DEBUGGER_ADDRESS')
+
+# ceiling (seconds) for waits on DOM changes after a click
+wait_ceiling = float(os.getenv('WAIT_CEILING', 10))
+
+# lean mode blocks resources the scrapers never read
+lean_driver = os.getenv('LEAN_DRIVER', '').lower() in ('1', 'true', 'yes')
+
+BLOCKED_URL_PATTERNS = [
+    # images, fonts and media
+    "*.jpg", "*.jpeg", "*.png", "*.gif", "*.webp", "*.avif", "*.svg", "*.ico",
+    "*.woff", "*.woff2", "*.ttf", "*.otf", "*.eot",
+    "*.mp4", "*.webm", "*.m3u8", "*.mp3",
+    # third party embeds, analytics and ads
+    "*youtube.com/embed*", "*ytimg.com*", "*vimeo.com*",
+    "*google-analytics.com*", "*googletagmanager.com*", "*doubleclick.net*", "*googlesyndication.com*",
+    "*facebook.net*", "*facebook.com/tr*", "*hotjar.com*", "*segment.io*", "*segment.com*",
+    "*intercom.io*", "*intercomcdn.com*", "*sentry.io*", "*clarity.ms*", "*tiktok.com*", "*twitter.com*",
+]
+
+# network totals across every lean driver in this run
+network_stats = {'requests': 0, 'blocked': 0, 'bytes_downloaded': 0}
+_network_stats_lock = threading.Lock()
+
+# startup timings of this run (seconds)
+startup_stats = {'chromedriver_resolve': None, 'driver_start': None, 'first_page': None}
+
+_resolve_lock = threading.Lock()
+_resolved_driver_path = None
+_user_agent = None
+
+
+def _cache_file() -> str:
+    return os.path.join(driver_cache_dir, 'driver_cache.json')
+
+
+def _read_cache() -> dict:
+    try:
+        with open(_cache_file()) as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+
+def _write_cache(**values):
+    cache = _read_cache()
+    cache.update(values)
+    try:
+        os.makedirs(driver_cache_dir, exist_ok=True)
+        with open(_cache_file(), 'w') as file:
+            json.dump(cache, file)
+    except OSError as e:
+        logger.warning(f"Error writing driver cache: {e}")
+
+
+def resolve_chromedriver():
+    """
+    Returns the chromedriver path, resolving it at most once per process.
+
+    Order: CHROMEDRIVER_PATH, then a cached resolution that is younger than DRIVER_CACHE_TTL_HOURS and matches
+    CHROMEDRIVER_VERSION, then webdriver-manager. If webdriver-manager fails (e.g. offline), any cached binary
+    is used, however old. Returns None if nothing works, in which case Selenium Manager resolves the driver.
+    """
+    global _resolved_driver_path
+    with _resolve_lock:
+        if _resolved_driver_path:
+            return _resolved_driver_path
+
+        start_time = time.time()
+        if chromedriver_path:
+            _resolved_driver_path = chromedriver_path
+        else:
+            cache = _read_cache()
+            cached_path = cache.get('chromedriver_path')
+            cached_usable = bool(cached_path) and os.path.exists(cached_path)
+            fresh = (
+                cached_usable
+                and time.time() - cache.get('chromedriver_resolved_at', 0) < driver_cache_ttl
+                and cache.get('chromedriver_version') == chromedriver_version
+            )
+
+            if fresh:
+                _resolved_driver_path = cached_path
+            else:
+                try:
+                    from webdriver_manager.chrome import ChromeDriverManager
+                    _resolved_driver_path = ChromeDriverManager(driver_version=chromedriver_version).install()
+                    _write_cache(
+                        chromedriver_path=_resolved_driver_path,
+                        chromedriver_version=chromedriver_version,
+                        chromedriver_resolved_at=time.time()
+                    )
+                except Exception as e:
+                    if cached_usable:
+                        logger.warning(f"Error resolving chromedriver ({e}). Using cached {cached_path}")
+                        _resolved_driver_path = cached_path
+                    else:
+                        logger.warning(f"Error resolving chromedriver ({e}). Falling back to Selenium Manager")
+
+        startup_stats['chromedriver_resolve'] = round(time.time() - start_time, 3)
+        metrics.run_metrics.set('chromedriver_resolve_seconds', startup_stats['chromedriver_resolve'])
+        logger.info(f"Chromedriver resolved to {_resolved_driver_path} in {startup_stats['chromedriver_resolve']} seconds")
+        return _resolved_driver_path
+
+
+def get_user_agent() -> str:
+    """
+    Returns a desktop Chrome user agent string. fake_useragent is only loaded when the on-disk copy
+    is older than DRIVER_CACHE_TTL_HOURS.
+    """
+    global _user_agent
+    if _user_agent:
+        return _user_agent
+
+    cache = _read_cache()
+    if cache.get('user_agent') and time.time() - cache.get('user_agent_resolved_at', 0) < driver_cache_ttl:
+        _user_agent = cache['user_agent']
+        return _user_agent
+
+    try:
+        from fake_useragent import UserAgent
+        _user_agent = UserAgent(browsers=['Chrome'], platforms=['desktop']).random
+        _write_cache(user_agent=_user_agent, user_agent_resolved_at=time.time())
+    except Exception as e:
+        logger.warning(f"Error generating user agent: {e}")
+        _user_agent = cache.get('user_agent') or (
+            "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) "
+            "Chrome/137.0.0.0 Safari/537.36"
+        )
+    return _user_agent
+
+
+def setup_driver(lean:bool=None):
+    """
+    Starts headless Chrome, or attaches a new tab of the warm browser at CHROME_DEBUGGER_ADDRESS.
+
+    Args:
+        lean (bool): Block images, fonts, media and third party trackers, and return from driver.get() once
+            the DOM is ready instead of waiting for every resource. Defaults to the LEAN_DRIVER env variable.
+    """
+    lean = lean_driver if lean is None else lean
+    start_time = time.time()
 
-def setup_driver():
     options = Options()
-    options.add_argument("--headless=new") 
-    options.add_argument("--disable-gpu")
-    options.add_argument("--no-sandbox")
-    options.add_argument("--disable-dev-shm-usage")
-    options.add_argument("--window-size=1920,1080")
-    options.add_argument(f"user-agent={ua}")
+    if chrome_debugger_address:
+        # the warm browser already has its flags; only the debugger address applies
+        options.debugger_address = chrome_debugger_address
+    else:
+        options.add_argument("--headless=new") 
+        options.add_argument("--disable-gpu")
+        options.add_argument("--no-sandbox")
+        options.add_argument("--disable-dev-shm-usage")
+        options.add_argument("--window-size=1920,1080")
+        options.add_argument(f"user-agent={get_user_agent()}")
+
+    if lean:
+        options.page_load_strategy = 'eager'
+        # network events are read back from the performance log to count what was saved
+        options.set_capability("goog:loggingPrefs", {"performance": "ALL"})
+        if not chrome_debugger_address:
+            options.add_experimental_option("prefs", {
+                "profile.managed_default_content_settings.images": 2,
+                "profile.managed_default_content_settings.media_stream": 2,
+            })
+            options.add_argument("--blink-settings=imagesEnabled=false")
+            options.add_argument("--mute-audio")
 
+    driver_path = resolve_chromedriver()
+    service = ChromeService(driver_path) if driver_path else ChromeService()
     driver = webdriver.Chrome(
-        service=ChromeService(ChromeDriverManager().install()),
+        service=service,
         options=options
         )
+
+    driver.lean = lean
+    driver.attached = bool(chrome_debugger_address)
+    if driver.attached:
+        # every driver gets its own tab so pool workers don't navigate each other
+        driver.switch_to.new_window('tab')
+    if lean:
+        driver.execute_cdp_cmd("Network.enable", {})
+        driver.execute_cdp_cmd("Network.setBlockedURLs", {"urls": BLOCKED_URL_PATTERNS})
+
+    driver_start = round(time.time() - start_time, 3)
+    if startup_stats['driver_start'] is None:
+        startup_stats['driver_start'] = driver_start
+    # every driver, so restarts and pool workers show up too
+    metrics.observe('driver_setup_seconds', driver_start)
+    logger.info(f"Webdriver ready in {driver_start} seconds{' (attached to warm browser)' if driver.attached else ''}")
     return driver
 
 
+def record_first_page():
+    """Records the time from process start to the first page being ready, once per run."""
+    if startup_stats['first_page'] is None:
+        startup_stats['first_page'] = round(time.time() - _started_at, 3)
+        metrics.run_metrics.set('first_page_seconds', startup_stats['first_page'])
+        logger.info(f"Cold start to first page: {startup_stats['first_page']} seconds")
+
+
+def startup_summary() -> str:
+    """One line summary of startup_stats for logs and notifications."""
+    return (
+        f"Startup: chromedriver resolved in {startup_stats['chromedriver_resolve']}s, "
+        f"driver started in {startup_stats['driver_start']}s, first page after {startup_stats['first_page']}s"
+    )
+
+
+def start_warm_browser(port:int=9222, user_data_dir:str=None):
+    """
+    Launches a detached headless Chrome with remote debugging on `port`, for later runs to attach to
+    with CHROME_DEBUGGER_ADDRESS=127.0.0.1:<port>.
+    """
+    chrome_binary = os.getenv('CHROME_BINARY') or next(
+        (path for path in map(shutil.which, ('google-chrome', 'google-chrome-stable', 'chromium', 'chromium-browser')) if path),
+        None
+    )
+    if not chrome_binary:
+        raise FileNotFoundError("Chrome binary not found. Set CHROME_BINARY")
+
+    user_data_dir = user_data_dir or os.path.join(driver_cache_dir, 'warm-profile')
+    args = [
+        chrome_binary,
+        "--headless=new",
+        "--disable-gpu",
+        "--no-sandbox",
+        "--disable-dev-shm-usage",
+        "--window-size=1920,1080",
+        f"--user-agent={get_user_agent()}",
+        f"--remote-debugging-port={port}",
+        f"--user-data-dir={user_data_dir}",
+    ]
+    process = subprocess.Popen(args, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    logger.info(f"Warm browser started (pid {process.pid}) on port {port}")
+    print(f"Warm browser started (pid {process.pid}). Set CHROME_DEBUGGER_ADDRESS=127.0.0.1:{port} to attach")
+    return process
+
+
+def record_network_stats(driver):
+    """
+    Drains a lean driver's performance log and adds its requests, blocked requests and downloaded bytes
+    to network_stats. Does nothing for regular drivers.
+    """
+    if not getattr(driver, 'lean', False):
+        return
+
+    requests_sent = blocked = bytes_downloaded = 0
+    try:
+        for entry in driver.get_log("performance"):
+            message = json.loads(entry["message"])["message"]
+            method = message.get("method")
+            if method == "Network.requestWillBeSent":
+                requests_sent += 1
+            elif method == "Network.loadingFailed" and message["params"].get("blockedReason"):
+                blocked += 1
+            elif method == "Network.loadingFinished":
+                bytes_downloaded += message["params"].get("encodedDataLength", 0)
+    except Exception as e:
+        logger.warning(f"Error reading network stats: {e}")
+        return
+
+    with _network_stats_lock:
+        network_stats['requests'] += requests_sent
+        network_stats['blocked'] += blocked
+        network_stats['bytes_downloaded'] += bytes_downloaded
+
+
+def network_summary() -> str:
+    """One line summary of network_stats for logs and notifications."""
+    with _network_stats_lock:
+        stats = dict(network_stats)
+    if not stats['requests']:
+        return ''
+    return (
+        f"Lean driver: {stats['blocked']} of {stats['requests']} requests blocked, "
+        f"{round(stats['bytes_downloaded'] / 1024 / 1024, 2)} MB downloaded"
+    )
+
+
+def load_page(driver, url:str):
+    """
+    driver.get(url) through the shared rate limiter. A page load timeout or a challenge page slows the limiter
+    down and raises, a normal load speeds it up.
+
+    Raises:
+        TimeoutException: if the page load timed out.
+        RuntimeError: if the site answered with a challenge page.
+    """
+    rate_limit.acquire()
+    start = time.monotonic()
+    try:
+        driver.get(url)
+    except TimeoutException:
+        rate_limit.record_throttle(f"page load timeout for {url}")
+        raise
+    if rate_limit.is_challenge_title(driver.title):
+        rate_limit.record_throttle(f"challenge page for {url}")
+        raise RuntimeError(f"Got a challenge page instead of {url}")
+    rate_limit.record_response(time.monotonic() - start)
+
+
 def close_promo_bar(driver, timeout=10):
     try:
         # Wait for the close button to be present AND clickable
@@ -45,6 +344,54 @@ def close_promo_bar(driver, timeout=10):
         logger.error(f"Error closing promo bar: {e}")
 
 
+def wait_for_count_to_settle(driver, css_selector:str, timeout:float=None, settle:float=0.5, poll:float=0.1, min_wait:float=2):
+    """
+    Waits until the number of elements matching css_selector stops changing.
+
+    Returns as soon as the count has been non-zero and unchanged for `settle` seconds. A count that
+    stays at zero is accepted after `min_wait` seconds, and nothing waits longer than `timeout`.
+
+    Returns:
+        tuple: (element count, seconds spent waiting)
+    """
+    timeout = wait_ceiling if timeout is None else timeout
+    start_time = time.monotonic()
+    count = len(driver.find_elements(By.CSS_SELECTOR, css_selector))
+    last_change = start_time
+
+    while True:
+        now = time.monotonic()
+        waited = now - start_time
+        if waited >= timeout:
+            logger.warning(f"'{css_selector}' count still changing after {timeout}s ceiling")
+            break
+        if now - last_change >= settle and (count or waited >= min_wait):
+            break
+
+        time.sleep(poll)
+        new_count = len(driver.find_elements(By.CSS_SELECTOR, css_selector))
+        if new_count != count:
+            count = new_count
+            last_change = time.monotonic()
+
+    return count, round(time.monotonic() - start_time, 2)
+
+
 def driver_teardown(driver):
     logger.info("Closing webdriver")
-    driver.quit()
\ No newline at end of file
+    record_network_stats(driver)
+    if getattr(driver, 'attached', False):
+        # close our tab, leave the warm browser running
+        try:
+            driver.close()
+        except Exception as e:
+            logger.warning(f"Error closing warm browser tab: {e}")
+    driver.quit()
+
+
+if __name__ == "__main__":
+    # kept so `python driver_setup.py ...` still works, cli.py is the entry point
+    import sys
+    import cli
+
+    cli.main(['driver'] + sys.argv[1:])
@@ -0,0 +1,178 @@
+// Extracts a whole auction page in one round trip. Run with execute_async_script (see scrape_auction.scrape_auction_js).
+//
+// Mirrors parse_auction.parse_auction_html, except that sections missing from the page come back as null instead
+// of their empty defaults. Bids come back as raw [amount, bidder, time, reputation, is_verified] values for
+// parse_auction.bid_record to normalize.
+//
+// arguments: quick facts map {label: [key, selector]}, load more selector, max load more rounds,
+//            ms to wait for bids per round, ms the bid count has to hold still to count as loaded, callback
+const [quickFacts, loadMoreSelector, maxRounds, roundTimeout, settleMs, done] = arguments;
+
+const $ = (selector, root = document) => root.querySelector(selector);
+const $$ = (selector, root = document) => Array.from(root.querySelectorAll(selector));
+const text = (el) => (el ? (el.innerText || el.textContent || '').split(/\s+/).join(' ').trim() : null);
+const listText = (root, selector) => (root ? $$(selector, root).map(text) : null);
+const toInt = (value) => (value ? parseInt(value.replace(/,/g, ''), 10) : null);
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+const bidCount = () => $$('.thread li.bid').length;
+
+// waits until the bid count stops changing for settleMs (or roundTimeout passes)
+async function settle() {
+    const deadline = Date.now() + roundTimeout;
+    let count = bidCount();
+    let stableSince = Date.now();
+    while (Date.now() < deadline) {
+        await sleep(100);
+        const current = bidCount();
+        if (current !== count) {
+            count = current;
+            stableSince = Date.now();
+        } else if (Date.now() - stableSince >= settleMs) {
+            break;
+        }
+    }
+}
+
+async function loadBids() {
+    // the comments section can render after the title
+    const deadline = Date.now() + roundTimeout;
+    let filter = $("button[data-filter='4'][data-ga='bids']");
+    while (!filter && Date.now() < deadline) {
+        await sleep(100);
+        filter = $("button[data-filter='4'][data-ga='bids']");
+    }
+    if (!filter) return false;
+    filter.click();
+    await settle();
+    for (let round = 0; round < maxRounds; round++) {
+        const button = $(loadMoreSelector);
+        if (!button || button.disabled || button.offsetParent === null) break;
+        const before = bidCount();
+        button.click();
+        await settle();
+        if (bidCount() === before) break;
+    }
+    return true;
+}
+
+function extract(bidsLoaded) {
+    const stats = {
+        reserve_status: null, auction_status: null, highest_bid_value: null, buyer_username: null,
+        seller_username: null, bid_count: null, view_count: null, watcher_count: null, auction_date: null,
+        bids: null, bid_history: null,
+    };
+    const data = {
+        auction_title: text($('.auction-title h1')),
+        auction_subtitle: text($('.d-md-flex.justify-content-between.flex-wrap h2')),
+        auction_stats: stats,
+        auction_quick_facts: Object.fromEntries(Object.values(quickFacts).map(([key]) => [key, null])),
+        dougs_take: text($('.detail-section.dougs-take .detail-body p')),
+        auction_highlights: null,
+        known_flaws: listText($('.detail-section.detail-known_flaws'), '.detail-body li'),
+        modifications: listText($('.detail-section.detail-modifications'), '.detail-body li'),
+        service_history: null,
+        included_items: listText($('.detail-section.detail-other_items'), '.detail-body li'),
+        ownership_history: text($('.detail-section.detail-ownership_history .detail-body p')),
+        seller_notes: listText($('.detail-section.detail-seller_notes'), '.detail-body li'),
+        auction_videos: null,
+    };
+
+    const reserve = $('#auction-jump h3 span');
+    if (reserve) stats.reserve_status = text(reserve).includes('Reserve') ? 'Reserve' : 'No Reserve';
+
+    const status = $('.current-bid.ended');
+    if (status) {
+        if (status.classList.contains('cancelled')) {
+            stats.auction_status = 'Canceled';
+        } else {
+            const header = text($('h4', status)) || '';
+            if (header.includes('Sold to')) {
+                stats.auction_status = 'Sold';
+                stats.buyer_username = text($('.username .user', status));
+            } else if (header.includes('Reserve not met')) {
+                stats.auction_status = 'Reserve Not Met';
+            }
+            const bidValue = $('.bid-value', status);
+            if (bidValue) stats.highest_bid_value = text(bidValue).replace('$', '').trim();
+        }
+    }
+
+    const statsSection = $('ul.stats');
+    if (statsSection) {
+        stats.seller_username = text($('li.seller .user', statsSection));
+        for (const item of $$('li:not(.seller)', statsSection)) {
+            const label = text($('.th', item));
+            const value = text($('.td', item));
+            if (label === 'Ended') stats.auction_date = value;
+            else if (label === 'Bids') stats.bid_count = toInt(value);
+            else if (label === 'Views') stats.view_count = toInt(value);
+            else if (label === 'Watching') stats.watcher_count = toInt(value);
+        }
+    }
+
+    const facts = $('.quick-facts');
+    if (facts) {
+        for (const dl of $$('dl', facts).slice(0, 2)) {
+            for (const dt of $$('dt', dl)) {
+                const fact = quickFacts[text(dt).toLowerCase().replace(/ /g, '_')];
+                let dd = dt.nextElementSibling;
+                while (dd && dd.tagName !== 'DD') dd = dd.nextElementSibling;
+                if (!fact || !dd) continue;
+                const [key, selector] = fact;
+                data.auction_quick_facts[key] = text(selector ? $(selector, dd) : dd);
+            }
+        }
+    } else {
+        data.auction_quick_facts = null;
+    }
+
+    const highlights = $('.detail-section.detail-highlights .detail-body');
+    if (highlights) {
+        data.auction_highlights = {
+            description: text($('p', highlights)),
+            bullet_points: listText(highlights, 'ul li').filter((point) => point),
+        };
+    }
+
+    const service = $('.detail-section.detail-recent_service_history');
+    if (service) {
+        data.service_history = {
+            description: text($('.detail-body p', service)),
+            items: listText(service, '.detail-body li'),
+        };
+    }
+
+    const videos = $('.detail-section.detail-videos');
+    if (videos) {
+        data.auction_videos = $$('.video-embed img.video-preview', videos)
+            .map((img) => img.getAttribute('src') || '')
+            .filter((src) => src.includes('ytimg.com'))
+            .map((src) => src.split('/vi/')[1].split('/')[0]);
+    }
+
+    if (bidsLoaded) {
+        stats.bid_history = $$('.thread li.bid')
+            .filter((bid) => $('.bid-value', bid))
+            .map((bid) => {
+                const time = $('.time', bid);
+                return [
+                    text($('.bid-value', bid)),
+                    text($('.user', bid)),
+                    time ? time.getAttribute('data-full') : null,
+                    text($('.rep', bid)),
+                    $('.verified', bid) !== null,
+                ];
+            });
+    }
+    return data;
+}
+
+(async () => {
+    let bidsLoaded = false;
+    try {
+        bidsLoaded = await loadBids();
+    } catch (error) {
+        // the rest of the page is still worth returning
+    }
+    done(extract(bidsLoaded));
+})().catch((error) => done({error: String(error)}));
@@ -0,0 +1,181 @@
+import hashlib
+import multiprocessing
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import zstandard
+from dotenv import load_dotenv
+
+import logger as logging_setup
+from logger import setup_json_logger
+from parse_auction import parse_auction_html
+from sqlite_setup import apply_pragmas
+
+load_dotenv()
+logger = setup_json_logger()
+
+# archiving is off unless HTML_ARCHIVE_DIR is set
+archive_dir = os.getenv('HTML_ARCHIVE_DIR')
+sqlite_db_path = os.getenv('SQLITE_DB_PATH')
+
+
+class HtmlArchive:
+    """
+    Content-addressed store of fetched pages.
+
+    Each page is zstd-compressed and stored once under objects/<sha[:2]>/<sha>.html.zst, where sha is the
+    sha256 of the HTML. Every fetch (url, page type, fetch time, sha) is recorded in the html_archive table,
+    so the same content fetched twice takes disk space once.
+    """
+
+    def __init__(self, root:str, db_path:str=None, level:int=10):
+        self.root = root
+        self.level = level
+        self.conn = apply_pragmas(sqlite3.connect(db_path or 'carsnbids.db', check_same_thread=False))
+        self._lock = threading.Lock()
+
+    def object_path(self, sha256:str) -> str:
+        return os.path.join(self.root, 'objects', sha256[:2], f"{sha256}.html.zst")
+
+    def save(self, url:str, html:str, page_type:str) -> str:
+        """
+        Stores the page and indexes the fetch.
+
+        Returns:
+            str: sha256 of the HTML
+        """
+        data = html.encode('utf-8')
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.object_path(sha256)
+
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            compressed = zstandard.ZstdCompressor(level=self.level).compress(data)
+            # write then rename so a crash never leaves a truncated object behind
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(compressed)
+            os.replace(tmp_path, path)
+
+        with self._lock:
+            self.conn.execute(
+                "INSERT INTO html_archive(url, page_type, fetched_at, sha256, size) VALUES(?, ?, ?, ?, ?)",
+                (url, page_type, time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()), sha256, len(data))
+            )
+            self.conn.commit()
+        return sha256
+
+    def latest_auction_pages(self, since:str=None) -> list:
+        """
+        Returns (url, object path) for the most recent snapshot of every archived auction page.
+
+        Args:
+            since (str): Only include pages fetched on or after this date (YYYY-MM-DD).
+        """
+        query = """
+            SELECT url, sha256, MAX(id)
+            FROM html_archive
+            WHERE page_type = 'auction' AND fetched_at >= ?
+            GROUP BY url
+            ORDER BY url;
+        """
+        with self._lock:
+            rows = self.conn.execute(query, (since or '',)).fetchall()
+        return [(url, self.object_path(sha256)) for url, sha256, _ in rows]
+
+    def close(self):
+        self.conn.close()
+
+
+_archive = None
+_archive_lock = threading.Lock()
+
+
+def get_archive():
+    """Returns the process-wide archive, or None if HTML_ARCHIVE_DIR isn't set."""
+    global _archive
+    if not archive_dir:
+        return None
+    with _archive_lock:
+        if _archive is None:
+            logger.info(f"Archiving fetched pages to {os.path.abspath(archive_dir)}")
+            _archive = HtmlArchive(archive_dir, sqlite_db_path)
+    return _archive
+
+
+def enabled() -> bool:
+    return bool(archive_dir)
+
+
+def save_page(url:str, html:str, page_type:str):
+    """
+    Archives a fetched page ('listing' or 'auction') if archiving is enabled. Never raises.
+    """
+    archive = get_archive()
+    if archive is None or not html:
+        return
+    try:
+        archive.save(url, html, page_type)
+    except Exception as e:
+        logger.warning(f"Error archiving {url}: {e}", exc_info=True)
+
+
+def read_page(path:str) -> str:
+    with open(path, 'rb') as file:
+        return zstandard.ZstdDecompressor().decompress(file.read()).decode('utf-8')
+
+
+def _init_reparse_worker(counter):
+    """Reparse process initializer: logs to a file of its own, rotation isn't safe with several writers."""
+    with counter.get_lock():
+        counter.value += 1
+        worker_id = counter.value
+    base, extension = os.path.splitext(logging_setup.default_log_file)
+    setup_json_logger(f"{base}.reparse{worker_id}{extension}", force=True)
+
+
+def _reparse_page(task:tuple):
+    url, path = task
+    try:
+        return parse_auction_html(read_page(path), url)
+    except Exception as e:
+        logger.warning(f"Error reparsing {url}: {e}", exc_info=True)
+        return None
+
+
+def reparse(sink, since:str=None, workers:int=None) -> int:
+    """
+    Runs the auction parser over the latest archived snapshot of every auction page, across processes.
+
+    Args:
+        sink: Sink the parsed auctions are written to (see sinks.py).
+        since (str): Only reparse pages fetched on or after this date (YYYY-MM-DD).
+        workers (int): Number of parser processes. Defaults to the number of cores.
+
+    Returns:
+        int: Number of auctions reparsed.
+    """
+    archive = get_archive()
+    if archive is None:
+        raise ValueError("HTML_ARCHIVE_DIR is not set")
+
+    tasks = archive.latest_auction_pages(since)
+    logger.info(f"Reparsing {len(tasks)} archived auction pages")
+    start_time = time.time()
+
+    reparsed = 0
+    # spawned rather than forked: a forked child would inherit the queue handler but not the listener thread
+    # that writes it out, and lose everything it logs
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_reparse_worker,
+                             initargs=(context.Value('i', 0),)) as executor:
+        for auction_data in executor.map(_reparse_page, tasks, chunksize=64):
+            if auction_data is not None:
+                sink.write(auction_data)
+                reparsed += 1
+
+    logger.info(f"Reparsed {reparsed} auctions in {(time.time() - start_time)} seconds")
+    return reparsed
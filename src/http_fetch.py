@@ -0,0 +1,108 @@
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+from selectolax.lexbor import LexborHTMLParser
+
+import metrics
+import rate_limit
+from logger import setup_json_logger
+
+load_dotenv()
+logger = setup_json_logger()
+
+# override to point the scrapers at a local fixture server
+BASE_URL = os.getenv('CARSNBIDS_BASE_URL', 'https://carsandbids.com').rstrip('/')
+
+# 'selenium' loads every page in Chrome, 'http' tries a plain HTTP request first and falls back to Selenium
+fetch_backend = os.getenv('FETCH_BACKEND', 'selenium')
+
+
+class HttpFetcher:
+    """
+    Fetches pages over plain HTTP with keep-alive connection pooling.
+
+    Each thread gets its own requests.Session (sessions aren't thread safe), all sharing the same
+    pool size, retry policy and headers.
+    """
+
+    def __init__(self, pool_size:int=10, timeout:int=30, user_agent:str=None):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.user_agent = user_agent
+        self._local = threading.local()
+        self._sessions = []
+        self._lock = threading.Lock()
+
+    def _session(self) -> requests.Session:
+        session = getattr(self._local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            retries = Retry(total=2, backoff_factor=1, status_forcelist=(500, 502, 503, 504))
+            adapter = HTTPAdapter(pool_connections=self.pool_size, pool_maxsize=self.pool_size, max_retries=retries)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+            if self.user_agent:
+                session.headers['User-Agent'] = self.user_agent
+            self._local.session = session
+            with self._lock:
+                self._sessions.append(session)
+        return session
+
+    def get(self, url:str):
+        """
+        Returns the page HTML, or None if the request fails.
+
+        Every request waits for the rate limiter first. Timeouts, 429s, exhausted 5xx retries and challenge
+        pages slow the limiter down, healthy responses speed it up.
+        """
+        rate_limit.acquire()
+        start = time.monotonic()
+        try:
+            response = self._session().get(url, timeout=self.timeout)
+            retries = getattr(response.raw, 'retries', None)
+            if retries is not None and retries.history:
+                metrics.inc('http_retries_total', len(retries.history))
+            if response.status_code == 429 or rate_limit.is_challenge(response.text, response.status_code):
+                rate_limit.record_throttle(f"HTTP {response.status_code} for {url}", response.headers.get('Retry-After'))
+                return None
+            response.raise_for_status()
+            rate_limit.record_response(time.monotonic() - start)
+            return response.text
+        except (requests.Timeout, requests.exceptions.RetryError) as e:
+            rate_limit.record_throttle(f"{type(e).__name__} for {url}")
+            logger.warning(f"HTTP fetch failed for {url}: {e}")
+            return None
+        except Exception as e:
+            logger.warning(f"HTTP fetch failed for {url}: {e}")
+            return None
+
+    def close(self):
+        with self._lock:
+            for session in self._sessions:
+                session.close()
+            self._sessions.clear()
+
+
+def has_content(html:str, *selectors:str) -> bool:
+    """
+    Checks if the HTML already contains every selector. If it doesn't, the page needs JS and has to go through Selenium.
+    """
+    if not html:
+        return False
+    tree = LexborHTMLParser(html)
+    return all(tree.css_first(selector) is not None for selector in selectors)
+
+
+def setup_fetcher(pool_size:int=10, user_agent:str=None):
+    """
+    Returns an HttpFetcher if FETCH_BACKEND is 'http', otherwise None (Selenium only).
+    """
+    if fetch_backend != 'http':
+        return None
+    logger.info(f"Using HTTP fetch backend with pool size {pool_size}")
+    return HttpFetcher(pool_size=pool_size, user_agent=user_agent)
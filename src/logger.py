@@ -1,17 +1,167 @@
+import atexit
+import copy
+import glob
+import gzip
 import logging
+import os
+import queue
+import shutil
+import threading
+import time
+from datetime import datetime
+from logging.handlers import BaseRotatingHandler, QueueHandler, QueueListener
+
+from dotenv import load_dotenv
 from pythonjsonlogger.json import JsonFormatter
 
-def setup_json_logger(log_file="logs.json"):
-    logger = logging.getLogger()
-    logger.setLevel(logging.INFO)
+load_dotenv()
+
+default_log_file = os.getenv('LOG_FILE', 'logs.json')
+log_level = os.getenv('LOG_LEVEL', 'INFO').upper()
+log_max_bytes = int(os.getenv('LOG_MAX_BYTES', 50 * 1024 * 1024))
+log_rotate_hours = float(os.getenv('LOG_ROTATE_HOURS', 24))
+log_backup_count = int(os.getenv('LOG_BACKUP_COUNT', 14))
+# at most LOG_WARNING_BURST warnings per call site every LOG_WARNING_INTERVAL seconds, 0 lets every warning through
+log_warning_burst = int(os.getenv('LOG_WARNING_BURST', 10))
+log_warning_interval = float(os.getenv('LOG_WARNING_INTERVAL', 60))
+
+_listener = None
+_lock = threading.Lock()
+
+
+class CompressingRotatingFileHandler(BaseRotatingHandler):
+    """
+    Rolls the log file over once it reaches `max_bytes` or every `rotate_hours`, whichever comes first.
+    Rotated files are gzipped (<file>.<timestamp>.gz) and only the newest `backup_count` are kept.
+    """
+
+    def __init__(self, filename:str, max_bytes:int=0, rotate_hours:float=0, backup_count:int=0):
+        super().__init__(filename, 'a', encoding='utf-8', delay=True)
+        self.max_bytes = max_bytes
+        self.interval = rotate_hours * 3600
+        self.backup_count = backup_count
+        self.rollover_at = None
+        if self.interval:
+            # counted from the last write to an existing file, like TimedRotatingFileHandler, so a file's age carries
+            # over between the short daily runs instead of starting again with every process
+            start = os.stat(self.baseFilename).st_mtime if os.path.exists(self.baseFilename) else time.time()
+            self.rollover_at = start + self.interval
+
+    def shouldRollover(self, record) -> bool:
+        if self.rollover_at is not None and time.time() >= self.rollover_at:
+            return True
+        # checked before the record is written, so a file can go over max_bytes by one record
+        return bool(self.max_bytes) and self.stream is not None and self.stream.tell() >= self.max_bytes
+
+    def doRollover(self):
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+        if os.path.exists(self.baseFilename) and os.path.getsize(self.baseFilename):
+            rotated = f"{self.baseFilename}.{datetime.now().strftime('%Y%m%dT%H%M%S%f')}"
+            os.replace(self.baseFilename, rotated)
+            with open(rotated, 'rb') as source, gzip.open(f"{rotated}.gz", 'wb') as target:
+                shutil.copyfileobj(source, target)
+            os.remove(rotated)
+            if self.backup_count:
+                for old in sorted(glob.glob(f"{glob.escape(self.baseFilename)}.*.gz"))[:-self.backup_count]:
+                    os.remove(old)
+        if self.interval:
+            self.rollover_at = time.time() + self.interval
+
+
+class WarningSampler(logging.Filter):
+    """
+    Lets through at most `burst` warnings per call site every `interval` seconds and drops the rest. The first
+    warning of the next interval carries the number dropped as `suppressed`. Other levels always pass.
+    """
+
+    def __init__(self, burst:int, interval:float):
+        super().__init__()
+        self.burst = burst
+        self.interval = interval
+        # (pathname, lineno) -> [interval start, warnings let through, warnings dropped]
+        self.sites = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record) -> bool:
+        if record.levelno != logging.WARNING or not self.burst:
+            return True
+        key = (record.pathname, record.lineno)
+        now = time.monotonic()
+        with self._lock:
+            site = self.sites.get(key)
+            if site is None or now - site[0] >= self.interval:
+                if site is not None and site[2]:
+                    record.suppressed = site[2]
+                self.sites[key] = [now, 1, 0]
+                return True
+            if site[1] < self.burst:
+                site[1] += 1
+                return True
+            site[2] += 1
+            return False
+
+
+class _DeferredQueueHandler(QueueHandler):
+    """
+    Hands records to the listener thread with as little work as possible in the calling thread: the message is
+    merged with its args here, but formatting (including tracebacks) happens in the listener.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+def _stop_listener():
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener.handlers[0].close()
+        _listener = None
+
+
+def setup_json_logger(log_file:str=None, force:bool=False):
+    """
+    Sets up logging for the process (once) and returns the root logger.
+
+    Records go through a queue to a listener thread that does the JSON formatting and writes to `log_file`
+    (LOG_FILE), so logging never blocks the calling thread on disk. The file is rotated by size and age and
+    rotated files are compressed (see CompressingRotatingFileHandler). Repeated warnings from the same line are
+    sampled (see WarningSampler).
+
+    Args:
+        log_file (str): Log file. Defaults to LOG_FILE.
+        force (bool): Set up again even if logging is already set up, e.g. to switch to another file.
+    """
+    global _listener
+    root = logging.getLogger()
+    with _lock:
+        if _listener is not None and not force:
+            return root
+        _stop_listener()
+
+        file_handler = CompressingRotatingFileHandler(
+            log_file or default_log_file, log_max_bytes, log_rotate_hours, log_backup_count
+        )
+        file_handler.setFormatter(JsonFormatter('%(asctime)s %(name)s %(levelname)s %(message)s'))
+
+        log_queue = queue.SimpleQueue()
+        queue_handler = _DeferredQueueHandler(log_queue)
+        queue_handler.addFilter(WarningSampler(log_warning_burst, log_warning_interval))
 
-    # clear existing handlers
-    logger.handlers.clear()
+        root.setLevel(log_level)
+        # clear existing handlers
+        root.handlers.clear()
+        root.addHandler(queue_handler)
 
-    file_handler = logging.FileHandler(log_file)
-    formatter = JsonFormatter('%(asctime)s %(name)s %(levelname)s %(message)s')
-    file_handler.setFormatter(formatter)
+        _listener = QueueListener(log_queue, file_handler)
+        _listener.start()
+    return root
 
-    logger.addHandler(file_handler)
 
-    return logger
+# flush whatever is still queued before the process exits
+atexit.register(_stop_listener)
@@ -1,13 +1,22 @@
 import os
-import pandas as pd
+import json
+import threading
 from datetime import datetime, timedelta
 import time
 from dotenv import load_dotenv
 from logger import setup_json_logger
-import boto3
 import driver_setup
+import driver_pool
+import http_fetch
+import metrics
+import sinks
+import pipeline
+import rate_limit
+import retries
+import sqlite_setup
 import scrape_auction_urls
 import scrape_auction
+import seen_index
 import utils
 import notify
 
@@ -17,101 +26,266 @@ load_dotenv()
 logger = setup_json_logger()
 today = datetime.now().date()
 
-max_pages = os.getenv('MAX_PAGES_TO_SCRAPE')
+max_pages_to_scrape = os.getenv('MAX_PAGES_TO_SCRAPE')
+scraper_workers = os.getenv('SCRAPER_WORKERS')
 db_path = os.getenv('SQLITE_DB_PATH')
 raw_auctions_bucket = os.getenv("RAW_AUCTIONS_BUCKET")
 ec2_instance_id = os.getenv('EC2_INSTANCE_ID')
+output_sink = os.getenv('OUTPUT_SINK', 's3')
+parquet_output = os.getenv('PARQUET_OUTPUT')
+parquet_bucket = os.getenv('PARQUET_BUCKET') or raw_auctions_bucket
+
+# 'sequential' (discover, then scrape, then upload) or 'async' (overlap the stages, see pipeline.py)
+pipeline_mode = os.getenv('PIPELINE_MODE', 'sequential')
 
 ntfy_topic = os.getenv('NTFY_TOPIC')
 
 
-def run_scraper():
+def setup_sink(s3_client):
+    """Raw NDJSON sink for OUTPUT_SINK, plus Parquet if PARQUET_OUTPUT is set."""
+    return sinks.setup_sink(
+        output_sink, s3_client, raw_auctions_bucket, parquet=parquet_output, parquet_bucket=parquet_bucket
+    )
+
+
+def restore_checkpoints(sink, staged_auctions:list) -> list:
+    """
+    Writes auctions scraped by an earlier run straight from their checkpoint to the sink.
+
+    Returns:
+        list: Urls of the restored auctions.
+    """
+    restored = []
+    for url, state, payload in staged_auctions:
+        if state == 'scraped':
+            sink.write(json.loads(payload))
+            restored.append(url)
+    to_scrape = sum(1 for _, state, _ in staged_auctions if state == 'discovered')
+    logger.info(f"{len(restored)} auctions restored from checkpoint, {to_scrape} to scrape")
+    return restored
+
+
+def retry_failed(db:tuple, failed_urls:list, workers:int, fetcher, on_result, on_error) -> list:
+    """
+    Retries this run's failed auctions as their backoff runs out (see retries.py), for as long as the next one
+    comes due within RETRY_MAX_WAIT. Whatever is still failing is picked up by a later run.
+
+    Returns:
+        list: Urls that succeeded on a retry.
+    """
+    conn, cursor, db_lock = db
+    recovered = []
+    pending = list(failed_urls)
+    while pending:
+        with db_lock:
+            wait = retries.seconds_until_due(cursor, pending)
+        if wait is None or wait > retries.retry_max_wait:
+            break
+        if wait > 0:
+            logger.info(f"Waiting {round(wait)}s to retry failed auctions")
+            time.sleep(wait)
+        with db_lock:
+            due = retries.due_urls(cursor, pending)
+        results, _ = driver_pool.scrape_auctions(due, workers, fetcher=fetcher, on_result=on_result, on_error=on_error)
+        succeeded = {url for url, scraped in zip(due, results) if scraped}
+        recovered.extend(url for url in due if url in succeeded)
+        pending = [url for url in pending if url not in succeeded]
+    return recovered
+
+
+def shut_down_idle(ec2_client, resume:bool):
+    """Nothing new to scrape: exports metrics, notifies and stops the instance."""
+    logger.info("No new auctions found. Shutting down instance.")
+    ntfy_message = "No new auctions today. Instance will shut down."
+    # metrics and the notification go out before the instance stops
+    metrics.run_metrics.export(resume=resume, success=True)
+    with metrics.span('notify'):
+        notify.send_notification(ntfy_topic, ntfy_message)
+
+    utils.stop_instance(ec2_client, ec2_instance_id)
+
+
+def run_scraper(workers:int=None, max_pages:int=None, resume:bool=False, use_pipeline:bool=None):
     """
     Orchestrates the entire scraping pipeline:
-        - Sets up the Selenium WebDriver
         - Connects to the database
-        - Scrapes auction listing URLs
-        - Filters out already known URLs
-        - Scrapes auction details for the new URLs
+        - Scrapes auction listing URLs several pages at a time (DISCOVERY_WORKERS), stopping at the first page of already known auctions (at most `max_pages` pages)
+        - Filters out already known URLs (against the in-memory seen index) and stages them in the auction_staging table
+        - Picks up auctions staged by earlier runs that never got uploaded
+        - Scrapes auction details for the new URLs across a pool of `workers` drivers,
+          checkpointing each auction in auction_staging and streaming it to S3 (or a local spool file)
+          as NDJSON as soon as it's scraped, and optionally as Parquet partitioned by auction date
+        - Schedules failed auctions for retries with exponential backoff, retries the ones that come due within
+          RETRY_MAX_WAIT during the run, and dead-letters auctions that keep failing (see retries.py)
         - Inserts new URLs into the database
-        - Uploads auction data to S3
         - Commits DB changes only if upload is successful
         - Closes all resources cleanly
         - Sends notification to phone using ntfy (https://ntfy.sh/)
+        - Exports per-stage timings, per-auction latency and counters as a Prometheus textfile and
+          a JSON run report (see metrics.py)
+
+    With `resume`, discovery is skipped and only the auctions left in auction_staging by a failed run
+    are processed. Auctions that were already scraped are uploaded from their checkpoint without
+    re-fetching the page.
+
+    With `use_pipeline` (defaults to PIPELINE_MODE being 'async'), discovery, detail scraping and upload run as
+    concurrent stages connected by bounded queues instead of one after the other (see pipeline.py).
     """
+    if use_pipeline is None:
+        use_pipeline = pipeline_mode == 'async'
     ntfy_message = ''
     conn = None
     cursor = None
-    driver = None
+    fetcher = None
+    sink = None
+    success = False
+    run_metrics = metrics.reset()
 
     try:
-        # setup driver
-        logger.info(f"====== Setting up Webdriver ======")
-        driver = driver_setup.setup_driver()
-
         # setup db connection
         logger.info("====== Setting up db connection ======")
-        conn, cursor = utils.db_connection(db_path)
+        sqlite_setup.init_db(db_path)
+        conn, cursor = utils.db_connection(db_path, check_same_thread=False)
+        db_lock = threading.Lock()
+        seen = seen_index.get_index(cursor)
+
+        if workers is None:
+            workers = int(scraper_workers) if scraper_workers else 1
+        fetcher = http_fetch.setup_fetcher(pool_size=workers, user_agent=driver_setup.get_user_agent())
 
         # aws connections
+        import boto3
         s3_client = boto3.client("s3")
         ec2_client = boto3.client("ec2")
 
-
-        # scrape daily urls
-        logger.info('====== Scraping daily urls ===== ')
         page_count = 1
         if max_pages:
             page_count = int(max_pages)
-        start_time = time.time()
-        daily_urls = scrape_auction_urls.extract_auction_urls(driver, page_count)
-        logger.info(f"URLs scraping completed in {(time.time() - start_time)} seconds")
-
-
-        # filter out url
-        logger.info("====== Filtering out urls ====== ")
-        new_urls = utils.filter_urls(cursor, daily_urls)
-
-        if not new_urls:
-            logger.info("No new auctions found. Shutting down instance.")
-            ntfy_message = "No new auctions today. Instance will shut down."
-            notify.send_notification(ntfy_topic, ntfy_message)
-
-            utils.stop_instance(ec2_client, ec2_instance_id)
-            
-            return
-
-
-        # scrape auction details
-        logger.info('====== Scraping auction_details ======')
-        auctions_data = []
-        successful_urls = []
-        for url in new_urls:
-            try:
-                logger.info(f'Scraping url: {url}')
-                start_time = time.time()
-                auction_data = scrape_auction.scrape_auction_data(driver,url)
-                logger.info(f"Auction scraping completed in {(time.time() - start_time)} seconds")
-                auctions_data.append(auction_data)
-                successful_urls.append(url)
-            except Exception as e:
-                logger.warning(f'Error scraping {url}', exc_info=True)
+        elif max_pages_to_scrape:
+            page_count = int(max_pages_to_scrape)
+
+        def checkpoint(url, auction_data):
+            with db_lock:
+                utils.mark_scraped(cursor, url, auction_data)
+                retries.record_success(cursor, [url])
+                conn.commit()
+            sink.write(auction_data)
+
+        def record_failure(url, error):
+            with db_lock:
+                retries.record_failure(cursor, url, error)
+                conn.commit()
+
+        daily_urls = []
+        if use_pipeline:
+            # discovery, scraping and upload run concurrently (see pipeline.py)
+            logger.info('====== Running staged pipeline ======')
+            staged_auctions = utils.get_staged_auctions(cursor)
+            sink = setup_sink(s3_client)
+            successful_urls = restore_checkpoints(sink, staged_auctions)
+            urls_to_scrape = [url for url, state, _ in staged_auctions if state == 'discovered']
+
+            result = pipeline.run(
+                (conn, cursor, db_lock), seen, sink, fetcher=fetcher, staged_urls=urls_to_scrape,
+                discover=not resume, max_pages=page_count, workers=workers
+            )
+            daily_urls = result['daily_urls']
+            new_urls = successful_urls + result['new_urls']
+            successful_urls.extend(result['successful_urls'])
+            failed_urls = result['failed_urls']
+            worker_stats = result['worker_stats']
+
+            if not new_urls:
+                sink.abort()
+                sink = None
+                shut_down_idle(ec2_client, resume)
+                return
+        else:
+            if not resume:
+                # scrape daily urls, several listing pages at a time. Auctions still staged by an earlier run are
+                # picked up below and don't count as new
+                logger.info('====== Scraping daily urls ===== ')
+                filter_new = seen.staged_filter(cursor)
+                with metrics.span('discovery'):
+                    daily_urls = scrape_auction_urls.discover_auction_urls(
+                        page_count, fetcher=fetcher, filter_new=filter_new
+                    )
+
+                # filter out url
+                logger.info("====== Filtering out urls ====== ")
+                with metrics.span('filter'):
+                    discovered_urls = filter_new(daily_urls)
+                    staged = utils.stage_urls(cursor, discovered_urls)
+                    conn.commit()
+                logger.info(f"Staged {staged} newly discovered urls")
+            else:
+                logger.info("====== Resuming from auction_staging ======")
+
+            staged_auctions = utils.get_staged_auctions(cursor)
+            new_urls = [url for url, _, _ in staged_auctions]
+
+            if not new_urls:
+                shut_down_idle(ec2_client, resume)
+                return
+
+            sink = setup_sink(s3_client)
+            successful_urls = restore_checkpoints(sink, staged_auctions)
+            urls_to_scrape = [url for url, state, _ in staged_auctions if state == 'discovered']
+
+            # scrape auction details
+            logger.info('====== Scraping auction_details ======')
+            with metrics.span('detail_scrape'):
+                results, worker_stats = driver_pool.scrape_auctions(
+                    urls_to_scrape, workers, fetcher=fetcher, on_result=checkpoint, on_error=record_failure
+                )
+            successful_urls.extend(url for url, scraped in zip(urls_to_scrape, results) if scraped)
+            failed_urls = [url for url, scraped in zip(urls_to_scrape, results) if not scraped]
+
+        if failed_urls:
+            logger.info(f"====== Retrying {len(failed_urls)} failed auctions ======")
+            with metrics.span('retry'):
+                successful_urls.extend(retry_failed(
+                    (conn, cursor, db_lock), failed_urls, workers, fetcher, checkpoint, record_failure
+                ))
+        throughput = driver_pool.format_worker_stats(worker_stats)
+        logger.info(f"Worker throughput:\n{throughput}")
+        network = driver_setup.network_summary()
+        if network:
+            logger.info(network)
+        startup = driver_setup.startup_summary()
+        logger.info(startup)
+        pacing = rate_limit.summary()
+        if pacing:
+            logger.info(pacing)
+        retry_summary = retries.summary()
+        if retry_summary:
+            logger.info(retry_summary)
+        latency = metrics.latency_summary()
+        if latency:
+            logger.info(latency)
 
         # insert new urls into db
         logger.info("====== Updating urls table ====== ")
-        inserted_rows = utils.insert_urls(cursor,successful_urls)
+        with metrics.span('db_insert'):
+            inserted_rows = utils.insert_urls(cursor,successful_urls)
 
-        # upload auctions to s3
-        uploaded = utils.upload_to_s3(s3_client, auctions_data, raw_auctions_bucket)
+        # finish the upload to s3
+        with metrics.span('upload'):
+            uploaded = sink.close()
+        sink = None
 
         if uploaded:
             # committ & close db connection
             logger.info('Auctions successfully uploaded to s3. Committing DB changes')
+            utils.mark_uploaded(cursor, successful_urls)
             conn.commit()
+            success = True
+            seen.add(successful_urls)
+            seen.save_snapshot(cursor)
 
             logger.info(f"Scraped urls: {len(daily_urls)}")
             logger.info(f"New urls: {len(new_urls)}")
-            logger.info(f"Successfully scraped urls: {len(new_urls)}")
+            logger.info(f"Successfully scraped urls: {len(successful_urls)}")
             logger.info(f"URLs inserted into db: {inserted_rows}")
 
             # ntfy msg
@@ -119,11 +293,18 @@ def run_scraper():
                 Daily auctions scraping completed.\n
                 Scraped urls: {len(daily_urls)}.\n
                 New urls: {len(new_urls)}.\n
-                Successfully scraped urls: {len(new_urls)}.\n
+                Successfully scraped urls: {len(successful_urls)}.\n
                 URLs inserted into db: {inserted_rows}.\n
+                {throughput}\n
+                {latency}\n
+                {startup}\n
+                {pacing}\n
+                {retry_summary}\n
+                {network}
             """
         else:
-            logger.warning("Upload failed. New urls will not be saved in the db", exc_info=True)
+            logger.warning("Upload failed. New urls will not be saved in the db. Rerun with --resume to retry", exc_info=True)
+            conn.rollback()
             ntfy_message = f"Upload to s3 failed"
 
     except Exception as e:
@@ -131,15 +312,25 @@ def run_scraper():
         ntfy_message = f"Error in pipeline. \n {e}"
 
     finally:
+        if sink:
+            sink.abort()
         if cursor:
             cursor.close()
         if conn:
             conn.close()
-        if driver:
-            driver_setup.driver_teardown(driver)
+        if fetcher:
+            fetcher.close()
 
         # send notification
-        notify.send_notification(ntfy_topic,ntfy_message)
+        if ntfy_message:
+            with metrics.span('notify'):
+                notify.send_notification(ntfy_topic,ntfy_message)
+            run_metrics.export(resume=resume, success=success)
+
 
+if __name__ == "__main__":
+    # kept so `python main.py ...` still works, cli.py is the entry point
+    import sys
+    import cli
 
-run_scraper()
\ No newline at end of file
+    cli.main(['scrape'] + sys.argv[1:])
@@ -0,0 +1,239 @@
+import json
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from dotenv import load_dotenv
+
+from logger import setup_json_logger
+
+load_dotenv()
+logger = setup_json_logger()
+
+# the Prometheus textfile and JSON run report are written here after each run
+metrics_dir = os.getenv('METRICS_DIR', 'metrics')
+
+PROMETHEUS_PREFIX = 'carsnbids_scraper'
+
+# histogram buckets (seconds)
+DEFAULT_BUCKETS = (0.5, 1, 2, 5, 10, 20, 30, 60, 120, 300)
+
+HELP = {
+    'stage_duration_seconds': "Wall time of each pipeline stage in the last run",
+    'auction_scrape_seconds': "Time to scrape one auction page",
+    'auctions_scraped_total': "Auctions scraped successfully in the last run",
+    'auctions_failed_total': "Auctions that failed to scrape in the last run",
+    'http_fallbacks_total': "Pages the HTTP backend handed over to Selenium in the last run",
+    'http_retries_total': "HTTP requests retried in the last run",
+    'driver_restarts_total': "WebDrivers restarted after a failed auction in the last run",
+    'driver_setup_seconds': "Time to start (or attach) one WebDriver",
+    'chromedriver_resolve_seconds': "Time to resolve the chromedriver binary in the last run",
+    'first_page_seconds': "Time from process start to the first page being ready in the last run",
+    'run_success': "1 if the last run finished and uploaded, 0 otherwise",
+    'run_timestamp_seconds': "Unix time the last run finished",
+}
+
+
+def percentile(values:list, q:float):
+    """Nearest rank percentile (q between 0 and 1) of values, or None if there are none."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(q * len(ordered)) - 1))]
+
+
+class RunMetrics:
+    """
+    Timings and counters for one pipeline run.
+
+    Stages are timed with span(), per item latencies go into histograms with observe() and events are
+    counted with inc(). Everything is kept in memory and exported once at the end of the run as a
+    Prometheus textfile (for node_exporter's textfile collector) and a JSON run report. Safe to use from
+    multiple threads.
+    """
+
+    def __init__(self, buckets:tuple=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.started_at = time.time()
+        self.stages = []
+        self.observations = {}
+        self.counters = {}
+        self.gauges = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, stage:str):
+        """
+        Times the wrapped block as `stage`. The span is recorded (and marked failed) even if the block raises.
+        """
+        start = time.time()
+        status = 'ok'
+        try:
+            yield
+        except BaseException:
+            status = 'error'
+            raise
+        finally:
+            duration = round(time.time() - start, 3)
+            with self._lock:
+                self.stages.append({'stage': stage, 'start': round(start - self.started_at, 3), 'duration': duration, 'status': status})
+            logger.info(f"Stage {stage} finished in {duration} seconds ({status})")
+
+    def observe(self, name:str, value:float):
+        with self._lock:
+            self.observations.setdefault(name, []).append(value)
+
+    def inc(self, name:str, value:int=1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name:str, value:float):
+        with self._lock:
+            self.gauges[name] = value
+
+    def stage_durations(self) -> dict:
+        """Total seconds per stage (a stage can run more than once)."""
+        durations = {}
+        with self._lock:
+            for span in self.stages:
+                durations[span['stage']] = round(durations.get(span['stage'], 0) + span['duration'], 3)
+        return durations
+
+    def summary(self, name:str) -> dict:
+        with self._lock:
+            values = list(self.observations.get(name, []))
+        return {
+            'count': len(values),
+            'sum': round(sum(values), 3),
+            'p50': percentile(values, 0.5),
+            'p95': percentile(values, 0.95),
+            'p99': percentile(values, 0.99),
+            'max': max(values) if values else None,
+        }
+
+    def report(self, **meta) -> dict:
+        """JSON-serializable report of the run."""
+        with self._lock:
+            stages = list(self.stages)
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+            names = list(self.observations)
+        return {
+            'started_at': datetime.fromtimestamp(self.started_at, timezone.utc).isoformat(timespec='seconds'),
+            'duration': round(time.time() - self.started_at, 3),
+            **meta,
+            'stages': stages,
+            'stage_durations': self.stage_durations(),
+            'histograms': {name: self.summary(name) for name in names},
+            'counters': counters,
+            'gauges': gauges,
+        }
+
+    def prometheus(self, labels:dict=None) -> str:
+        """
+        Renders the run in the Prometheus text exposition format. `labels` are added to every series, so the files
+        of runs exported side by side (see export) don't clash.
+        """
+        lines = []
+
+        def header(name, kind):
+            lines.append(f"# HELP {PROMETHEUS_PREFIX}_{name} {HELP.get(name, name)}")
+            lines.append(f"# TYPE {PROMETHEUS_PREFIX}_{name} {kind}")
+
+        def series(name, **series_labels):
+            label_text = ",".join(f'{key}="{value}"' for key, value in {**series_labels, **(labels or {})}.items())
+            return f"{PROMETHEUS_PREFIX}_{name}{{{label_text}}}" if label_text else f"{PROMETHEUS_PREFIX}_{name}"
+
+        header('stage_duration_seconds', 'gauge')
+        for stage, duration in self.stage_durations().items():
+            lines.append(f"{series('stage_duration_seconds', stage=stage)} {duration}")
+
+        with self._lock:
+            observations = {name: list(values) for name, values in self.observations.items()}
+            counters = dict(self.counters)
+            gauges = dict(self.gauges)
+
+        for name, values in observations.items():
+            header(name, 'histogram')
+            for bucket in self.buckets:
+                lines.append(f"{series(f'{name}_bucket', le=bucket)} {sum(1 for v in values if v <= bucket)}")
+            lines.append(f"{series(f'{name}_bucket', le='+Inf')} {len(values)}")
+            lines.append(f"{series(f'{name}_sum')} {round(sum(values), 3)}")
+            lines.append(f"{series(f'{name}_count')} {len(values)}")
+
+        # counters reset every run, so they're exported as gauges of the last run's value
+        for name, value in sorted({**counters, **gauges}.items()):
+            header(name, 'gauge')
+            lines.append(f"{series(name)} {value}")
+
+        return "\n".join(lines) + "\n"
+
+    def export(self, directory:str=None, **meta):
+        """
+        Writes <directory>/carsnbids_scraper.prom (replaced every run) and <directory>/run_<timestamp>.json.
+        Never raises, a metrics problem shouldn't fail the run.
+
+        The pipeline stages (see stages.py) pass stage=<name>: they run on their own schedules, so each gets its own
+        carsnbids_scraper_<stage>.prom and report, and its series a pipeline_stage label.
+
+        Returns:
+            dict: The run report.
+        """
+        directory = directory or metrics_dir
+        if 'success' in meta:
+            self.set('run_success', int(bool(meta['success'])))
+        self.set('run_timestamp_seconds', int(time.time()))
+        report = self.report(**meta)
+        stage = meta.get('stage')
+        suffix = f"_{stage}" if stage else ''
+        try:
+            os.makedirs(directory, exist_ok=True)
+            # write then rename so the textfile collector never reads a half written file
+            prom_path = os.path.join(directory, f"{PROMETHEUS_PREFIX}{suffix}.prom")
+            with open(f"{prom_path}.tmp", 'w') as file:
+                file.write(self.prometheus({'pipeline_stage': stage} if stage else None))
+            os.replace(f"{prom_path}.tmp", prom_path)
+
+            timestamp = datetime.fromtimestamp(self.started_at, timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+            report_path = os.path.join(directory, f"run_{timestamp}{suffix}.json")
+            with open(report_path, 'w') as file:
+                json.dump(report, file, indent=2, default=str)
+            logger.info(f"Run metrics written to {os.path.abspath(prom_path)} and {os.path.abspath(report_path)}")
+        except Exception as e:
+            logger.warning(f"Error exporting run metrics: {e}", exc_info=True)
+        return report
+
+
+# metrics of the current run, shared by every module
+run_metrics = RunMetrics()
+
+
+def reset():
+    """Starts a fresh set of metrics for a new run."""
+    global run_metrics
+    run_metrics = RunMetrics()
+    return run_metrics
+
+
+def span(stage:str):
+    return run_metrics.span(stage)
+
+
+def observe(name:str, value:float):
+    run_metrics.observe(name, value)
+
+
+def inc(name:str, value:int=1):
+    run_metrics.inc(name, value)
+
+
+def latency_summary(name:str='auction_scrape_seconds') -> str:
+    """One line latency summary of a histogram for logs and notifications."""
+    summary = run_metrics.summary(name)
+    if not summary['count']:
+        return ''
+    return (f"Per auction latency: p50 {round(summary['p50'], 2)}s, p95 {round(summary['p95'], 2)}s, "
+            f"max {round(summary['max'], 2)}s over {summary['count']} auctions")
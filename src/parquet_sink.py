@@ -0,0 +1,245 @@
+import io
+import os
+import threading
+import uuid
+from collections import defaultdict
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from logger import setup_json_logger
+from seen_index import auction_id
+
+logger = setup_json_logger()
+
+
+SCHEMA = pa.schema([
+    ('auction_id', pa.string()),
+    ('auction_url', pa.string()),
+    ('auction_title', pa.string()),
+    ('auction_subtitle', pa.string()),
+    ('reserve_status', pa.string()),
+    ('auction_status', pa.string()),
+    ('highest_bid_value', pa.int64()),
+    ('buyer_username', pa.string()),
+    ('seller_username', pa.string()),
+    ('bid_count', pa.int64()),
+    ('view_count', pa.int64()),
+    ('watcher_count', pa.int64()),
+    ('auction_ended', pa.date32()),
+    ('bids', pa.list_(pa.int64())),
+    ('bid_history', pa.list_(pa.struct([
+        ('amount', pa.int64()),
+        ('bidder', pa.string()),
+        ('time', pa.string()),
+        ('reputation', pa.int64()),
+        ('is_verified', pa.bool_()),
+    ]))),
+    ('make', pa.string()),
+    ('model', pa.string()),
+    ('mileage', pa.string()),
+    ('vin', pa.string()),
+    ('title_status', pa.string()),
+    ('location', pa.string()),
+    ('seller', pa.string()),
+    ('engine', pa.string()),
+    ('drivetrain', pa.string()),
+    ('transmission', pa.string()),
+    ('body_style', pa.string()),
+    ('exterior_color', pa.string()),
+    ('interior_color', pa.string()),
+    ('seller_type', pa.string()),
+    ('dougs_take', pa.string()),
+    ('highlights_description', pa.string()),
+    ('highlights_bullet_points', pa.list_(pa.string())),
+    ('known_flaws', pa.list_(pa.string())),
+    ('modifications', pa.list_(pa.string())),
+    ('service_history_description', pa.string()),
+    ('service_history_items', pa.list_(pa.string())),
+    ('included_items', pa.list_(pa.string())),
+    ('ownership_history', pa.string()),
+    ('seller_notes', pa.list_(pa.string())),
+    ('auction_videos', pa.list_(pa.string())),
+])
+
+
+def _to_int(value):
+    """'$21,000' / '21,000' / 21000 -> 21000. Anything unparseable becomes None."""
+    if value is None or isinstance(value, int):
+        return value
+    try:
+        return int(str(value).replace('$', '').replace(',', '').strip())
+    except ValueError:
+        return None
+
+
+def _to_date(value):
+    """'Jun 7, 2025' -> date(2025, 6, 7). Anything unparseable becomes None."""
+    ended = pd.to_datetime(value, errors='coerce')
+    if ended is None or pd.isna(ended):
+        return None
+    return ended.date()
+
+
+def auction_partition(auction_ended) -> str:
+    """Partition value (YYYY-MM-DD) for the auction's end date, or 'unknown'."""
+    return auction_ended.isoformat() if auction_ended is not None else 'unknown'
+
+
+def flatten_auction(auction_data:dict) -> dict:
+    """
+    Flattens a scrape_auction_data dict into one row matching SCHEMA.
+
+    Stats and quick facts become top level typed columns, nested lists (bids, known_flaws, ...)
+    become list columns.
+    """
+    stats = auction_data.get('auction_stats') or {}
+    facts = auction_data.get('auction_quick_facts') or {}
+    highlights = auction_data.get('auction_highlights') or {}
+    service = auction_data.get('service_history') or {}
+    url = auction_data.get('auction_url') or ''
+
+    return {
+        'auction_id': auction_id(url) if url.count('/') >= 2 else None,
+        'auction_url': url,
+        'auction_title': auction_data.get('auction_title'),
+        'auction_subtitle': auction_data.get('auction_subtitle'),
+        'reserve_status': stats.get('reserve_status'),
+        'auction_status': stats.get('auction_status'),
+        'highest_bid_value': _to_int(stats.get('highest_bid_value')),
+        'buyer_username': stats.get('buyer_username'),
+        'seller_username': stats.get('seller_username'),
+        'bid_count': _to_int(stats.get('bid_count')),
+        'view_count': _to_int(stats.get('view_count')),
+        'watcher_count': _to_int(stats.get('watcher_count')),
+        'auction_ended': _to_date(stats.get('auction_date')),
+        'bids': [bid for bid in (_to_int(bid) for bid in stats.get('bids') or []) if bid is not None],
+        'bid_history': stats.get('bid_history') or [],
+        'make': facts.get('Make'),
+        'model': facts.get('Model'),
+        'mileage': facts.get('Mileage'),
+        'vin': facts.get('VIN'),
+        'title_status': facts.get('Title Status'),
+        'location': facts.get('Location'),
+        'seller': facts.get('Seller'),
+        'engine': facts.get('Engine'),
+        'drivetrain': facts.get('Drivetrain'),
+        'transmission': facts.get('Transmission'),
+        'body_style': facts.get('Body Style'),
+        'exterior_color': facts.get('Exterior Color'),
+        'interior_color': facts.get('Interior Color'),
+        'seller_type': facts.get('Seller Type'),
+        'dougs_take': auction_data.get('dougs_take'),
+        'highlights_description': highlights.get('description'),
+        'highlights_bullet_points': highlights.get('bullet_points') or [],
+        'known_flaws': auction_data.get('known_flaws') or [],
+        'modifications': auction_data.get('modifications') or [],
+        'service_history_description': service.get('description'),
+        'service_history_items': service.get('items') or [],
+        'included_items': auction_data.get('included_items') or [],
+        'ownership_history': auction_data.get('ownership_history'),
+        'seller_notes': auction_data.get('seller_notes') or [],
+        'auction_videos': auction_data.get('auction_videos') or [],
+    }
+
+
+class ParquetSink:
+    """
+    Writes auctions as zstd-compressed Parquet, partitioned by auction date (auction_date=YYYY-MM-DD/).
+
+    Rows are buffered per partition and written out every `batch_size` auctions, so a run produces
+    a few part files per partition rather than one per auction. Output goes to a local directory, or
+    to S3 when an s3_client and bucket are given. Safe to write to from multiple threads.
+
+    Every part file written is remembered, so abort() can delete them: a failed run that is resumed writes
+    its auctions again under a new run id, and would otherwise leave them in the dataset twice.
+    """
+
+    def __init__(self, root:str='parquet', s3_client=None, bucket:str=None, batch_size:int=500):
+        self.root = root.rstrip('/')
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.batch_size = batch_size
+        self.run_id = uuid.uuid4().hex[:12]
+        self.rows = defaultdict(list)
+        self.buffered = 0
+        self.parts = 0
+        self.written = []
+        self.records = 0
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def _write_partition(self, partition:str, rows:list):
+        table = pa.Table.from_pylist(rows, schema=SCHEMA)
+        key = f"{self.root}/auction_date={partition}/part-{self.run_id}-{self.parts:05d}.parquet"
+        self.parts += 1
+
+        if self.s3_client is not None:
+            buffer = io.BytesIO()
+            pq.write_table(table, buffer, compression='zstd')
+            self.s3_client.put_object(Bucket=self.bucket, Key=key, Body=buffer.getvalue())
+        else:
+            os.makedirs(os.path.dirname(key), exist_ok=True)
+            pq.write_table(table, key, compression='zstd')
+        self.written.append(key)
+
+    def _flush(self):
+        for partition, rows in self.rows.items():
+            self._write_partition(partition, rows)
+        self.rows = defaultdict(list)
+        self.buffered = 0
+
+    def write(self, record:dict):
+        with self._lock:
+            if self.failed:
+                return
+            row = flatten_auction(record)
+            self.rows[auction_partition(row['auction_ended'])].append(row)
+            self.buffered += 1
+            self.records += 1
+            if self.buffered >= self.batch_size:
+                try:
+                    self._flush()
+                except Exception as e:
+                    logger.error(f"Error writing parquet files: {e}", exc_info=True)
+                    self.failed = True
+
+    def _discard(self):
+        """Deletes every part file written so far."""
+        try:
+            if self.s3_client is not None:
+                # delete_objects takes up to 1000 keys per call
+                for i in range(0, len(self.written), 1000):
+                    self.s3_client.delete_objects(
+                        Bucket=self.bucket, Delete={'Objects': [{'Key': key} for key in self.written[i:i + 1000]]}
+                    )
+            else:
+                for key in self.written:
+                    if os.path.exists(key):
+                        os.remove(key)
+            if self.written:
+                logger.info(f"Deleted {len(self.written)} parquet files of the failed run")
+            self.written = []
+        except Exception as e:
+            logger.warning(f"Error deleting parquet files of the failed run: {e}", exc_info=True)
+
+    def abort(self):
+        with self._lock:
+            self.failed = True
+            self.rows = defaultdict(list)
+            self._discard()
+
+    def close(self) -> bool:
+        with self._lock:
+            if self.failed:
+                return False
+            try:
+                self._flush()
+                logger.info(f"{self.records} auctions written as parquet to {self.root} ({self.parts} files)")
+                return True
+            except Exception as e:
+                logger.error(f"Error writing parquet files: {e}", exc_info=True)
+                self.failed = True
+                self._discard()
+                return False
@@ -0,0 +1,291 @@
+import re
+from datetime import datetime
+
+from selectolax.lexbor import LexborHTMLParser
+
+from logger import setup_json_logger
+
+logger = setup_json_logger()
+
+
+def empty_auction_data(url:str) -> dict:
+    """Returns the auction dict with every field unset. Both extraction modes fill in this shape."""
+    return {
+        'auction_url': url,
+        'auction_title': None,
+        'auction_subtitle': None,
+        'auction_stats':{
+            'reserve_status': None,
+            'auction_status': None,
+            'highest_bid_value': None,
+            'buyer_username': None,
+            'seller_username': None,
+            'bid_count': None,
+            'view_count': None,
+            'watcher_count': None,
+            'auction_date': None,
+            'bids':[],
+            'bid_history': []
+
+        },
+        'auction_quick_facts': {
+            'Make': None,
+            'Model': None,
+            'Mileage': None,
+            'VIN': None,
+            'Title Status': None,
+            'Location': None,
+            'Seller': None,
+            'Engine': None,
+            'Drivetrain': None,
+            'Transmission': None,
+            'Body Style': None,
+            'Exterior Color': None,
+            'Interior Color': None,
+            'Seller Type': None
+        },
+        'dougs_take': None,
+        'auction_highlights': {
+            'description': None,
+            'bullet_points': []
+        },
+        'known_flaws': [],
+        'modifications':[],
+        'service_history': {
+            'description': None,
+            'items': []
+        },
+        'included_items': [],
+        'ownership_history': None,
+        'seller_notes': [],
+        'auction_videos': []
+    }
+
+
+# quick fact label (as found in the dt) -> (auction_quick_facts key, css selector inside the dd or None)
+QUICK_FACTS = {
+    'make': ('Make', 'a'),
+    'model': ('Model', 'a'),
+    'mileage': ('Mileage', None),
+    'vin': ('VIN', None),
+    'title_status': ('Title Status', None),
+    'location': ('Location', None),
+    'seller': ('Seller', '.user'),
+    'engine': ('Engine', None),
+    'drivetrain': ('Drivetrain', None),
+    'transmission': ('Transmission', None),
+    'body_style': ('Body Style', None),
+    'exterior_color': ('Exterior Color', None),
+    'interior_color': ('Interior Color', None),
+    'seller_type': ('Seller Type', None),
+}
+
+
+def _text(node) -> str:
+    """Text content of a node with whitespace collapsed, close to what Selenium's `.text` returns."""
+    if node is None:
+        return ''
+    return ' '.join(node.text(deep=True).split())
+
+
+def _list_text(section, selector:str) -> list:
+    return [_text(item) for item in section.css(selector)]
+
+
+def _next_dd(dt):
+    node = dt.next
+    while node is not None and node.tag != 'dd':
+        node = node.next
+    return node
+
+
+def _to_int(value):
+    digits = re.sub(r'[^0-9]', '', value or '')
+    return int(digits) if digits else None
+
+
+def _to_iso(value):
+    """Normalizes a bid's data-full timestamp to ISO 8601. Anything unparseable is kept as is."""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.strip()).isoformat()
+    except ValueError:
+        return value.strip()
+
+
+def bid_record(amount:str, bidder:str, time:str, reputation:str, is_verified:bool) -> dict:
+    """
+    Normalizes the raw fields of a `.thread li.bid` into a bid_history record. Both extraction modes
+    (and the JS extractor in scrape_auction.py) go through this, so the records are identical.
+
+    Args:
+        amount (str): `.bid-value` text, e.g. '$24,500'
+        bidder (str): `.user` text
+        time (str): `.time` data-full attribute
+        reputation (str): `.rep` text, e.g. 'Reputation Icon 405'
+        is_verified (bool): Whether the bid has a `.verified` badge
+
+    Returns:
+        dict: amount (int), bidder, time (ISO 8601), reputation (int) and is_verified
+    """
+    return {
+        'amount': _to_int(amount),
+        'bidder': ' '.join((bidder or '').split()) or None,
+        'time': _to_iso(time),
+        'reputation': _to_int(reputation),
+        'is_verified': bool(is_verified),
+    }
+
+
+def parse_auction_html(html:str, url:str) -> dict:
+    """
+    Parses a fully rendered auction page into the same dict that scrape_auction.scrape_auction_data returns.
+
+    Works on `driver.page_source` or on saved HTML. Missing sections are left at their defaults.
+
+    Args:
+        html: HTML of the auction page (with bid history loaded, if bids are wanted)
+        url: URL of the auction page
+
+    Returns:
+        Dictionary containing all scraped auction details
+    """
+    auction_data = empty_auction_data(url)
+    stats = auction_data['auction_stats']
+    tree = LexborHTMLParser(html)
+
+    title = tree.css_first(".auction-title h1")
+    if title is None:
+        logger.warning(f"Auction title not found in page source of {url}")
+        return auction_data
+    auction_data['auction_title'] = _text(title)
+
+    subtitle = tree.css_first(".d-md-flex.justify-content-between.flex-wrap h2")
+    if subtitle is not None:
+        auction_data['auction_subtitle'] = _text(subtitle)
+
+    reserve = tree.css_first("#auction-jump h3 span")
+    if reserve is not None:
+        stats['reserve_status'] = 'Reserve' if 'Reserve' in _text(reserve) else 'No Reserve'
+
+    # auction status and final bid
+    status_container = tree.css_first(".current-bid.ended")
+    if status_container is not None:
+        if 'cancelled' in (status_container.attributes.get('class') or ''):
+            stats['auction_status'] = 'Canceled'
+        else:
+            status_header = _text(status_container.css_first("h4"))
+            if 'Sold to' in status_header:
+                stats['auction_status'] = 'Sold'
+                stats['buyer_username'] = _text(status_container.css_first(".username .user"))
+            elif 'Reserve not met' in status_header:
+                stats['auction_status'] = 'Reserve Not Met'
+
+            bid_value = status_container.css_first(".bid-value")
+            if bid_value is not None:
+                stats['highest_bid_value'] = _text(bid_value).replace('$', '').strip()
+
+    # statistics from the stats ul
+    stats_section = tree.css_first("ul.stats")
+    if stats_section is not None:
+        seller = stats_section.css_first("li.seller .user")
+        if seller is not None:
+            stats['seller_username'] = _text(seller)
+
+        for item in stats_section.css("li:not(.seller)"):
+            label = _text(item.css_first(".th"))
+            value = _text(item.css_first(".td"))
+
+            if label == "Ended":
+                stats['auction_date'] = value
+            elif label == "Bids":
+                stats['bid_count'] = _to_int(value)
+            elif label == "Views":
+                stats['view_count'] = _to_int(value)
+            elif label == "Watching":
+                stats['watcher_count'] = _to_int(value)
+
+    # quick facts (both definition lists)
+    quick_facts = tree.css_first(".quick-facts")
+    if quick_facts is not None:
+        for dl in quick_facts.css("dl")[:2]:
+            for dt in dl.css("dt"):
+                label = _text(dt).lower().replace(" ", "_")
+                if label not in QUICK_FACTS:
+                    continue
+                key, selector = QUICK_FACTS[label]
+                dd = _next_dd(dt)
+                if dd is None:
+                    continue
+                auction_data['auction_quick_facts'][key] = _text(dd.css_first(selector) if selector else dd)
+    else:
+        logger.warning('Auction quick facts not found')
+
+    dougs_take = tree.css_first(".detail-section.dougs-take .detail-body p")
+    if dougs_take is not None:
+        auction_data['dougs_take'] = _text(dougs_take)
+
+    highlights_body = tree.css_first(".detail-section.detail-highlights .detail-body")
+    if highlights_body is not None:
+        description = highlights_body.css_first("p")
+        if description is not None:
+            auction_data['auction_highlights']['description'] = _text(description)
+        auction_data['auction_highlights']['bullet_points'] = [
+            point for point in _list_text(highlights_body, "ul li") if point
+        ]
+
+    flaws_section = tree.css_first(".detail-section.detail-known_flaws")
+    if flaws_section is not None:
+        auction_data['known_flaws'] = _list_text(flaws_section, ".detail-body li")
+
+    mod_section = tree.css_first(".detail-section.detail-modifications")
+    if mod_section is not None:
+        auction_data['modifications'] = _list_text(mod_section, ".detail-body li")
+
+    service_section = tree.css_first(".detail-section.detail-recent_service_history")
+    if service_section is not None:
+        description = service_section.css_first(".detail-body p")
+        if description is not None:
+            auction_data['service_history']['description'] = _text(description)
+        auction_data['service_history']['items'] = _list_text(service_section, ".detail-body li")
+
+    items_section = tree.css_first(".detail-section.detail-other_items")
+    if items_section is not None:
+        auction_data['included_items'] = _list_text(items_section, ".detail-body li")
+
+    history = tree.css_first(".detail-section.detail-ownership_history .detail-body p")
+    if history is not None:
+        auction_data['ownership_history'] = _text(history)
+
+    notes_section = tree.css_first(".detail-section.detail-seller_notes")
+    if notes_section is not None:
+        auction_data['seller_notes'] = _list_text(notes_section, ".detail-body li")
+
+    videos_section = tree.css_first(".detail-section.detail-videos")
+    if videos_section is not None:
+        sources = [img.attributes.get('src') or '' for img in videos_section.css(".video-embed img.video-preview")]
+        auction_data['auction_videos'] = [
+            src.split('/vi/')[1].split('/')[0]
+            for src in sources
+            if 'ytimg.com' in src
+        ]
+
+    # bids (only present once the bid history filter has been applied)
+    bid_history = []
+    for bid in tree.css(".thread li.bid"):
+        bid_value = bid.css_first(".bid-value")
+        if bid_value is None:
+            continue
+        time_node = bid.css_first(".time")
+        bid_history.append(bid_record(
+            _text(bid_value),
+            _text(bid.css_first(".user")),
+            time_node.attributes.get('data-full') if time_node is not None else None,
+            _text(bid.css_first(".rep")),
+            bid.css_first(".verified") is not None,
+        ))
+    stats['bid_history'] = bid_history
+    stats['bids'] = [str(bid['amount']) for bid in bid_history if bid['amount'] is not None]
+
+    return auction_data
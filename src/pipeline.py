@@ -0,0 +1,213 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import driver_pool
+import driver_setup
+import metrics
+import retries
+import scrape_auction_urls
+import utils
+from logger import setup_json_logger
+
+logger = setup_json_logger()
+
+# sentinel that tells the next stage there's nothing more coming
+_DONE = object()
+
+
+async def _discover(loop, executor, url_queue, db, seen, fetcher, max_pages:int, results:dict):
+    """
+    Runs listing discovery in a thread. Each page's new auctions are staged and queued for scraping as soon as
+    the page is read, in page order. Queueing blocks the discovery thread while the queue is full, so discovery never gets
+    more than a queue ahead of the scrapers.
+
+    Auctions already in auction_staging are left alone (see SeenIndex.staged_filter), the staged urls are
+    queued separately.
+    """
+    conn, cursor, db_lock = db
+    with db_lock:
+        filter_new = seen.staged_filter(cursor)
+
+    def on_page(page_urls):
+        new_urls = [url for url in filter_new(page_urls) if url not in results['queued']]
+        with db_lock:
+            utils.stage_urls(cursor, new_urls)
+            conn.commit()
+        for url in new_urls:
+            results['queued'][url] = None
+            asyncio.run_coroutine_threadsafe(url_queue.put(url), loop).result()
+
+    def discover():
+        return scrape_auction_urls.discover_auction_urls(
+            max_pages, fetcher=fetcher, filter_new=filter_new, on_page=on_page
+        )
+
+    with metrics.span('discovery'):
+        results['daily_urls'] = await loop.run_in_executor(executor, discover)
+
+
+async def _scrape(worker_id:int, loop, executor, url_queue, record_queue, db, fetcher, timeout:int, results:dict):
+    """
+    Pulls urls off url_queue and scrapes them with a driver owned by this worker. Scraped auctions go to
+    record_queue, which blocks the worker while the writer is behind. Failures are scheduled for a retry
+    (see retries.py).
+    """
+    conn, cursor, db_lock = db
+    stats = {'worker': worker_id, 'scraped': 0, 'failed': 0, 'elapsed': 0.0, 'auctions_per_min': 0.0}
+    driver = None
+
+    def record_failure(url, error):
+        with db_lock:
+            retries.record_failure(cursor, url, error)
+            conn.commit()
+
+    start_time = time.time()
+    try:
+        while True:
+            url = await url_queue.get()
+            if url is _DONE:
+                break
+            logger.info(f'Worker {worker_id}: scraping url: {url}')
+            try:
+                auction_data, driver = await loop.run_in_executor(
+                    executor, driver_pool.scrape_one, worker_id, url, driver, timeout, fetcher
+                )
+            except Exception as e:
+                logger.warning(f'Worker {worker_id}: error scraping {url}', exc_info=True)
+                stats['failed'] += 1
+                driver = None
+                results['failed_urls'].append(url)
+                try:
+                    await loop.run_in_executor(executor, record_failure, url, e)
+                except Exception:
+                    logger.warning(f'Worker {worker_id}: error recording failure of {url}', exc_info=True)
+                continue
+            await record_queue.put((url, auction_data))
+            stats['scraped'] += 1
+    finally:
+        if driver is not None:
+            await loop.run_in_executor(executor, driver_setup.driver_teardown, driver)
+
+    stats['elapsed'] = round(time.time() - start_time, 2)
+    if stats['elapsed']:
+        stats['auctions_per_min'] = round(stats['scraped'] / stats['elapsed'] * 60, 2)
+    results['worker_stats'].append(stats)
+
+
+async def _write(loop, record_queue, db, sink, batch_size:int, results:dict):
+    """
+    Checkpoints scraped auctions and writes them to the sink in batches, in a thread of its own so
+    serialization and part uploads overlap with scraping.
+    """
+    conn, cursor, db_lock = db
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix='writer')
+
+    def write_batch(batch):
+        with db_lock:
+            for url, auction_data in batch:
+                utils.mark_scraped(cursor, url, auction_data)
+            retries.record_success(cursor, [url for url, _ in batch])
+            conn.commit()
+        for _, auction_data in batch:
+            sink.write(auction_data)
+
+    try:
+        done = False
+        while not done:
+            batch = []
+            item = await record_queue.get()
+            # take whatever else is already waiting, up to a batch
+            while True:
+                if item is _DONE:
+                    done = True
+                    break
+                batch.append(item)
+                if len(batch) >= batch_size or record_queue.empty():
+                    break
+                item = record_queue.get_nowait()
+            if batch:
+                try:
+                    await loop.run_in_executor(writer, write_batch, batch)
+                    results['successful_urls'].extend(url for url, _ in batch)
+                except Exception as e:
+                    # keep draining the queue, a stuck writer would block every scraper
+                    logger.error(f"Error writing {len(batch)} auctions: {e}", exc_info=True)
+    finally:
+        writer.shutdown(wait=True)
+
+
+async def run_pipeline(db:tuple, seen, sink, fetcher=None, staged_urls:list=None, discover:bool=True,
+                       max_pages:int=1, workers:int=1, timeout:int=60, queue_size:int=None, batch_size:int=25) -> dict:
+    """
+    Runs discovery, detail scraping and checkpointing/upload as concurrent stages connected by bounded queues:
+
+        discovery (DISCOVERY_WORKERS threads) -> url queue -> `workers` scrapers (1 driver each) -> record queue -> writer (1 thread)
+
+    Auctions found on a listing page start scraping while the next page loads, and scraped auctions are
+    checkpointed and written to the sink in batches while scraping continues. Every queue is bounded, so a slow
+    stage blocks the ones before it instead of letting memory grow.
+
+    Args:
+        db (tuple): (conn, cursor, db_lock) for the tracking db. The lock serializes the stages' db writes.
+        seen (seen_index.SeenIndex): Index used to drop already scraped auctions.
+        sink: Sink scraped auctions are written to (see sinks.py). Not closed here.
+        fetcher (http_fetch.HttpFetcher): Optional HTTP backend tried before Selenium.
+        staged_urls (list): Urls staged by an earlier run that still need scraping. They're queued first.
+        discover (bool): Whether to run discovery. False when resuming.
+        max_pages (int): Max listing pages to discover.
+        workers (int): Number of concurrent drivers.
+        timeout (int): Timeout passed to scrape_auction.scrape_auction_data.
+        queue_size (int): Capacity of each queue. Defaults to 4 items per worker.
+        batch_size (int): Max auctions per sink/checkpoint batch.
+
+    Returns:
+        dict: daily_urls (all discovered urls), new_urls (urls queued for scraping), successful_urls, failed_urls
+            and worker_stats.
+    """
+    loop = asyncio.get_running_loop()
+    workers = max(1, int(workers))
+    queue_size = queue_size or workers * 4
+    url_queue = asyncio.Queue(maxsize=queue_size)
+    record_queue = asyncio.Queue(maxsize=queue_size)
+    # queued is an ordered set of every url sent to the scrapers
+    results = {'daily_urls': [], 'queued': {}, 'successful_urls': [], 'failed_urls': [], 'worker_stats': []}
+
+    # one thread per driver plus one for discovery (which runs its own page fetchers)
+    executor = ThreadPoolExecutor(max_workers=workers + 1, thread_name_prefix='pipeline')
+    logger.info(f"Starting pipeline with {workers} worker(s) and queues of {queue_size}")
+
+    try:
+        with metrics.span('pipeline'):
+            writer = asyncio.create_task(_write(loop, record_queue, db, sink, batch_size, results))
+            scrapers = [
+                asyncio.create_task(_scrape(worker_id, loop, executor, url_queue, record_queue, db, fetcher, timeout, results))
+                for worker_id in range(1, workers + 1)
+            ]
+
+            for url in staged_urls or []:
+                results['queued'][url] = None
+                await url_queue.put(url)
+            if discover:
+                try:
+                    await _discover(loop, executor, url_queue, db, seen, fetcher, max_pages, results)
+                except Exception as e:
+                    # whatever was queued before the failure still gets scraped
+                    logger.error(f"Error in discovery: {e}", exc_info=True)
+
+            for _ in scrapers:
+                await url_queue.put(_DONE)
+            await asyncio.gather(*scrapers)
+            await record_queue.put(_DONE)
+            await writer
+    finally:
+        executor.shutdown(wait=True)
+
+    results['new_urls'] = list(results.pop('queued'))
+    return results
+
+
+def run(db:tuple, seen, sink, **kwargs) -> dict:
+    """Blocking wrapper around run_pipeline."""
+    return asyncio.run(run_pipeline(db, seen, sink, **kwargs))
+
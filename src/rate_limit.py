@@ -0,0 +1,199 @@
+import os
+import re
+import threading
+import time
+
+from dotenv import load_dotenv
+
+import metrics
+from logger import setup_json_logger
+
+load_dotenv()
+logger = setup_json_logger()
+
+# requests per second to start at, and the range the limiter adapts within. RATE_LIMIT_RPS=0 turns it off
+rate_limit_rps = float(os.getenv('RATE_LIMIT_RPS', 2))
+rate_limit_min_rps = float(os.getenv('RATE_LIMIT_MIN_RPS', 0.2))
+rate_limit_max_rps = float(os.getenv('RATE_LIMIT_MAX_RPS', 8))
+
+# titles of bot challenge pages served instead of the real page
+CHALLENGE_TITLES = ('Just a moment...', 'Attention Required!')
+# the challenge widget's ids and classes start with cf-chl-. They're only trusted along with one of these statuses:
+# Cloudflare also injects its /cdn-cgi/challenge-platform scripts into normal 200 pages
+CHALLENGE_MARKER = 'cf-chl-'
+CHALLENGE_STATUSES = (403, 503)
+_TITLE = re.compile(r'<title[^>]*>(.*?)</title>', re.IGNORECASE | re.DOTALL)
+
+
+def is_challenge_title(title:str) -> bool:
+    """Checks a page title (e.g. driver.title) against the titles of challenge pages."""
+    return bool(title) and any(marker in title for marker in CHALLENGE_TITLES)
+
+
+def is_challenge(html:str, status_code:int=None) -> bool:
+    """
+    Checks if a response is a bot challenge page rather than the page that was asked for: it has a challenge
+    page title, or it's a 403/503 with the challenge widget in it.
+    """
+    if not html:
+        return False
+    title = _TITLE.search(html)
+    if title and is_challenge_title(title.group(1)):
+        return True
+    return status_code in CHALLENGE_STATUSES and CHALLENGE_MARKER in html
+
+
+class AdaptiveRateLimiter:
+    """
+    Token bucket shared by every thread that fetches pages from the site.
+
+    acquire() blocks until a request may go out. The refill rate adapts to how the site responds (AIMD):
+        - each healthy response adds `increase` / rate, i.e. the rate grows by about `increase` per second
+          of healthy traffic, up to max_rps
+        - a response much slower than usual (over `slow_factor` times the moving average) cuts the rate by 10%
+        - a timeout, 429 or challenge page halves the rate (down to min_rps) and pauses all requests for
+          Retry-After (if the site sent one) or `cooldown` seconds
+    """
+
+    def __init__(self, rps:float=2, min_rps:float=0.2, max_rps:float=8, increase:float=0.1,
+                 slow_factor:float=3, cooldown:float=30):
+        self.rps = rps
+        self.min_rps = min(min_rps, rps)
+        self.max_rps = max(max_rps, rps)
+        self.increase = increase
+        self.slow_factor = slow_factor
+        self.cooldown = cooldown
+        # allows a short burst of one second's worth of requests
+        self.tokens = 1.0
+        self.updated_at = time.monotonic()
+        self.paused_until = 0.0
+        self.latency = None
+        self.stats = {'requests': 0, 'throttled': 0, 'slow': 0, 'waited': 0.0, 'min_rps': rps, 'max_rps': rps}
+        self._lock = threading.Lock()
+
+    def _refill(self, now:float):
+        self.tokens = min(max(1.0, self.rps), self.tokens + (now - self.updated_at) * self.rps)
+        self.updated_at = now
+
+    def _set_rps(self, rps:float):
+        self.rps = min(self.max_rps, max(self.min_rps, rps))
+        self.stats['min_rps'] = min(self.stats['min_rps'], self.rps)
+        self.stats['max_rps'] = max(self.stats['max_rps'], self.rps)
+        metrics.run_metrics.set('rate_limit_rps', round(self.rps, 3))
+
+    def acquire(self) -> float:
+        """
+        Blocks until a request may be sent.
+
+        Returns:
+            float: Seconds waited.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.paused_until:
+                    delay = self.paused_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    self.stats['requests'] += 1
+                    self.stats['waited'] += waited
+                    return waited
+                else:
+                    delay = (1 - self.tokens) / self.rps
+            time.sleep(delay)
+            waited += delay
+
+    def record_response(self, latency:float):
+        """Feeds back a successful response and how long it took."""
+        with self._lock:
+            if self.latency is not None and latency > self.latency * self.slow_factor:
+                self.stats['slow'] += 1
+                self._set_rps(self.rps * 0.9)
+            else:
+                self._set_rps(self.rps + self.increase / self.rps)
+            # moving average, so a slow stretch becomes the new normal instead of throttling forever
+            self.latency = latency if self.latency is None else 0.8 * self.latency + 0.2 * latency
+
+    def record_throttle(self, reason:str, retry_after=None):
+        """
+        Feeds back a sign the site wants us to slow down (timeout, 429, challenge page).
+
+        Args:
+            reason (str): Logged with the new rate.
+            retry_after: Retry-After header value in seconds, if the response had one.
+        """
+        try:
+            pause = float(retry_after)
+        except (TypeError, ValueError):
+            pause = self.cooldown
+        with self._lock:
+            self.stats['throttled'] += 1
+            self._set_rps(self.rps / 2)
+            self.paused_until = max(self.paused_until, time.monotonic() + pause)
+            self.tokens = 0.0
+            rps = self.rps
+        metrics.inc('rate_limit_throttled_total')
+        logger.warning(f"Throttled ({reason}). Pausing requests for {pause}s, then {round(rps, 2)} requests/sec")
+
+    def share(self, processes:int):
+        """Splits the rates between `processes` processes that each have their own limiter but hit the same site."""
+        with self._lock:
+            self.min_rps /= processes
+            self.max_rps /= processes
+            self._set_rps(self.rps / processes)
+            self.stats['min_rps'] = self.stats['max_rps'] = self.rps
+
+    def summary(self) -> str:
+        with self._lock:
+            stats = dict(self.stats)
+            rps = self.rps
+        return (
+            f"Rate limit: {stats['requests']} requests, {round(rps, 2)} requests/sec at the end "
+            f"({round(stats['min_rps'], 2)}-{round(stats['max_rps'], 2)}), {stats['throttled']} throttled, "
+            f"{stats['slow']} slow, {round(stats['waited'], 1)}s spent waiting"
+        )
+
+
+class _Unlimited:
+    """Stand-in for the limiter when RATE_LIMIT_RPS is 0."""
+
+    def acquire(self) -> float:
+        return 0.0
+
+    def record_response(self, latency:float):
+        pass
+
+    def record_throttle(self, reason:str, retry_after=None):
+        metrics.inc('rate_limit_throttled_total')
+        logger.warning(f"Throttled ({reason}), rate limiting is off")
+
+    def share(self, processes:int):
+        pass
+
+    def summary(self) -> str:
+        return ""
+
+
+# one limiter per process, shared by the listing and detail scrapers and every worker thread
+limiter = (
+    AdaptiveRateLimiter(rate_limit_rps, rate_limit_min_rps, rate_limit_max_rps)
+    if rate_limit_rps > 0 else _Unlimited()
+)
+
+
+def acquire() -> float:
+    return limiter.acquire()
+
+
+def record_response(latency:float):
+    limiter.record_response(latency)
+
+
+def record_throttle(reason:str, retry_after=None):
+    limiter.record_throttle(reason, retry_after)
+
+
+def summary() -> str:
+    return limiter.summary()
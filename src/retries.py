@@ -0,0 +1,127 @@
+import os
+
+from dotenv import load_dotenv
+
+import metrics
+from logger import setup_json_logger
+from seen_index import auction_id
+
+load_dotenv()
+logger = setup_json_logger()
+
+# failed attempts before an auction moves to auction_dead_letters
+retry_max_attempts = int(os.getenv('RETRY_MAX_ATTEMPTS', 5))
+# seconds until the first retry, doubled after every failed attempt up to RETRY_MAX_DELAY
+retry_base_delay = float(os.getenv('RETRY_BASE_DELAY', 60))
+retry_max_delay = float(os.getenv('RETRY_MAX_DELAY', 6 * 3600))
+# longest a run waits for one of its failed auctions to come due, later retries are left to the next run
+retry_max_wait = float(os.getenv('RETRY_MAX_WAIT', 300))
+
+
+def backoff(attempts:int) -> float:
+    """Seconds to wait after the `attempts`th failed attempt."""
+    return min(retry_max_delay, retry_base_delay * 2 ** (attempts - 1))
+
+
+def record_failure(cursor, url:str, error) -> bool:
+    """
+    Records a failed scrape of url. The auction is scheduled for another attempt after backoff(attempts), or,
+    once it has failed RETRY_MAX_ATTEMPTS times, moved to auction_dead_letters with the last error and marked
+    'dead' in auction_staging so it's no longer picked up.
+
+    Returns:
+        bool: True if the auction was dead-lettered.
+    """
+    id = auction_id(url)
+    error = str(error) or type(error).__name__
+    row = cursor.execute("SELECT attempts FROM auction_retries WHERE auction_id = ?", (id,)).fetchone()
+    if row is not None:
+        metrics.inc('retries_attempted_total')
+    attempts = (row[0] if row else 0) + 1
+
+    if attempts >= retry_max_attempts:
+        dead_letter(cursor, url, attempts, error)
+        cursor.execute("DELETE FROM auction_retries WHERE auction_id = ?", (id,))
+        cursor.execute(
+            "UPDATE auction_staging SET state = 'dead', updated_at = CURRENT_TIMESTAMP WHERE auction_id = ?", (id,)
+        )
+        return True
+
+    delay = backoff(attempts)
+    cursor.execute(
+        """
+            INSERT INTO auction_retries(auction_id, url, attempts, next_attempt_at, last_error)
+            VALUES(?, ?, ?, datetime('now', ?), ?)
+            ON CONFLICT(auction_id) DO UPDATE SET
+                attempts = excluded.attempts, next_attempt_at = excluded.next_attempt_at,
+                last_error = excluded.last_error, updated_at = CURRENT_TIMESTAMP
+        """,
+        (id, url, attempts, f'+{int(delay)} seconds', error)
+    )
+    logger.info(f"Attempt {attempts} at {url} failed, retrying in {int(delay)}s")
+    return False
+
+
+def dead_letter(cursor, url:str, attempts:int, error:str):
+    """Moves an auction to auction_dead_letters, the auctions no run tries to scrape again."""
+    cursor.execute(
+        """
+            INSERT INTO auction_dead_letters(auction_id, url, attempts, last_error) VALUES(?, ?, ?, ?)
+            ON CONFLICT(auction_id) DO UPDATE SET
+                attempts = excluded.attempts, last_error = excluded.last_error, failed_at = CURRENT_TIMESTAMP
+        """,
+        (auction_id(url), url, attempts, error)
+    )
+    metrics.inc('auctions_dead_lettered_total')
+    logger.error(f"Giving up on {url} after {attempts} attempts: {error}")
+
+
+def record_success(cursor, urls:list) -> int:
+    """
+    Clears the retry state of auctions that were scraped.
+
+    Returns:
+        int: How many of them were retries.
+    """
+    cursor.executemany("DELETE FROM auction_retries WHERE auction_id = ?", [(auction_id(url),) for url in urls])
+    recovered = max(cursor.rowcount, 0)
+    if recovered:
+        metrics.inc('retries_attempted_total', recovered)
+        metrics.inc('retries_succeeded_total', recovered)
+    return recovered
+
+
+def due_urls(cursor, urls:list) -> list:
+    """The urls, out of `urls`, whose next attempt is due."""
+    due = {row[0] for row in cursor.execute(
+        "SELECT auction_id FROM auction_retries WHERE next_attempt_at <= datetime('now')"
+    )}
+    return [url for url in urls if auction_id(url) in due]
+
+
+def seconds_until_due(cursor, urls:list):
+    """
+    Seconds until the first of `urls` is due for a retry (0 if one already is).
+
+    Returns:
+        float: None if none of them are waiting for a retry.
+    """
+    ids = {auction_id(url) for url in urls}
+    waits = [
+        wait for id, wait in cursor.execute(
+            "SELECT auction_id, (julianday(next_attempt_at) - julianday('now')) * 86400 FROM auction_retries"
+        ) if id in ids
+    ]
+    return max(0.0, min(waits)) if waits else None
+
+
+def summary() -> str:
+    """Retry success rate of the current run, for logs and notifications."""
+    counters = metrics.run_metrics.report()['counters']
+    attempted = counters.get('retries_attempted_total', 0)
+    succeeded = counters.get('retries_succeeded_total', 0)
+    dead = counters.get('auctions_dead_lettered_total', 0)
+    if not attempted and not dead:
+        return ""
+    rate = round(succeeded / attempted * 100, 1) if attempted else 0.0
+    return f"Retries: {succeeded}/{attempted} succeeded ({rate}%), {dead} auctions dead-lettered"
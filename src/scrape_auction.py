@@ -8,14 +8,186 @@ from datetime import datetime
 import os
 import json
 
-from driver_setup import close_promo_bar
+from dotenv import load_dotenv
+
+from driver_setup import close_promo_bar, load_page, wait_ceiling, wait_for_count_to_settle
+from http_fetch import has_content
+import html_archive
 from logger import setup_json_logger
+from parse_auction import QUICK_FACTS, bid_record, empty_auction_data, parse_auction_html
 
+load_dotenv()
 logger = setup_json_logger()
 
+# 'webdriver' reads each field through Selenium, 'page_source' parses a single page_source snapshot locally,
+# 'js' extracts the whole page inside the browser in a single script call
+extraction_mode = os.getenv('EXTRACTION_MODE', 'webdriver')
+
+# control that loads older comments/bids into the thread
+LOAD_MORE_BIDS_SELECTOR = ".comments .load-more button, .comments button.load-more"
+
+# Runs in the page via execute_async_script. Clicks "load more" until it's gone (or max_rounds), waiting after each
+# click for the number of bids to change, then optionally returns every bid in the thread as raw field values.
+# arguments: load more selector, max rounds, ms to wait for new bids per round, extract (bool), callback
+BID_HISTORY_JS = """
+const [loadMoreSelector, maxRounds, roundTimeout, extract, done] = arguments;
+const bidCount = () => document.querySelectorAll('.thread li.bid').length;
+const sleep = (ms) => new Promise((resolve) => setTimeout(resolve, ms));
+
+(async () => {
+    for (let round = 0; round < maxRounds; round++) {
+        const button = document.querySelector(loadMoreSelector);
+        if (!button || button.disabled || button.offsetParent === null) break;
+        const before = bidCount();
+        button.click();
+        const deadline = Date.now() + roundTimeout;
+        while (bidCount() === before && Date.now() < deadline) await sleep(100);
+        if (bidCount() === before) break;
+    }
+    if (!extract) return done(null);
+
+    const text = (el) => el ? el.textContent : null;
+    done(Array.from(document.querySelectorAll('.thread li.bid')).map((bid) => {
+        const time = bid.querySelector('.time');
+        return [
+            text(bid.querySelector('.bid-value')),
+            text(bid.querySelector('.user')),
+            time ? time.getAttribute('data-full') : null,
+            text(bid.querySelector('.rep')),
+            bid.querySelector('.verified') !== null,
+        ];
+    }).filter((bid) => bid[0] !== null));
+})().catch((error) => done({error: String(error)}));
+"""
+
+
+def load_bid_history(driver, timeout:int = 60) -> bool:
+    """
+    Waits for the comments section and applies the Bid History filter so that `.thread li.bid` holds the bids.
+
+    Returns:
+        bool: True if the filter was applied
+    """
+    WebDriverWait(driver, timeout).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, ".comments"))
+    )
+
+    try:
+        bid_button = WebDriverWait(driver, 10).until(
+            EC.element_to_be_clickable((By.CSS_SELECTOR, "button[data-filter='4'][data-ga='bids']"))
+        )
+        driver.execute_script("arguments[0].click();", bid_button)
+        bid_count, waited = wait_for_count_to_settle(driver, ".thread li.bid")
+        logger.info(f"Bid history loaded ({bid_count} bids) after {waited} seconds")
+        return True
+    except Exception as e:
+        logger.warning(f"Couldn't click bid history button: {str(e)}", exc_info=True)
+        return False
+
+
+def load_older_bids(driver, timeout:int = 60, extract:bool = False, max_rounds:int = 50):
+    """
+    Loads every lazily loaded older bid into the thread in a single execute_async_script call, and with
+    `extract` also reads the whole bid history in that same call. Call after load_bid_history.
+
+    Returns:
+        list: bid_history records (see parse_auction.bid_record) if `extract`, else None.
+    """
+    driver.set_script_timeout(timeout)
+    result = driver.execute_async_script(BID_HISTORY_JS, LOAD_MORE_BIDS_SELECTOR, max_rounds, int(wait_ceiling * 1000), extract)
+    if isinstance(result, dict) and 'error' in result:
+        raise RuntimeError(f"Bid history script failed: {result['error']}")
+    if not extract:
+        return None
+    return [bid_record(*bid) for bid in result or []]
+
+
+with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'extract_auction.js')) as file:
+    EXTRACT_AUCTION_JS = file.read()
 
 
-def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
+def scrape_auction_js(driver, url:str, timeout:int = 60) -> dict:
+    """
+    Scrapes a single auction page with one execute_async_script call (extract_auction.js) that applies the
+    bid history filter, loads older bids and reads every section inside the browser.
+
+    Unlike the other modes, sections missing from the page are None rather than empty defaults.
+
+    Returns:
+        Dictionary containing all scraped auction details
+    """
+    load_page(driver, url)
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ".auction-title"))
+        )
+    except TimeoutException:
+        logger.warning(f"Timeout while scraping {url}", exc_info=True)
+        return empty_auction_data(url)
+
+    driver.set_script_timeout(timeout)
+    result = driver.execute_async_script(
+        EXTRACT_AUCTION_JS, QUICK_FACTS, LOAD_MORE_BIDS_SELECTOR, 50, int(wait_ceiling * 1000), 500
+    )
+    if not isinstance(result, dict) or 'error' in result:
+        logger.warning(f"Auction extractor failed on {url}: {(result or {}).get('error')}")
+        return empty_auction_data(url)
+
+    stats = result['auction_stats']
+    if stats['bid_history'] is not None:
+        stats['bid_history'] = [bid_record(*bid) for bid in stats['bid_history']]
+        stats['bids'] = [str(bid['amount']) for bid in stats['bid_history'] if bid['amount'] is not None]
+
+    if html_archive.enabled():
+        html_archive.save_page(url, driver.page_source, 'auction')
+    return {'auction_url': url, **result}
+
+
+def scrape_auction_page_source(driver, url:str, timeout:int = 60) -> dict:
+    """
+    Scrapes a single auction page by loading it, then parsing one `driver.page_source` snapshot locally.
+
+    Returns the same dict as the webdriver extraction mode, at the cost of a single WebDriver round trip
+    for the page content instead of one per field.
+    """
+    load_page(driver, url)
+    close_promo_bar(driver)
+
+    try:
+        WebDriverWait(driver, timeout).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, ".auction-title"))
+        )
+    except TimeoutException:
+        logger.warning(f"Timeout while scraping {url}", exc_info=True)
+        return empty_auction_data(url)
+
+    try:
+        if load_bid_history(driver, timeout):
+            load_older_bids(driver, timeout)
+    except Exception as e:
+        logger.warning(f"Error scraping bid history: {str(e)}", exc_info=True)
+
+    html = driver.page_source
+    html_archive.save_page(url, html, 'auction')
+    return parse_auction_html(html, url)
+
+
+def scrape_auction_http(fetcher, url:str):
+    """
+    Scrapes a single auction page from its static HTML, without a browser.
+
+    Returns:
+        The auction dict, or None if the page needs JS to render (the caller should fall back to Selenium)
+    """
+    html = fetcher.get(url)
+    if not has_content(html, ".auction-title h1", ".comments"):
+        logger.info(f"Static HTML incomplete for {url}. Falling back to Selenium")
+        return None
+    html_archive.save_page(url, html, 'auction')
+    return parse_auction_html(html, url)
+
+
+def scrape_auction_data(driver, url:str, timeout:int = 60, mode:str = None) -> dict:
     """
     Scrapes detailed information from a single auction page.
     
@@ -23,62 +195,20 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
         url: URL of the auction page
         driver: Selenium WebDriver instance
         timeout: Maximum wait time for elements
+        mode: 'webdriver', 'page_source' or 'js'. Defaults to the EXTRACTION_MODE env variable
         
     Returns:
         Dictionary containing all scraped auction details
     """
-    driver.get(url)
+    if (mode or extraction_mode) == 'page_source':
+        return scrape_auction_page_source(driver, url, timeout)
+    if (mode or extraction_mode) == 'js':
+        return scrape_auction_js(driver, url, timeout)
+
+    load_page(driver, url)
     close_promo_bar(driver)
 
-    auction_data = {
-        'auction_url': url,
-        'auction_title': None,
-        'auction_subtitle': None,
-        'auction_stats':{
-            'reserve_status': None,
-            'auction_status': None,
-            'highest_bid_value': None,
-            'buyer_username': None,
-            'seller_username': None,
-            'bid_count': None,
-            'view_count': None,
-            'watcher_count': None,
-            'auction_date': None,
-            'bids':[]
-            
-        },
-        'auction_quick_facts': {
-            'Make': None,
-            'Model': None,
-            'Mileage': None,
-            'VIN': None,
-            'Title Status': None,
-            'Location': None,
-            'Seller': None,
-            'Engine': None,
-            'Drivetrain': None,
-            'Transmission': None,
-            'Body Style': None,
-            'Exterior Color': None,
-            'Interior Color': None,
-            'Seller Type': None
-        },
-        'dougs_take': None,
-        'auction_highlights': {
-            'description': None,
-            'bullet_points': []
-        },
-        'known_flaws': [],
-        'modifications':[],
-        'service_history': {
-            'description': None,
-            'items': []
-        },
-        'included_items': [],
-        'ownership_history': None,
-        'seller_notes': [],
-        'auction_videos': []
-    }
+    auction_data = empty_auction_data(url)
 
     try:
         # Wait for main content to load
@@ -190,7 +320,7 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
                     auction_data['auction_quick_facts']['Seller Type'] = dd.text.strip()
 
         except NoSuchElementException:
-            logger.warning('Auction quick facts not found', exc_info=True)
+            logger.info('Auction quick facts not found')
         except Exception as e:
             logger.warning(e, exc_info=True)
 
@@ -200,7 +330,7 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
             auction_data['dougs_take'] = dougs_section.find_element(
                 By.CSS_SELECTOR, ".detail-body p").text.strip()
         except NoSuchElementException:
-            print("Doug's take not found", exc_info=True)
+            logger.info("Doug's take not found")
         except Exception as e:
             logger.warning(e, exc_info=True)
 
@@ -214,7 +344,7 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
                 auction_data['auction_highlights']['description'] = highlights_body.find_element(
                     By.CSS_SELECTOR, "p").text.strip()
             except NoSuchElementException:
-                logger.warning('Auction hightlights not found', exc_info=True)
+                logger.info('Auction hightlights not found')
             except Exception as e:
                 logger.warning(f'Error: {e}', exc_info=True)
                 
@@ -227,7 +357,7 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
             ]
 
         except NoSuchElementException:
-            logger.warning('Auction highlights not found', exc_info=True)
+            logger.info('Auction highlights not found')
         except Exception as e:
             logger.warning(e, exc_info=True)
 
@@ -237,7 +367,7 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
             flaws_items = flaws_section.find_elements(By.CSS_SELECTOR, ".detail-body li")
             auction_data['known_flaws'] = [item.text.strip() for item in flaws_items]
         except NoSuchElementException:
-            logger.warning('Known flaws not found', exc_info=True)
+            logger.info('Known flaws not found')
         except Exception as e:
             logger.warning(e, exc_info=True)
 
@@ -247,7 +377,7 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
             mod_items = mod_section.find_elements(By.CSS_SELECTOR, ".detail-body li")
             auction_data['modifications'] = [item.text.strip() for item in mod_items]
         except NoSuchElementException:
-            logger.warning('Modifications not found', exc_info=True)
+            logger.info('Modifications not found')
         except Exception as e:
             logger.warning(e, exc_info=True)
 
@@ -260,7 +390,7 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
             service_items = service_section.find_elements(By.CSS_SELECTOR, ".detail-body li")
             auction_data['service_history']['items'] = [item.text.strip() for item in service_items]
         except NoSuchElementException:
-            logger.warning('Service History not found', exc_info=True)
+            logger.info('Service History not found')
         except Exception as e:
             logger.warning(e, exc_info=True)
 
@@ -270,7 +400,7 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
             included_items = items_section.find_elements(By.CSS_SELECTOR, ".detail-body li")
             auction_data['included_items'] = [item.text.strip() for item in included_items]
         except NoSuchElementException:
-            logger.warning("Included items not found", exc_info=True)
+            logger.info("Included items not found")
         except Exception as e:
             logger.warning(e, exc_info=True)
 
@@ -280,7 +410,7 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
             auction_data['ownership_history'] = history_section.find_element(
                 By.CSS_SELECTOR, ".detail-body p").text.strip()
         except NoSuchElementException:
-            logger.warning('Ownership history not found', exc_info=True)
+            logger.info('Ownership history not found')
         except Exception as e:
             logger.warning(e, exc_info=True)
 
@@ -290,7 +420,7 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
             notes_items = notes_section.find_elements(By.CSS_SELECTOR, ".detail-body li")
             auction_data['seller_notes'] = [item.text.strip() for item in notes_items]
         except NoSuchElementException:
-            logger.warning('Seller notes not found', exc_info=True)
+            logger.info('Seller notes not found')
         except Exception as e:
             logger.warning(e, exc_info=True)
         
@@ -304,49 +434,22 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
                 if 'ytimg.com' in img.get_attribute("src")
             ]
         except NoSuchElementException:
-            logger.warning('Auction videos not found', exc_info=True)
+            logger.info('Auction videos not found')
         except Exception as e:
             logger.warning(e, exc_info=True)
 
         # bids
         try:
-            # Wait for main content and click Bid History button
-            WebDriverWait(driver, timeout).until(
-                EC.presence_of_element_located((By.CSS_SELECTOR, ".comments"))
-            )
-            
-            # Click Bid History filter button
-            try:
-                bid_button = WebDriverWait(driver, 10).until(
-                    EC.element_to_be_clickable((By.CSS_SELECTOR, "button[data-filter='4'][data-ga='bids']"))
-                )
-                driver.execute_script("arguments[0].click();", bid_button)
-                time.sleep(2)  # Allow bids to load
-            except Exception as e:
-                logger.warning(f"Couldn't click bid history button: {str(e)}", exc_info=True)
+            if not load_bid_history(driver, timeout):
+                # archive what did load, these are the pages most worth reparsing later
+                if html_archive.enabled():
+                    html_archive.save_page(url, driver.page_source, 'auction')
                 return auction_data
-            except Exception as e:
-                logger.warning(e, exc_info=True)
-
-            # Extract bid history
-            bids = []
-            bid_items = driver.find_elements(By.CSS_SELECTOR, ".thread li.bid")
-            for bid in bid_items:
-                try:
-                    bid = bid.find_element(By.CSS_SELECTOR, ".bid-value").text.replace('$', '').replace(',', '')
-                    bids.append(bid)
-                    # bid_data = {
-                    #     # 'bidder': bid.find_element(By.CSS_SELECTOR, ".user").text.strip(),
-                        
-                    #     # 'time': bid.find_element(By.CSS_SELECTOR, ".time").get_attribute("data-full"),
-                    #     # 'is_verified': bool(bid.find_elements(By.CSS_SELECTOR, ".verified")),
-                    #     # 'reputation': bid.find_element(By.CSS_SELECTOR, ".rep").text.replace('Reputation Icon', '').strip()
-                    # }
-                   
-                except Exception as e:
-                    logger.warning(f"Error parsing bid: {str(e)}", exc_info=True)
-                    continue
-            auction_data['auction_stats']['bids']=bids
+
+            # Extract the whole bid history, older bids included, in one round trip
+            bid_history = load_older_bids(driver, timeout, extract=True)
+            auction_data['auction_stats']['bid_history'] = bid_history
+            auction_data['auction_stats']['bids'] = [str(bid['amount']) for bid in bid_history if bid['amount'] is not None]
 
         except Exception as e:
             logger.warning(f"Error scraping bid history: {str(e)}", exc_info=True)
@@ -355,5 +458,8 @@ def scrape_auction_data(driver, url:str, timeout:int = 60) -> dict:
         logger.warning(f"Timeout while scraping {url}", exc_info=True)
     except Exception as e:
         logger.warning(f"Error scraping {url}: {str(e)}", exc_info=True)
+
+    if html_archive.enabled():
+        html_archive.save_page(url, driver.page_source, 'auction')
     
     return auction_data
@@ -1,95 +1,209 @@
 from selenium.webdriver.common.by import By
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
-from selenium.common.exceptions import TimeoutException, NoSuchElementException
+from selenium.common.exceptions import TimeoutException
 import time
 import csv
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 import os
 from dotenv import load_dotenv
 import logger
 
-from driver_setup import close_promo_bar
+from selectolax.lexbor import LexborHTMLParser
+
+from driver_setup import driver_teardown, load_page, record_first_page, setup_driver
+from http_fetch import BASE_URL, has_content
+import html_archive
 
 load_dotenv()
 logger = logger.setup_json_logger()
 
+# listing pages fetched concurrently by discover_auction_urls
+discovery_workers = int(os.getenv('DISCOVERY_WORKERS', 4))
 
 
-
-def wait_for_pagination(driver, timeout:int=10):
-    try:
-        WebDriverWait(driver, timeout).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, ".paginator"))
-        )
-        logger.info("Pagination loaded (auctions likely loaded).")
-    except TimeoutException:
-        logger.error("Pagination not found. Proceeding anyway...")
+def extract_page_urls(html:str) -> list:
+    """Extracts absolute auction URLs from the HTML of a past-auctions page."""
+    tree = LexborHTMLParser(html)
+    urls = []
+    for link in tree.css(".auction-item .auction-title a[href]"):
+        href = link.attributes.get('href')
+        urls.append(href if href.startswith('http') else f"{BASE_URL}{href}")
+    return urls
 
 
-def extract_auction_urls(driver, max_pages:int, timeout:int=60*5):
+def page_is_known(page_urls:list, filter_new) -> bool:
     """
-    Scrapes auction URLs from carsandbids.com/past-auctions/.
-    
-    Args:
-        driver: Selenium WebDriver instance.
-        max_pages (int): Max number of pages to scrape. If None, scrape all.
-        timeout (int): Timeout for WebDriverWait.
-    Returns:
-        list: All scraped auction URLs.
+    Checks a listing page against the already scraped auctions. Past auctions are listed newest first,
+    so once a whole page is known, every page after it is known too.
     """
-    driver.get('https://carsandbids.com/past-auctions/')
-    close_promo_bar(driver)
+    if filter_new is None or not page_urls:
+        return False
+    if filter_new(page_urls):
+        return False
+    logger.info(f"All {len(page_urls)} auctions on this page are already known. Stopping.")
+    return True
 
 
-    auction_urls = []
-    current_page = 1
+def listing_page_url(page:int) -> str:
+    return f"{BASE_URL}/past-auctions/?page={page}"
 
-    while True:
-        logger.info(f"Scraping page {current_page}...")
 
-        try:
-            # wait for auctions to load
-            WebDriverWait(driver, timeout).until(
-                EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".auction-item")
-            ))
+def scrape_listing_page(page:int, fetcher=None, driver=None, timeout:int=60):
+    """
+    Scrapes the auction URLs of one past-auctions page, addressed directly by its page number.
 
-            # extract urls from  current page
-            auction_links = driver.find_elements(By.CSS_SELECTOR, ".auction-item .auction-title a[href]")
-            auction_urls.extend([link.get_attribute("href") for link in auction_links])
-            logger.info(f"Added {len(auction_links)} URLs (Total: {len(auction_urls)})")
+    Args:
+        page (int): Page number.
+        fetcher (http_fetch.HttpFetcher): Used if given.
+        driver: Used if there's no fetcher.
+        timeout (int): How long the driver waits for the listing to render.
 
+    Returns:
+        list: The page's auction URLs. Empty past the last page.
 
-        except TimeoutException:
-            logger.info("No auctions found on page.", exc_info=True)
-            break
-        except Exception as e:
-            logger.error(f"Error scraping auction urls: {e}", exc_info=True)
-            break
-
-        # check if it has scraped max_pages
-        if max_pages and current_page >= max_pages:
-            logger.info(f"Reached max pages ({max_pages}). Stopping.", exc_info=True)
-            break
-
-        # else go to the next page
+    Raises:
+        RuntimeError: if the page couldn't be loaded (worth retrying).
+    """
+    url = listing_page_url(page)
+    if fetcher is not None:
+        html = fetcher.get(url)
+        if html is None:
+            raise RuntimeError(f"Failed to fetch {url}")
+    else:
+        load_page(driver, url)
         try:
-            next_button = WebDriverWait(driver, timeout).until(
-                EC.element_to_be_clickable((By.CSS_SELECTOR, "li.arrow.next button"))
+            WebDriverWait(driver, timeout).until(
+                EC.presence_of_all_elements_located((By.CSS_SELECTOR, ".auction-item"))
             )
-            next_button.click()
-            current_page += 1
-            time.sleep(10)
         except TimeoutException:
-            logger.warning("No more pages (or pagination button not clickable).", exc_info=True)
-            break
-        except NoSuchElementException:
-            logger.error("'Next' button not found.", exc_info=True)
-            break
-        except Exception as e:
-            logger.error(f"Error navigating to next page: {e}", exc_info=True)
-            break
-
-
-    return auction_urls        
-    
\ No newline at end of file
+            raise RuntimeError(f"No auctions rendered on {url} within {timeout}s")
+        html = driver.page_source
+    return listing_page_urls(page, html)
+
+
+def listing_page_urls(page:int, html:str) -> list:
+    """The auction URLs in the HTML of listing page `page`. Pages with auctions are archived."""
+    page_urls = extract_page_urls(html)
+    if page_urls:
+        if page == 1:
+            record_first_page()
+        html_archive.save_page(listing_page_url(page), html, 'listing')
+    return page_urls
+
+
+def discover_auction_urls(max_pages:int, workers:int=None, fetcher=None, filter_new=None, on_page=None,
+                          retries:int=2, timeout:int=60, first_page:int=1, max_failed_pages:int=3):
+    """
+    Scrapes auction URLs from past-auctions/?page=N, fetching up to `workers` pages at a time.
+
+    Pages are addressed directly instead of clicking through the paginator, so they fail and are retried
+    (`retries` times, with backoff) independently of each other. The first page is read on its own, so a run
+    with nothing new stops after one page; the rest are fetched in waves of `workers`. Results are merged in page
+    order and de-duplicated, since listings shift while they're being read.
+
+    Over HTTP (if a fetcher is given and page 1 renders without JS) the workers share the fetcher's sessions,
+    otherwise each worker thread starts its own driver.
+
+    Args:
+        max_pages (int): Number of pages to scrape.
+        workers (int): Pages fetched concurrently. Defaults to DISCOVERY_WORKERS.
+        fetcher (http_fetch.HttpFetcher): Optional HTTP backend.
+        filter_new (callable): Takes a list of URLs and returns the ones not scraped yet. If given,
+            scraping stops after the first page where every auction is already known.
+        on_page (callable): Optional on_page(page_urls), called in page order with each page's new (not yet
+            returned) URLs.
+        retries (int): Retries per page.
+        timeout (int): How long a driver waits for a page to render.
+        first_page (int): Page to start from.
+        max_failed_pages (int): Stop after this many pages in a row fail even after their retries.
+
+    Returns:
+        list: All scraped auction URLs, in page order without duplicates.
+    """
+    workers = max(1, int(workers or discovery_workers))
+    # the probe doubles as the first page, it isn't fetched again
+    probed = {}
+    if fetcher is not None:
+        html = fetcher.get(listing_page_url(first_page))
+        if has_content(html, ".auction-item"):
+            probed[first_page] = listing_page_urls(first_page, html)
+        else:
+            logger.info("No auctions in static HTML. Discovering with Selenium")
+            fetcher = None
+
+    drivers = []
+    local = threading.local()
+    drivers_lock = threading.Lock()
+
+    def get_driver():
+        driver = getattr(local, 'driver', None)
+        if driver is None:
+            driver = setup_driver()
+            local.driver = driver
+            with drivers_lock:
+                drivers.append(driver)
+        return driver
+
+    def fetch(page):
+        if page in probed:
+            return probed.pop(page)
+        for attempt in range(retries + 1):
+            try:
+                return scrape_listing_page(page, fetcher, None if fetcher else get_driver(), timeout)
+            except Exception as e:
+                if attempt == retries:
+                    logger.error(f"Giving up on listing page {page} after {attempt + 1} attempts: {e}")
+                    return None
+                logger.warning(f"Listing page {page} failed (attempt {attempt + 1}): {e}. Retrying")
+                time.sleep(2 ** attempt)
+
+    auction_urls = {}
+    last_page = first_page + max_pages - 1 if max_pages else None
+    page = first_page
+    failed_in_a_row = 0
+    try:
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='discovery') as executor:
+            done = False
+            while not done:
+                # the first page alone, so nothing is fanned out if it's already known
+                wave_size = 1 if page == first_page else workers
+                wave = list(range(page, page + wave_size if last_page is None else min(page + wave_size, last_page + 1)))
+                if not wave:
+                    break
+                logger.info(f"Scraping listing pages {wave[0]}-{wave[-1]}...")
+                for current_page, page_urls in zip(wave, executor.map(fetch, wave)):
+                    if page_urls is None:
+                        # failed even after retries, the pages around it still count
+                        failed_in_a_row += 1
+                        if failed_in_a_row >= max_failed_pages:
+                            logger.error(f"{failed_in_a_row} listing pages in a row failed. Stopping.")
+                            done = True
+                            break
+                        continue
+                    failed_in_a_row = 0
+                    if not page_urls:
+                        logger.info(f"No auctions on page {current_page}. Stopping.")
+                        done = True
+                        break
+
+                    new_urls = [url for url in page_urls if url not in auction_urls]
+                    auction_urls.update(dict.fromkeys(new_urls))
+                    logger.info(f"Added {len(new_urls)} URLs from page {current_page} (Total: {len(auction_urls)})")
+                    if on_page is not None and new_urls:
+                        on_page(new_urls)
+
+                    if page_is_known(page_urls, filter_new):
+                        done = True
+                        break
+                page = wave[-1] + 1
+                if last_page is not None and page > last_page:
+                    logger.info(f"Reached max pages ({max_pages}). Stopping.")
+                    done = True
+    finally:
+        for driver in drivers:
+            driver_teardown(driver)
+
+    return list(auction_urls)
@@ -0,0 +1,168 @@
+import os
+import threading
+import time
+
+import zstandard
+from dotenv import load_dotenv
+
+from logger import setup_json_logger
+
+load_dotenv()
+logger = setup_json_logger()
+
+# compact copy of the seen auction ids, so startup doesn't have to read the whole urls table
+snapshot_path = os.getenv('SEEN_SNAPSHOT_PATH', 'seen_auctions.zst')
+
+SNAPSHOT_HEADER = 'carsnbids-seen-v1'
+
+
+def auction_id(url:str) -> str:
+    """
+    Auction id of an auction url, the second last part of the path:
+    https://carsandbids.com/auctions/<auction_id>/<slug> -> <auction_id>
+    """
+    return url.split("/")[-2]
+
+
+class SeenIndex:
+    """
+    In-memory set of the auction ids already in the urls table.
+
+    Loaded once per process from a snapshot (sorted ids, zstd-compressed, tagged with the highest urls rowid it
+    covers) plus the rows inserted since, then kept up to date with add() as auctions are committed. If the
+    snapshot and the table disagree on the number of ids, the index is rebuilt from the table, so membership is
+    always exact. Safe to use from multiple threads.
+    """
+
+    def __init__(self):
+        self.ids = set()
+        self.max_rowid = 0
+        self._lock = threading.Lock()
+
+    def __contains__(self, auction_id:str) -> bool:
+        return auction_id in self.ids
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def _read_snapshot(self, path:str) -> bool:
+        try:
+            with open(path, 'rb') as file:
+                lines = zstandard.ZstdDecompressor().decompress(file.read()).decode('utf-8').split('\n')
+            header, max_rowid = lines[0].split(' ')
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"Error reading seen index snapshot {path}: {e}", exc_info=True)
+            return False
+
+        if header != SNAPSHOT_HEADER:
+            logger.warning(f"Ignoring seen index snapshot {path} with unknown header {header}")
+            return False
+        self.ids = set(filter(None, lines[1:]))
+        self.max_rowid = int(max_rowid)
+        return True
+
+    def load(self, cursor, path:str=None):
+        """
+        Loads the index from the snapshot at `path` (if there is one) and the urls table.
+
+        Args:
+            cursor (sqlite3.Cursor): Cursor on the tracking db.
+            path (str): Snapshot file. Defaults to SEEN_SNAPSHOT_PATH.
+        """
+        path = path or snapshot_path
+        start_time = time.time()
+        with self._lock:
+            from_snapshot = self._read_snapshot(path)
+            if not from_snapshot:
+                self.ids = set()
+                self.max_rowid = 0
+
+            rows = cursor.execute("SELECT rowid, auction_id FROM urls WHERE rowid > ?", (self.max_rowid,)).fetchall()
+            self.ids.update(row[1] for row in rows)
+            if rows:
+                self.max_rowid = max(row[0] for row in rows)
+
+            # a snapshot from another db, or rows deleted since it was written
+            total = cursor.execute("SELECT COUNT(*) FROM urls").fetchone()[0]
+            if len(self.ids) != total:
+                logger.warning(f"Seen index snapshot is out of sync ({len(self.ids)} ids vs {total} urls), rebuilding from db")
+                rows = cursor.execute("SELECT rowid, auction_id FROM urls").fetchall()
+                self.ids = {row[1] for row in rows}
+                self.max_rowid = max((row[0] for row in rows), default=0)
+                from_snapshot = False
+
+        logger.info(
+            f"Seen index loaded {len(self.ids)} auction ids in {round(time.time() - start_time, 3)} seconds "
+            f"({'snapshot' if from_snapshot else 'db'} + {len(rows)} rows from db)"
+        )
+        return self
+
+    def add(self, urls:list):
+        """Adds the auction ids of urls. Call after the urls are committed to the urls table."""
+        ids = [auction_id(url) for url in urls]
+        with self._lock:
+            self.ids.update(ids)
+
+    def filter_new(self, urls:list) -> list:
+        """
+        Same as utils.filter_urls but without a db round trip: urls whose auction id hasn't been seen,
+        one per auction id, in order.
+        """
+        new_urls = {}
+        for url in urls:
+            try:
+                id = auction_id(url)
+            except Exception as e:
+                logger.error(f"Error processing url ({url}): {e}", exc_info=True)
+                continue
+            if id not in self.ids:
+                new_urls[id] = url
+        return list(new_urls.values())
+
+    def staged_filter(self, cursor):
+        """
+        Returns a filter_new for discovery that also leaves out auctions already in auction_staging: restored from
+        their checkpoint, left for a resume, waiting out a retry backoff or dead-lettered (see retries.py). They
+        don't count as new, so they don't keep discovery from stopping early.
+        """
+        staged = {row[0] for row in cursor.execute("SELECT auction_id FROM auction_staging")}
+
+        def filter_new(urls:list) -> list:
+            return [url for url in self.filter_new(urls) if auction_id(url) not in staged]
+        return filter_new
+
+    def save_snapshot(self, cursor, path:str=None):
+        """
+        Writes the index to `path` atomically. Never raises, a missing snapshot only makes the next startup slower.
+        """
+        path = path or snapshot_path
+        try:
+            with self._lock:
+                max_rowid = cursor.execute("SELECT COALESCE(MAX(rowid), 0) FROM urls").fetchone()[0]
+                data = "\n".join([f"{SNAPSHOT_HEADER} {max_rowid}", *sorted(self.ids)]).encode('utf-8')
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as file:
+                file.write(zstandard.ZstdCompressor(level=10).compress(data))
+            os.replace(tmp_path, path)
+            logger.info(f"Seen index snapshot of {len(self.ids)} auction ids written to {os.path.abspath(path)}")
+        except Exception as e:
+            logger.warning(f"Error writing seen index snapshot: {e}", exc_info=True)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_index(cursor=None, path:str=None) -> SeenIndex:
+    """
+    Returns the process-wide index, loading it with `cursor` on first use.
+    """
+    global _index
+    with _index_lock:
+        if _index is None:
+            if cursor is None:
+                raise ValueError("The seen index isn't loaded yet, pass a cursor")
+            _index = SeenIndex().load(cursor, path)
+    return _index
@@ -0,0 +1,204 @@
+import io
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from logger import setup_json_logger
+
+logger = setup_json_logger()
+
+# S3 requires every part except the last to be at least 5MB
+MIN_PART_SIZE = 5 * 1024 * 1024
+
+
+def daily_key(extension:str='ndjson') -> str:
+    """Object/file name for the current run: auctions_<prev_date>.<extension>"""
+    prev_date = datetime.now().date() - timedelta(days=1)
+    return f"auctions_{prev_date}.{extension}"
+
+
+def to_ndjson_line(record:dict) -> bytes:
+    return (json.dumps(record, separators=(',', ':')) + '\n').encode('utf-8')
+
+
+class S3NdjsonSink:
+    """
+    Streams auction records to S3 as newline-delimited JSON using a multipart upload.
+
+    Records are buffered until a part is full, so memory stays at roughly one part
+    regardless of how many auctions a run handles. Safe to write to from multiple threads.
+    """
+
+    def __init__(self, s3_client, bucket:str, key:str=None, part_size:int=8 * 1024 * 1024):
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key or daily_key()
+        self.part_size = max(part_size, MIN_PART_SIZE)
+        self.buffer = io.BytesIO()
+        self.parts = []
+        self.records = 0
+        self.upload_id = None
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def _upload_part(self):
+        if self.upload_id is None:
+            response = self.s3_client.create_multipart_upload(Bucket=self.bucket, Key=self.key)
+            self.upload_id = response['UploadId']
+
+        part_number = len(self.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+            PartNumber=part_number, Body=self.buffer.getvalue()
+        )
+        self.parts.append({'ETag': response['ETag'], 'PartNumber': part_number})
+        logger.info(f"Uploaded part {part_number} of s3://{self.bucket}/{self.key}")
+        self.buffer = io.BytesIO()
+
+    def write(self, record:dict):
+        with self._lock:
+            if self.failed:
+                return
+            self.buffer.write(to_ndjson_line(record))
+            self.records += 1
+            if self.buffer.tell() >= self.part_size:
+                try:
+                    self._upload_part()
+                except Exception as e:
+                    logger.error(f"Error uploading part to s3: {e}", exc_info=True)
+                    self.abort()
+
+    def abort(self):
+        self.failed = True
+        if self.upload_id is not None:
+            try:
+                self.s3_client.abort_multipart_upload(Bucket=self.bucket, Key=self.key, UploadId=self.upload_id)
+            except Exception as e:
+                logger.warning(f"Error aborting multipart upload: {e}", exc_info=True)
+            self.upload_id = None
+
+    def close(self) -> bool:
+        """
+        Uploads whatever is left in the buffer and completes the upload.
+
+        Returns:
+            bool: True if every record made it to S3.
+        """
+        with self._lock:
+            if self.failed:
+                return False
+            try:
+                if self.upload_id is None:
+                    # everything fits in one part
+                    self.s3_client.put_object(Bucket=self.bucket, Key=self.key, Body=self.buffer.getvalue())
+                else:
+                    if self.buffer.tell():
+                        self._upload_part()
+                    self.s3_client.complete_multipart_upload(
+                        Bucket=self.bucket, Key=self.key, UploadId=self.upload_id,
+                        MultipartUpload={'Parts': self.parts}
+                    )
+                    # completed, there's nothing left for abort() to cancel
+                    self.upload_id = None
+                logger.info(f"{self.records} auctions uploaded to s3://{self.bucket}/{self.key}")
+                return True
+            except Exception as e:
+                logger.error(f"Error uploading auctions to s3 bucket: {e}", exc_info=True)
+                self.abort()
+                return False
+
+
+class LocalNdjsonSink:
+    """
+    Writes auction records to a local newline-delimited JSON spool file, one line per auction.
+
+    Like the S3 upload, the file only appears once the sink is closed: records go to <file>.part, which
+    replaces the file on close() and is deleted on abort(), so a failed run leaves nothing behind and a rerun
+    doesn't add to an earlier run's records.
+    """
+
+    def __init__(self, spool_dir:str='spool', file_name:str=None):
+        os.makedirs(spool_dir, exist_ok=True)
+        self.path = os.path.join(spool_dir, file_name or daily_key())
+        self.part_path = f"{self.path}.part"
+        self.file = open(self.part_path, 'wb')
+        self.records = 0
+        self.failed = False
+        self._lock = threading.Lock()
+
+    def write(self, record:dict):
+        with self._lock:
+            if self.failed:
+                return
+            self.file.write(to_ndjson_line(record))
+            self.file.flush()
+            self.records += 1
+
+    def abort(self):
+        with self._lock:
+            self.failed = True
+            self.file.close()
+            if os.path.exists(self.part_path):
+                os.remove(self.part_path)
+
+    def close(self) -> bool:
+        with self._lock:
+            if self.failed:
+                return False
+            if self.file.closed:
+                return True
+            self.file.close()
+            os.replace(self.part_path, self.path)
+            logger.info(f"{self.records} auctions written to {os.path.abspath(self.path)}")
+            return True
+
+
+class MultiSink:
+    """
+    Fans every record out to several sinks, e.g. raw NDJSON plus Parquet.
+    """
+
+    def __init__(self, sinks:list):
+        self.sinks = sinks
+
+    def write(self, record:dict):
+        for sink in self.sinks:
+            sink.write(record)
+
+    def abort(self):
+        for sink in self.sinks:
+            sink.abort()
+
+    def close(self) -> bool:
+        """
+        Closes every sink. Returns True only if all of them succeeded, otherwise every sink is aborted, so a failed
+        run doesn't leave e.g. its Parquet files behind to be written again by the rerun.
+        """
+        results = [sink.close() for sink in self.sinks]
+        if not all(results):
+            self.abort()
+        return all(results)
+
+
+def setup_sink(sink_type:str, s3_client=None, bucket:str=None, spool_dir:str='spool', key:str=None,
+               parquet:str=None, parquet_bucket:str=None):
+    """
+    Returns the sink for `sink_type`: 's3' (multipart upload to bucket) or 'local' (spool file), named `key`
+    (defaults to daily_key()). With `parquet` ('s3' or 'local'), records are also written as Parquet.
+    """
+    if sink_type == 'local':
+        sink = LocalNdjsonSink(spool_dir, key)
+    elif sink_type == 's3':
+        sink = S3NdjsonSink(s3_client, bucket, key)
+    else:
+        raise ValueError(f"Unknown output sink: {sink_type}")
+
+    if parquet:
+        # pyarrow is only loaded when Parquet output is on
+        import parquet_sink
+    if parquet == 's3':
+        sink = MultiSink([sink, parquet_sink.ParquetSink(s3_client=s3_client, bucket=parquet_bucket or bucket)])
+    elif parquet == 'local':
+        sink = MultiSink([sink, parquet_sink.ParquetSink()])
+    return sink
@@ -9,6 +9,23 @@ logger = setup_json_logger()
 
 db_path = os.getenv('SQLITE_DB_PATH')
 
+# per-connection settings. WAL lets the checkpoint writes and readers (e.g. the html archive) run concurrently
+# and only fsyncs on checkpoint, so synchronous=NORMAL is still safe against corruption
+PRAGMAS = [
+    "PRAGMA synchronous = NORMAL;",
+    "PRAGMA cache_size = -65536;",     # 64MB page cache
+    "PRAGMA temp_store = MEMORY;",     # temp tables used for dedup live in memory
+    "PRAGMA mmap_size = 268435456;",   # 256MB
+    "PRAGMA busy_timeout = 5000;",
+]
+
+
+def apply_pragmas(conn):
+    """Applies PRAGMAS to a new connection."""
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    return conn
+
 
 def init_db(db_path:str=None):
     if not db_path:
@@ -18,6 +35,10 @@ def init_db(db_path:str=None):
     conn = sqlite3.connect(db_path)
     cur = conn.cursor()
     try:
+        # journal_mode is stored in the db file, so this only has to happen once
+        journal_mode = cur.execute("PRAGMA journal_mode = WAL;").fetchone()[0]
+        logger.info(f'Journal mode: {journal_mode}')
+
         logger.info('Creating urls table')
         cur.execute(
         """
@@ -29,11 +50,148 @@ def init_db(db_path:str=None):
         """
         )
         logger.info('URLs table successfully created')
+
+        # per-auction checkpoint so a failed run can be resumed without re-fetching pages.
+        # state: discovered -> scraped (payload holds the auction JSON) -> uploaded, or dead once it's out of retries
+        logger.info('Creating auction_staging table')
+        cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS auction_staging(
+                auction_id TEXT PRIMARY KEY,
+                url TEXT,
+                state TEXT NOT NULL DEFAULT 'discovered',
+                payload TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_auction_staging_state ON auction_staging(state);")
+        logger.info('auction_staging table successfully created')
+
+        # auctions whose scrape failed, retried with exponential backoff until they move to
+        # auction_dead_letters (see retries.py)
+        logger.info('Creating retry tables')
+        cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS auction_retries(
+                auction_id TEXT PRIMARY KEY,
+                url TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                next_attempt_at TIMESTAMP,
+                last_error TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+        )
+        cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS auction_dead_letters(
+                auction_id TEXT PRIMARY KEY,
+                url TEXT,
+                attempts INTEGER,
+                last_error TEXT,
+                failed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+        )
+        logger.info('Retry tables successfully created')
+
+        # index of the raw HTML archive (see html_archive.py)
+        logger.info('Creating html_archive table')
+        cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS html_archive(
+                id INTEGER PRIMARY KEY,
+                url TEXT NOT NULL,
+                page_type TEXT NOT NULL,
+                fetched_at TIMESTAMP NOT NULL,
+                sha256 TEXT NOT NULL,
+                size INTEGER
+            );
+        """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_html_archive_url ON html_archive(url, fetched_at);")
+        logger.info('html_archive table successfully created')
+
+        # full-archive backfill (see backfill.py): listing page ranges and their progress.
+        # state: pending -> running -> done (or failed, retried by the next backfill run until it has been
+        # attempted BACKFILL_MAX_ATTEMPTS times, then dead)
+        logger.info('Creating backfill tables')
+        cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS backfill_shards(
+                shard_id INTEGER PRIMARY KEY,
+                first_page INTEGER NOT NULL,
+                last_page INTEGER NOT NULL,
+                next_page INTEGER NOT NULL,
+                state TEXT NOT NULL DEFAULT 'pending',
+                worker_pid INTEGER,
+                auctions_scraped INTEGER NOT NULL DEFAULT 0,
+                auctions_failed INTEGER NOT NULL DEFAULT 0,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                error TEXT,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+        )
+        # per-auction checkpoint of the backfill, kept apart from auction_staging so daily runs don't pick it up.
+        # state: discovered -> scraped (payload holds the auction JSON) -> uploaded, or dead once it has failed
+        # in RETRY_MAX_ATTEMPTS runs (it's then in auction_dead_letters)
+        cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS backfill_auctions(
+                auction_id TEXT PRIMARY KEY,
+                shard_id INTEGER NOT NULL,
+                url TEXT,
+                state TEXT NOT NULL DEFAULT 'discovered',
+                payload TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_backfill_auctions_shard ON backfill_auctions(shard_id, state);")
+        logger.info('Backfill tables successfully created')
+
+        # url batches handed from the discover stage to the scrape and publish stages (see stages.py).
+        # state: pending -> scraping -> scraped -> publishing -> published. A claim is only held until
+        # lease_expires_at, so a batch whose worker died is picked up again
+        logger.info('Creating stage tables')
+        cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS url_batches(
+                batch_id INTEGER PRIMARY KEY,
+                state TEXT NOT NULL DEFAULT 'pending',
+                auctions INTEGER NOT NULL DEFAULT 0,
+                worker_pid INTEGER,
+                lease_expires_at TIMESTAMP,
+                not_before TIMESTAMP,
+                output_key TEXT,
+                error TEXT,
+                created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            );
+        """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_url_batches_state ON url_batches(state);")
+        # the auctions of each batch, their state and payload live in auction_staging
+        cur.execute(
+        """
+            CREATE TABLE IF NOT EXISTS url_batch_items(
+                auction_id TEXT PRIMARY KEY,
+                batch_id INTEGER NOT NULL
+            );
+        """
+        )
+        cur.execute("CREATE INDEX IF NOT EXISTS idx_url_batch_items_batch ON url_batch_items(batch_id);")
+        logger.info('Stage tables successfully created')
         conn.commit()
     except Exception as e:
-        logger.error(f"Error creating urls table: {e}", exc_info=True)
+        logger.error(f"Error creating tables: {e}", exc_info=True)
     finally:
         cur.close()
         conn.close()
 
-init_db(db_path)
\ No newline at end of file
+
+if __name__ == "__main__":
+    init_db(db_path)
\ No newline at end of file
@@ -0,0 +1,441 @@
+"""
+Discovery, detail scraping and publishing as separate stages, handing work to each other through the tracking db:
+
+    discover -> url_batches / url_batch_items (+ auction_staging)
+    scrape   -> auction_staging payloads, batch state 'scraped'
+    publish  -> NDJSON (and Parquet) output, urls table
+
+Each stage can be run on its own, as often as needed and with its own concurrency. Batches are claimed
+atomically, so several scrape stages can run at once without scraping the same auctions. Selenium is only
+imported by the stages that use it.
+"""
+import json
+import os
+import threading
+from datetime import datetime, timedelta
+
+from dotenv import load_dotenv
+
+import http_fetch
+import metrics
+import notify
+import retries
+import seen_index
+import sinks
+import sqlite_setup
+import utils
+from logger import setup_json_logger
+
+load_dotenv()
+logger = setup_json_logger()
+
+db_path = os.getenv('SQLITE_DB_PATH')
+max_pages_to_scrape = os.getenv('MAX_PAGES_TO_SCRAPE')
+scraper_workers = os.getenv('SCRAPER_WORKERS')
+raw_auctions_bucket = os.getenv("RAW_AUCTIONS_BUCKET")
+output_sink = os.getenv('OUTPUT_SINK', 's3')
+parquet_output = os.getenv('PARQUET_OUTPUT')
+parquet_bucket = os.getenv('PARQUET_BUCKET') or raw_auctions_bucket
+ntfy_topic = os.getenv('NTFY_TOPIC')
+
+# auctions per url batch, the unit of work claimed by the scrape stage
+stage_batch_size = int(os.getenv('STAGE_BATCH_SIZE', 50))
+# how long a claimed batch stays with its worker without progress before another worker can take it over
+stage_lease_seconds = int(os.getenv('STAGE_LEASE_SECONDS', 900))
+
+BATCH_STATES = ('pending', 'scraping', 'scraped', 'publishing', 'published')
+
+
+def create_batches(conn, cursor, batch_size:int=None) -> list:
+    """
+    Splits the staged auctions that aren't in a batch yet into url batches of `batch_size`, in the order they
+    were discovered. This includes auctions left in auction_staging by a failed daily run.
+
+    Returns:
+        list: The new batch ids.
+    """
+    batch_size = batch_size or stage_batch_size
+    ids = [row[0] for row in cursor.execute(
+        """
+            SELECT s.auction_id
+            FROM auction_staging s
+            WHERE s.state = 'discovered'
+              AND NOT EXISTS (SELECT 1 FROM url_batch_items i WHERE i.auction_id = s.auction_id)
+            ORDER BY s.rowid;
+        """
+    )]
+    batch_ids = []
+    for batch in utils.batched(ids, batch_size):
+        cursor.execute("INSERT INTO url_batches(auctions) VALUES(?)", (len(batch),))
+        batch_id = cursor.lastrowid
+        cursor.executemany(
+            "INSERT INTO url_batch_items(auction_id, batch_id) VALUES(?, ?)", [(id, batch_id) for id in batch]
+        )
+        batch_ids.append(batch_id)
+    conn.commit()
+    return batch_ids
+
+
+def claim_batches(conn, cursor, state:str, claimed_state:str, limit:int=1) -> list:
+    """
+    Atomically moves up to `limit` batches from `state` to `claimed_state` for this process. Batches held in
+    `claimed_state` by a worker whose lease ran out are taken over, and pending batches waiting out a retry
+    backoff (not_before) are left alone.
+
+    Returns:
+        list: The claimed batch ids, oldest first.
+    """
+    # IMMEDIATE takes the write lock up front, so two workers can't read the same batch
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        rows = cursor.execute(
+            """
+                UPDATE url_batches
+                SET state = ?, worker_pid = ?, lease_expires_at = datetime('now', ?), error = NULL,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE batch_id IN (
+                    SELECT batch_id FROM url_batches
+                    WHERE (state = ? AND (not_before IS NULL OR not_before <= datetime('now')))
+                       OR (state = ? AND lease_expires_at <= datetime('now'))
+                    ORDER BY batch_id
+                    LIMIT ?
+                )
+                RETURNING batch_id
+            """,
+            (claimed_state, os.getpid(), f'+{stage_lease_seconds} seconds', state, claimed_state, limit)
+        ).fetchall()
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return sorted(row[0] for row in rows)
+
+
+def renew_lease(cursor, batch_id:int):
+    cursor.execute(
+        "UPDATE url_batches SET lease_expires_at = datetime('now', ?), updated_at = CURRENT_TIMESTAMP WHERE batch_id = ?",
+        (f'+{stage_lease_seconds} seconds', batch_id)
+    )
+
+
+def batch_urls(cursor, batch_id:int) -> list:
+    """The batch's auctions that still have to be scraped and aren't waiting out a retry backoff."""
+    return [row[0] for row in cursor.execute(
+        """
+            SELECT s.url
+            FROM url_batch_items i
+            JOIN auction_staging s ON s.auction_id = i.auction_id
+            WHERE i.batch_id = ? AND s.state = 'discovered'
+              AND NOT EXISTS (
+                  SELECT 1 FROM auction_retries r
+                  WHERE r.auction_id = s.auction_id AND r.next_attempt_at > datetime('now')
+              )
+            ORDER BY s.rowid;
+        """,
+        (batch_id,)
+    )]
+
+
+def scraped_payloads(cursor, batch_ids:list) -> list:
+    """
+    (url, payload) of every scraped auction in `batch_ids`, in the order they were discovered. The batch ids go
+    through a temp table, like utils.filter_urls, so there's no limit on how many batches are published at once.
+    """
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS publish_batches(batch_id INTEGER PRIMARY KEY);")
+    cursor.execute("DELETE FROM temp.publish_batches;")
+    try:
+        cursor.executemany("INSERT INTO temp.publish_batches(batch_id) VALUES(?)", [(id,) for id in batch_ids])
+        return cursor.execute(
+            """
+                SELECT s.url, s.payload
+                FROM temp.publish_batches p
+                JOIN url_batch_items i ON i.batch_id = p.batch_id
+                JOIN auction_staging s ON s.auction_id = i.auction_id
+                WHERE s.state = 'scraped'
+                ORDER BY s.rowid;
+            """
+        ).fetchall()
+    finally:
+        cursor.execute("DELETE FROM temp.publish_batches;")
+
+
+def settle_batch(cursor, batch_id:int) -> bool:
+    """
+    Moves a batch on to 'scraped' once every auction in it is scraped or dead-lettered. Otherwise it goes back
+    to 'pending', not to be claimed before its first failed auction comes due for a retry.
+
+    Returns:
+        bool: True if the batch is ready to publish.
+    """
+    remaining, next_attempt_at = cursor.execute(
+        """
+            SELECT COUNT(*), MIN(r.next_attempt_at)
+            FROM url_batch_items i
+            JOIN auction_staging s ON s.auction_id = i.auction_id
+            LEFT JOIN auction_retries r ON r.auction_id = i.auction_id
+            WHERE i.batch_id = ? AND s.state = 'discovered'
+        """,
+        (batch_id,)
+    ).fetchone()
+    if remaining:
+        cursor.execute(
+            """
+                UPDATE url_batches
+                SET state = 'pending', worker_pid = NULL, lease_expires_at = NULL, not_before = ?,
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE batch_id = ?
+            """,
+            (next_attempt_at, batch_id)
+        )
+        return False
+    cursor.execute(
+        """
+            UPDATE url_batches
+            SET state = 'scraped', worker_pid = NULL, lease_expires_at = NULL, not_before = NULL,
+                updated_at = CURRENT_TIMESTAMP
+            WHERE batch_id = ?
+        """,
+        (batch_id,)
+    )
+    return True
+
+
+def get_status(cursor) -> dict:
+    """Number of batches and auctions in each batch state."""
+    status = {state: {'batches': 0, 'auctions': 0} for state in BATCH_STATES}
+    for state, batches, auctions in cursor.execute(
+        "SELECT state, COUNT(*), COALESCE(SUM(auctions), 0) FROM url_batches GROUP BY state"
+    ):
+        status[state] = {'batches': batches, 'auctions': auctions}
+    return status
+
+
+def format_status(status:dict) -> str:
+    return "Batches: " + ", ".join(
+        f"{state} {counts['batches']} ({counts['auctions']} auctions)" for state, counts in status.items()
+    )
+
+
+def batch_key(batch_ids:list) -> str:
+    """Object/file name for a publish of `batch_ids`: auctions_<prev_date>_batches_<first>-<last>.ndjson"""
+    prev_date = datetime.now().date() - timedelta(days=1)
+    return f"auctions_{prev_date}_batches_{batch_ids[0]:06d}-{batch_ids[-1]:06d}.ndjson"
+
+
+def run_discover(max_pages:int=None, batch_size:int=None) -> list:
+    """
+    Discover stage: scrapes the listing pages (stopping at the first page of already known auctions, at most
+    `max_pages` pages), stages the new auctions in auction_staging and splits them into url batches for the
+    scrape stage. Auctions that are already staged, batched or in the urls table are skipped, so it can be run
+    as often as needed.
+
+    Returns:
+        list: The new batch ids.
+    """
+    import driver_setup
+    import scrape_auction_urls
+
+    run_metrics = metrics.reset()
+    success = False
+    sqlite_setup.init_db(db_path)
+    conn, cursor = utils.db_connection(db_path)
+    fetcher = None
+    try:
+        filter_new = seen_index.get_index(cursor).staged_filter(cursor)
+
+        page_count = int(max_pages or max_pages_to_scrape or 1)
+        fetcher = http_fetch.setup_fetcher(user_agent=driver_setup.get_user_agent())
+        with metrics.span('discovery'):
+            daily_urls = scrape_auction_urls.discover_auction_urls(page_count, fetcher=fetcher, filter_new=filter_new)
+
+        with metrics.span('filter'):
+            new_urls = filter_new(daily_urls)
+            utils.stage_urls(cursor, new_urls)
+            conn.commit()
+            batch_ids = create_batches(conn, cursor, batch_size)
+
+        logger.info(
+            f"Discovered {len(daily_urls)} urls, {len(new_urls)} new. {len(batch_ids)} new batches. "
+            f"{format_status(get_status(cursor))}"
+        )
+        success = True
+        return batch_ids
+    finally:
+        if fetcher:
+            fetcher.close()
+        cursor.close()
+        conn.close()
+        run_metrics.export(stage='discover', success=success)
+
+
+def run_scrape(workers:int=None, max_batches:int=None) -> int:
+    """
+    Scrape stage: claims pending url batches one at a time and scrapes their auctions across `workers` drivers,
+    checkpointing each auction in auction_staging. Several of these can run at once, each batch is only ever
+    claimed by one of them. Failed auctions are retried with backoff (see retries.py), so a batch is only
+    handed to the publish stage once each of its auctions is scraped or dead-lettered.
+
+    Stops once no batch is ready to be claimed, or after `max_batches` batches.
+
+    Returns:
+        int: The number of batches claimed.
+    """
+    import driver_pool
+    import driver_setup
+
+    run_metrics = metrics.reset()
+    success = False
+    sqlite_setup.init_db(db_path)
+    conn, cursor = utils.db_connection(db_path, check_same_thread=False)
+    db_lock = threading.Lock()
+    workers = workers or (int(scraper_workers) if scraper_workers else 1)
+    fetcher = http_fetch.setup_fetcher(pool_size=workers, user_agent=driver_setup.get_user_agent())
+    claimed = 0
+    try:
+        while not max_batches or claimed < max_batches:
+            with db_lock:
+                batch_ids = claim_batches(conn, cursor, 'pending', 'scraping')
+            if not batch_ids:
+                break
+            batch_id = batch_ids[0]
+            claimed += 1
+
+            def checkpoint(url, auction_data):
+                with db_lock:
+                    utils.mark_scraped(cursor, url, auction_data)
+                    retries.record_success(cursor, [url])
+                    renew_lease(cursor, batch_id)
+                    conn.commit()
+
+            def record_failure(url, error):
+                with db_lock:
+                    retries.record_failure(cursor, url, error)
+                    renew_lease(cursor, batch_id)
+                    conn.commit()
+
+            try:
+                with db_lock:
+                    urls = batch_urls(cursor, batch_id)
+                logger.info(f"Scraping batch {batch_id}: {len(urls)} auctions")
+                with metrics.span('detail_scrape'):
+                    _, worker_stats = driver_pool.scrape_auctions(
+                        urls, workers, fetcher=fetcher, on_result=checkpoint, on_error=record_failure
+                    )
+                if worker_stats:
+                    logger.info(f"Batch {batch_id} worker throughput:\n{driver_pool.format_worker_stats(worker_stats)}")
+                with db_lock:
+                    ready = settle_batch(cursor, batch_id)
+                    conn.commit()
+                logger.info(f"Batch {batch_id} {'scraped' if ready else 'has auctions waiting for a retry'}")
+            except Exception as e:
+                logger.error(f"Batch {batch_id} failed: {e}", exc_info=True)
+                with db_lock:
+                    conn.rollback()
+                    cursor.execute(
+                        """
+                            UPDATE url_batches
+                            SET state = 'pending', worker_pid = NULL, lease_expires_at = NULL, error = ?,
+                                updated_at = CURRENT_TIMESTAMP
+                            WHERE batch_id = ?
+                        """,
+                        (str(e), batch_id)
+                    )
+                    conn.commit()
+
+        for summary in (metrics.latency_summary(), retries.summary(), format_status(get_status(cursor))):
+            if summary:
+                logger.info(summary)
+        success = True
+        return claimed
+    finally:
+        if fetcher:
+            fetcher.close()
+        cursor.close()
+        conn.close()
+        run_metrics.export(stage='scrape', success=success)
+
+
+def run_publish(max_batches:int=None) -> int:
+    """
+    Publish stage: claims the scraped batches (at most `max_batches`), writes their auctions from the checkpoint
+    payloads as one NDJSON object (see batch_key), plus Parquet if PARQUET_OUTPUT is set, and once that's
+    uploaded inserts them into the urls table. If the upload fails, the batches go back to 'scraped' for the
+    next publish.
+
+    Returns:
+        int: The number of auctions published.
+    """
+    run_metrics = metrics.reset()
+    success = False
+    sqlite_setup.init_db(db_path)
+    conn, cursor = utils.db_connection(db_path)
+    sink = None
+    try:
+        batch_ids = claim_batches(conn, cursor, 'scraped', 'publishing', max_batches or -1)
+        if not batch_ids:
+            logger.info("No scraped batches to publish")
+            success = True
+            return 0
+
+        key = batch_key(batch_ids)
+        s3_client = None
+        if 's3' in (output_sink, parquet_output):
+            import boto3
+            s3_client = boto3.client("s3")
+        sink = sinks.setup_sink(
+            output_sink, s3_client, raw_auctions_bucket, key=key, parquet=parquet_output, parquet_bucket=parquet_bucket
+        )
+
+        rows = scraped_payloads(cursor, batch_ids)
+        for _, payload in rows:
+            sink.write(json.loads(payload))
+        with metrics.span('upload'):
+            uploaded = sink.close()
+        sink = None
+
+        urls = [url for url, _ in rows]
+        if not uploaded:
+            cursor.executemany(
+                """
+                    UPDATE url_batches
+                    SET state = 'scraped', worker_pid = NULL, lease_expires_at = NULL, error = 'upload failed',
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE batch_id = ?
+                """,
+                [(batch_id,) for batch_id in batch_ids]
+            )
+            conn.commit()
+            logger.warning(f"Upload of {key} failed, batches {batch_ids} will be published by the next run")
+            if ntfy_topic:
+                notify.send_notification(ntfy_topic, f"Upload of {key} failed")
+            return 0
+
+        with metrics.span('db_insert'):
+            inserted = utils.insert_urls(cursor, urls)
+            utils.mark_uploaded(cursor, urls)
+            cursor.executemany(
+                """
+                    UPDATE url_batches
+                    SET state = 'published', worker_pid = NULL, lease_expires_at = NULL, output_key = ?,
+                        updated_at = CURRENT_TIMESTAMP
+                    WHERE batch_id = ?
+                """,
+                [(key, batch_id) for batch_id in batch_ids]
+            )
+            conn.commit()
+        seen = seen_index.get_index(cursor)
+        seen.add(urls)
+        seen.save_snapshot(cursor)
+
+        summary = f"Published {len(urls)} auctions from {len(batch_ids)} batches to {key}, {inserted} urls inserted into db"
+        logger.info(summary)
+        if ntfy_topic:
+            notify.send_notification(ntfy_topic, summary)
+        success = True
+        return len(urls)
+    finally:
+        if sink:
+            sink.abort()
+        cursor.close()
+        conn.close()
+        run_metrics.export(stage='publish', success=success)
@@ -1,28 +1,37 @@
 import os
-from datetime import datetime, timedelta
-import pandas as pd
 from dotenv import load_dotenv
 import sqlite3
 import csv
 import json
-import boto3
-import argparse
+from itertools import islice
 
 from logger import setup_json_logger
+from sqlite_setup import apply_pragmas
+from seen_index import auction_id
 
 load_dotenv()
 logger = setup_json_logger()
 
 sqlite_db_path = os.getenv('SQLITE_DB_PATH')
 
+# rows per executemany batch for bulk loads and upserts
+BATCH_SIZE = 50_000
 
-def db_connection(db_path:str=None):
+
+def batched(iterable, size:int=BATCH_SIZE):
+    """Yields lists of up to `size` items from iterable."""
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def db_connection(db_path:str=None, check_same_thread:bool=True):
     if not db_path:
         db_path = 'carsnbids.db'
 
     logger.info("Connecting to db")
     try:
-        conn = sqlite3.connect(db_path)
+        conn = apply_pragmas(sqlite3.connect(db_path, check_same_thread=check_same_thread))
         cursor = conn.cursor()
         logger.info("DB connection successfull")
         return conn, cursor
@@ -39,6 +48,7 @@ def insert_urls(cursor, urls: list):
 
     Each URL contains an auction ID, which is extracted and used as the primary key.
     If a URL with the same auction ID already exists, it is ignored (ON CONFLICT DO NOTHING).
+    Rows are upserted in batches of BATCH_SIZE so large imports don't build one huge parameter list.
 
     Args:
         cursor (sqlite3.Cursor): An active SQLite cursor object.
@@ -47,19 +57,16 @@ def insert_urls(cursor, urls: list):
     Returns:
         int: The number of rows successfully inserted into the database.
     """
-    urls_data = []
-
-    for url in urls:
-        # Extract the auction ID from the URL (second last part of the path)
-        auction_id = url.split("/")[-2]
-        urls_data.append({'auction_id': auction_id, 'url': url})
-
-    # Perform a batch insert using named parameters; ignore duplicates
-    cursor.executemany(
-        "INSERT INTO urls(auction_id, url) VALUES(:auction_id, :url) ON CONFLICT(auction_id) DO NOTHING",
-        urls_data
-    )
-    inserted = cursor.rowcount
+    urls_data = ({'auction_id': auction_id(url), 'url': url} for url in urls)
+
+    inserted = 0
+    for batch in batched(urls_data):
+        # Perform a batch insert using named parameters; ignore duplicates
+        cursor.executemany(
+            "INSERT INTO urls(auction_id, url) VALUES(:auction_id, :url) ON CONFLICT(auction_id) DO NOTHING",
+            batch
+        )
+        inserted += cursor.rowcount
     return inserted  # Number of rows successfully inserted
 
 
@@ -67,6 +74,9 @@ def filter_urls(cursor, urls:list)->list:
     """
     Filters out URLs that already exist in the database.
 
+    The candidate auction ids are bulk loaded into a temp table and anti-joined against urls, so the
+    query plan doesn't depend on the number of urls and there's no limit on how many can be checked at once.
+
     Args:
         cursor (sqlite3.Cursor): Database cursor.
         urls (list): List of URLs to check.
@@ -78,8 +88,7 @@ def filter_urls(cursor, urls:list)->list:
     auctions = {}
     for url in urls:
         try:
-            auction_id = url.split("/")[-2]
-            auctions[auction_id]=url
+            auctions[auction_id(url)]=url
         except Exception as e:
             logger.error(f"Error processing url ({url}): {e}", exc_info=True)
             continue
@@ -89,44 +98,92 @@ def filter_urls(cursor, urls:list)->list:
         return []
     
     
-    auction_ids = list(auctions.keys()) # generate list of auction ids
-    placeholders = ",".join('?' for _ in auction_ids) # generate placeholders
-    query = f"""
-        SELECT auction_id
-        FROM urls
-        WHERE auction_id in ({placeholders});
-    """
-    cursor.execute(query, auction_ids)
-    existing_urls = cursor.fetchall()
-    existing_ids = {row[0] for row in existing_urls}
-    new_urls = [auctions[id] for id in auction_ids if id not in existing_ids]
+    cursor.execute("CREATE TEMP TABLE IF NOT EXISTS candidate_urls(auction_id TEXT, url TEXT);")
+    cursor.execute("DELETE FROM temp.candidate_urls;")
+    try:
+        for batch in batched(auctions.items()):
+            cursor.executemany("INSERT INTO temp.candidate_urls(auction_id, url) VALUES(?, ?)", batch)
+
+        query = """
+            SELECT c.url
+            FROM temp.candidate_urls c
+            WHERE NOT EXISTS (SELECT 1 FROM urls u WHERE u.auction_id = c.auction_id)
+            ORDER BY c.rowid;
+        """
+        new_urls = [row[0] for row in cursor.execute(query)]
+    finally:
+        cursor.execute("DELETE FROM temp.candidate_urls;")
 
     return new_urls
 
 
 
-def upload_to_s3(s3_client, auction_data:list, bucket):
+def stage_urls(cursor, urls:list) -> int:
     """
-    Uploads auction data to an S3 bucket as a JSON file.
+    Records newly discovered auction URLs in the auction_staging table.
 
-    Args:
-        auction_data (list): List of auction dictionaries to upload.
-        bucket (str): Name of the target S3 bucket.
+    URLs that are already staged keep their current state (and payload, if already scraped).
+
+    Returns:
+        int: The number of newly staged URLs.
+    """
+    urls_data = ({'auction_id': auction_id(url), 'url': url} for url in urls)
+    staged = 0
+    for batch in batched(urls_data):
+        cursor.executemany(
+            "INSERT INTO auction_staging(auction_id, url) VALUES(:auction_id, :url) ON CONFLICT(auction_id) DO NOTHING",
+            batch
+        )
+        staged += cursor.rowcount
+    return staged
+
+
+def get_staged_auctions(cursor) -> list:
+    """
+    Returns the staged auctions that haven't been uploaded yet, in the order they were discovered.
+    Auctions waiting out a retry backoff and dead-lettered auctions are left out (see retries.py), and so are
+    auctions handed to the scrape stage in a url batch (see stages.py).
 
-    The file will be named using the format: 'auctions_<prev_date>.json',
-    where <prev_date> is the previous day's date in YYYY-MM-DD format.
+    Returns:
+        list: (url, state, payload) tuples. payload is the auction JSON for 'scraped' rows, else None.
+    """
+    query = """
+        SELECT s.url, s.state, s.payload
+        FROM auction_staging s
+        WHERE s.state NOT IN ('uploaded', 'dead')
+          AND NOT EXISTS (
+              SELECT 1 FROM auction_retries r
+              WHERE r.auction_id = s.auction_id AND r.next_attempt_at > datetime('now')
+          )
+          AND NOT EXISTS (SELECT 1 FROM url_batch_items i WHERE i.auction_id = s.auction_id)
+        ORDER BY s.rowid;
     """
+    return cursor.execute(query).fetchall()
+
+
+def mark_scraped(cursor, url:str, auction_data:dict):
+    """Stores the scraped auction payload and moves the staged auction to 'scraped'."""
+    cursor.execute(
+        """
+            UPDATE auction_staging
+            SET state = 'scraped', payload = ?, updated_at = CURRENT_TIMESTAMP
+            WHERE auction_id = ?
+        """,
+        (json.dumps(auction_data), auction_id(url))
+    )
 
-    prev_date = datetime.now().date() - timedelta(days=1)
-    key = f"auctions_{prev_date}.json"
 
-    json_data = json.dumps(auction_data, indent=3)
-    try:
-        logger.info('Uploading auctions to s3')
-        s3_client.put_object(Bucket=bucket,Key=key, Body=json_data)
-        return True
-    except Exception as e:
-        logger.error(f"Error uploading auctions to s3 bucket: {e}", exc_info=True)
+def mark_uploaded(cursor, urls:list):
+    """Moves staged auctions to 'uploaded' and drops their payloads, which now live in S3."""
+    for batch in batched((auction_id(url),) for url in urls):
+        cursor.executemany(
+            """
+                UPDATE auction_staging
+                SET state = 'uploaded', payload = NULL, updated_at = CURRENT_TIMESTAMP
+                WHERE auction_id = ?
+            """,
+            batch
+        )
 
 
 def export_db_urls_to_csv(conn=None, cursor=None, file_path:str='auction_urls.csv'):
@@ -255,21 +312,8 @@ def stop_instance(ec2_client, instance_id:str):
 
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="CarsnBids Scraper Utilities")
-    subparsers = parser.add_subparsers(dest='action', required=True, help="What action you want to do")
-
-    # export action
-    export_parser = subparsers.add_parser('export_urls', help="Export auction urls from DB to csv file")
-    export_parser.add_argument("--file", type=str, default='auction_urls.csv', help="CSV file path to export to")
-
-    # import parser
-    import_parser = subparsers.add_parser('import_urls', help='Import auction urls from CSV to DB')
-    import_parser.add_argument("--file", type=str, default='auction_urls.csv', help="CSV file path to import from")
-
-    args = parser.parse_args()
-
-    if args.action == 'export_urls':
-        export_db_urls_to_csv(file_path=args.file)
-    elif args.action == 'import_urls':
-        import_urls_from_csv(file_path=args.file)
+    # kept so `python utils.py ...` still works, cli.py is the entry point
+    import sys
+    import cli
 
+    cli.main(sys.argv[1:])
@@ -0,0 +1,58 @@
+import os
+import sys
+import tempfile
+
+import pytest
+
+# the modules read their settings when they're imported, so these have to be in place before any test imports them
+_scratch = tempfile.mkdtemp(prefix='carsnbids_tests_')
+os.environ['LOG_FILE'] = os.path.join(_scratch, 'logs.json')
+os.environ['SQLITE_DB_PATH'] = os.path.join(_scratch, 'carsnbids.db')
+os.environ['METRICS_DIR'] = os.path.join(_scratch, 'metrics')
+os.environ['RATE_LIMIT_RPS'] = '0'
+os.environ['NTFY_TOPIC'] = ''
+os.environ.pop('HTML_ARCHIVE_DIR', None)
+os.environ.pop('PARQUET_OUTPUT', None)
+# moto (and any stray boto3 client) must never reach real AWS
+os.environ['AWS_ACCESS_KEY_ID'] = 'testing'
+os.environ['AWS_SECRET_ACCESS_KEY'] = 'testing'
+os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+
+# the benchmark fixture server maps site urls onto benchmarks/fixtures
+BENCHMARKS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'benchmarks')
+sys.path.insert(0, os.path.abspath(BENCHMARKS_DIR))
+
+
+@pytest.fixture
+def db(tmp_path):
+    """A fresh tracking db: (db_path, conn, cursor)."""
+    import sqlite_setup
+    import utils
+
+    db_path = str(tmp_path / 'carsnbids.db')
+    sqlite_setup.init_db(db_path)
+    conn, cursor = utils.db_connection(db_path)
+    yield db_path, conn, cursor
+    cursor.close()
+    conn.close()
+
+
+@pytest.fixture(scope='session')
+def fixture_server():
+    """Serves benchmarks/fixtures like the site: yields its base url."""
+    from run_benchmarks import start_fixture_server
+
+    server = start_fixture_server()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture
+def s3():
+    """A moto S3 client with an empty 'raw-auctions' bucket."""
+    boto3 = pytest.importorskip('boto3')
+    moto = pytest.importorskip('moto')
+    with moto.mock_aws():
+        client = boto3.client('s3', region_name='us-east-1')
+        client.create_bucket(Bucket='raw-auctions')
+        yield client
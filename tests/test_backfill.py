@@ -0,0 +1,94 @@
+import pytest
+
+import backfill
+import driver_setup
+import http_fetch
+import retries
+import utils
+
+
+def shard_states(cursor) -> dict:
+    return dict(cursor.execute("SELECT shard_id, state FROM backfill_shards"))
+
+
+def test_plan_shards_only_adds_the_new_pages(db):
+    _, conn, cursor = db
+
+    assert backfill.plan_shards(conn, cursor, 10, 4) == 3
+    assert backfill.plan_shards(conn, cursor, 10, 4) == 0
+    assert backfill.plan_shards(conn, cursor, 14, 4) == 1
+    assert cursor.execute("SELECT first_page, last_page FROM backfill_shards ORDER BY shard_id").fetchall() == [
+        (1, 4), (5, 8), (9, 10), (11, 14)
+    ]
+
+
+def test_claim_shard_hands_each_shard_out_once(db):
+    db_path, conn, cursor = db
+    backfill.plan_shards(conn, cursor, 4, 2)
+    other_conn, other_cursor = utils.db_connection(db_path)
+
+    assert backfill.claim_shard(conn, cursor) == (1, 1, 2, 1)
+    assert backfill.claim_shard(other_conn, other_cursor) == (2, 3, 4, 3)
+    assert backfill.claim_shard(conn, cursor) is None
+    other_cursor.close()
+    other_conn.close()
+
+
+def test_failed_shards_are_retried_until_they_are_dead(db, monkeypatch):
+    _, conn, cursor = db
+    monkeypatch.setattr(backfill, 'backfill_max_attempts', 2)
+    backfill.plan_shards(conn, cursor, 4, 2)
+
+    for _ in range(2):
+        assert backfill.claim_shard(conn, cursor)[0] == 1
+        cursor.execute("UPDATE backfill_shards SET state = 'failed' WHERE shard_id = 1")
+        # shard 2's worker died
+        cursor.execute("UPDATE backfill_shards SET state = 'running' WHERE shard_id = 2")
+        conn.commit()
+        backfill.plan_shards(conn, cursor, 4, 2)
+
+    assert shard_states(cursor) == {1: 'dead', 2: 'pending'}
+    assert backfill.get_progress(cursor)['shards_dead'] == 1
+    assert backfill.claim_shard(conn, cursor)[0] == 2
+
+
+@pytest.fixture
+def worker(db, monkeypatch):
+    db_path, conn, cursor = db
+    monkeypatch.setattr(driver_setup, 'get_user_agent', lambda: 'test')
+    worker = backfill.ShardWorker(1)
+    worker.conn, worker.cursor = conn, cursor
+    yield worker
+    worker.conn = worker.cursor = None
+    worker.close()
+
+
+def test_shard_worker_does_not_probe_the_listing(db, monkeypatch):
+    class Fetcher:
+        def get(self, url):
+            pytest.fail(f"fetched {url}")
+
+        def close(self):
+            pass
+
+    monkeypatch.setattr(driver_setup, 'get_user_agent', lambda: 'test')
+    monkeypatch.setattr(http_fetch, 'setup_fetcher', lambda **kwargs: Fetcher())
+
+    assert backfill.ShardWorker(1, listing_over_http=True).listing_fetcher is not None
+    assert backfill.ShardWorker(2).listing_fetcher is None
+
+
+def test_auction_that_keeps_failing_is_dead_lettered(worker, monkeypatch):
+    cursor = worker.cursor
+    monkeypatch.setattr(retries, 'retry_max_attempts', 2)
+    backfill.plan_shards(worker.conn, cursor, 1, 1)
+    url = "https://carsandbids.com/auctions/broken/car"
+    cursor.execute("INSERT INTO backfill_auctions(auction_id, shard_id, url) VALUES('broken', 1, ?)", (url,))
+
+    worker.record_failure(1, url, RuntimeError("no title"))
+    assert cursor.execute("SELECT state FROM backfill_auctions").fetchone()[0] == 'discovered'
+
+    worker.record_failure(1, url, RuntimeError("no title"))
+    assert cursor.execute("SELECT state FROM backfill_auctions").fetchone()[0] == 'dead'
+    assert cursor.execute("SELECT attempts, last_error FROM auction_dead_letters").fetchall() == [(2, "no title")]
+    assert cursor.execute("SELECT auctions_failed FROM backfill_shards").fetchone()[0] == 2
@@ -0,0 +1,140 @@
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from run_benchmarks import AUCTION_FIXTURES, fixture_url
+
+import driver_pool
+import driver_setup
+import http_fetch
+import scrape_auction
+from parse_auction import empty_auction_data
+
+
+class BlockedHandler(BaseHTTPRequestHandler):
+    """Answers every request the way a site that's pushing back does."""
+
+    def do_GET(self):
+        if self.path.startswith('/rate-limited'):
+            self.send_response(429)
+            self.send_header('Retry-After', '0')
+            body = b"Too many requests"
+        elif self.path.startswith('/with-challenge-script'):
+            # a normal page, Cloudflare adds this script to those too
+            self.send_response(200)
+            body = b"<html><head><title>2016 Audi S4</title><script src='/cdn-cgi/challenge-platform/scripts/jsd/main.js'></script></head></html>"
+        else:
+            self.send_response(403)
+            body = b"<html><head><title>Just a moment...</title></head><body><div id='cf-chl-widget'></div></body></html>"
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(scope='module')
+def blocked_server():
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BlockedHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+
+
+@pytest.fixture
+def fetcher():
+    fetcher = http_fetch.HttpFetcher(pool_size=2, timeout=5)
+    yield fetcher
+    fetcher.close()
+
+
+def test_scrape_auction_http_sold(fixture_server, fetcher):
+    url = fixture_url(fixture_server, 'sold')
+    auction_data = scrape_auction.scrape_auction_http(fetcher, url)
+
+    assert auction_data['auction_url'] == url
+    assert auction_data['auction_title'] == "2016 Audi S4 Premium Plus"
+    assert auction_data['auction_subtitle'] == "Supercharged V6, AWD, Premium Plus"
+    stats = auction_data['auction_stats']
+    assert stats['auction_status'] == 'Sold'
+    assert stats['buyer_username'] == 'winning_bidder'
+    assert stats['seller_username'] == 'gearhead_dan'
+    assert stats['highest_bid_value'] == '24,500'
+    assert (stats['bid_count'], stats['view_count'], stats['watcher_count']) == (28, 12611, 204)
+    assert stats['auction_date'] == 'Jun 7, 2025'
+    assert len(stats['bids']) == 28
+    assert stats['bid_history'][0] == {
+        'amount': 24500, 'bidder': 'bidder0', 'time': '2025-06-01T18:00:00+00:00', 'reputation': 405, 'is_verified': False,
+    }
+    assert auction_data['auction_quick_facts']['Make'] == 'Audi'
+    assert auction_data['auction_quick_facts']['VIN'] == 'WAUB8GFF9G1012345'
+    assert auction_data['known_flaws'] == ["Rock chips on the front bumper", "Curb rash on the wheels"]
+    assert auction_data['auction_videos'] == ['dQw4w9WgXcQ']
+
+
+def test_scrape_auction_http_cancelled(fixture_server, fetcher):
+    stats = scrape_auction.scrape_auction_http(fetcher, fixture_url(fixture_server, 'cancelled'))['auction_stats']
+
+    assert stats['auction_status'] == 'Canceled'
+    assert stats['highest_bid_value'] is None
+    assert stats['bids'] == [] and stats['bid_history'] == []
+
+
+@pytest.mark.parametrize('fixture', AUCTION_FIXTURES)
+def test_scrape_auction_http_keeps_the_dict_shape(fixture_server, fetcher, fixture):
+    url = fixture_url(fixture_server, fixture)
+    auction_data = scrape_auction.scrape_auction_http(fetcher, url)
+    expected = empty_auction_data(url)
+
+    assert auction_data.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            assert auction_data[key].keys() == value.keys()
+
+
+def test_scrape_auction_http_missing_page(fixture_server, fetcher):
+    assert scrape_auction.scrape_auction_http(fetcher, f"{fixture_server}/auctions/fx9999/no-such-fixture") is None
+
+
+def test_scrape_auction_http_page_that_needs_js(fixture_server, fetcher):
+    # a listing page served at an auction url has no auction title or comments in its static HTML
+    assert scrape_auction.scrape_auction_http(fetcher, f"{fixture_server}/auctions/fx9999/past_auctions_1") is None
+
+
+@pytest.mark.parametrize('path', ['/rate-limited', '/challenge'])
+def test_scrape_auction_http_blocked(blocked_server, fetcher, path):
+    assert scrape_auction.scrape_auction_http(fetcher, f"{blocked_server}{path}") is None
+
+
+def test_page_with_the_challenge_script_is_not_a_challenge(blocked_server, fetcher, monkeypatch):
+    throttled = []
+    monkeypatch.setattr(http_fetch.rate_limit, 'record_throttle', lambda *args: throttled.append(args))
+
+    assert '2016 Audi S4' in fetcher.get(f"{blocked_server}/with-challenge-script")
+    assert throttled == []
+
+
+def test_scrape_one_falls_back_to_selenium(blocked_server, fetcher, monkeypatch):
+    scraped_with = []
+
+    def scrape_auction_data(driver, url, timeout):
+        scraped_with.append(driver)
+        return {'auction_url': url, 'auction_title': "From Selenium"}
+
+    monkeypatch.setattr(scrape_auction, 'scrape_auction_data', scrape_auction_data)
+    monkeypatch.setattr(driver_setup, 'record_network_stats', lambda driver: None)
+    driver = object()
+
+    auction_data, next_driver = driver_pool.scrape_one(0, f"{blocked_server}/challenge", driver, fetcher=fetcher)
+
+    assert auction_data['auction_title'] == "From Selenium"
+    assert scraped_with == [driver] and next_driver is driver
+
+
+def test_scrape_one_skips_selenium_when_http_works(fixture_server, fetcher, monkeypatch):
+    monkeypatch.setattr(scrape_auction, 'scrape_auction_data', lambda *args: pytest.fail("fell back to Selenium"))
+
+    auction_data, driver = driver_pool.scrape_one(0, fixture_url(fixture_server, 'sold'), fetcher=fetcher)
+
+    assert auction_data['auction_title'] == "2016 Audi S4 Premium Plus"
+    assert driver is None
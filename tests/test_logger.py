@@ -0,0 +1,60 @@
+import glob
+import gzip
+import logging
+import os
+import time
+
+from logger import CompressingRotatingFileHandler, WarningSampler
+
+
+def record(message:str='hello', level:int=logging.INFO, lineno:int=1):
+    return logging.LogRecord('test', level, 'test_logger.py', lineno, message, None, None)
+
+
+def test_an_old_log_file_is_rotated_on_the_first_record(tmp_path):
+    path = tmp_path / 'logs.json'
+    path.write_text('yesterday\n')
+    day_ago = time.time() - 25 * 3600
+    os.utime(path, (day_ago, day_ago))
+
+    handler = CompressingRotatingFileHandler(str(path), rotate_hours=24)
+    handler.emit(record())
+    handler.close()
+
+    rotated = glob.glob(f"{path}.*.gz")
+    assert len(rotated) == 1
+    assert gzip.open(rotated[0]).read() == b'yesterday\n'
+    assert path.read_text() == 'hello\n'
+
+
+def test_a_recent_log_file_is_kept(tmp_path):
+    path = tmp_path / 'logs.json'
+    path.write_text('earlier today\n')
+
+    handler = CompressingRotatingFileHandler(str(path), rotate_hours=24)
+    handler.emit(record())
+    handler.close()
+
+    assert glob.glob(f"{path}.*.gz") == []
+    assert path.read_text() == 'earlier today\nhello\n'
+
+
+def test_rotation_by_size_keeps_backup_count(tmp_path):
+    path = tmp_path / 'logs.json'
+    handler = CompressingRotatingFileHandler(str(path), max_bytes=10, backup_count=2)
+    for i in range(6):
+        handler.emit(record(f"message {i}"))
+        # rotated file names are timestamped to the microsecond
+        time.sleep(0.002)
+    handler.close()
+
+    assert len(glob.glob(f"{path}.*.gz")) == 2
+
+
+def test_warning_sampler_limits_each_call_site():
+    sampler = WarningSampler(burst=2, interval=60)
+    warnings = [sampler.filter(record(level=logging.WARNING)) for _ in range(4)]
+
+    assert warnings == [True, True, False, False]
+    assert sampler.filter(record(level=logging.WARNING, lineno=2))
+    assert sampler.filter(record(level=logging.ERROR))
@@ -0,0 +1,87 @@
+import datetime
+import glob
+import io
+
+import pytest
+
+pq = pytest.importorskip('pyarrow.parquet')
+
+import parquet_sink
+import sinks
+
+
+def auction(i:int, ended:str='Jun 7, 2025') -> dict:
+    return {
+        'auction_url': f"https://carsandbids.com/auctions/a{i:05d}/car",
+        'auction_title': f"Car {i}",
+        'auction_stats': {'auction_date': ended, 'highest_bid_value': '24,500', 'bids': ['24500', '24000']},
+    }
+
+
+def test_flatten_auction_types():
+    row = parquet_sink.flatten_auction(auction(1))
+
+    assert row['auction_id'] == 'a00001'
+    assert row['auction_ended'] == datetime.date(2025, 6, 7)
+    assert row['highest_bid_value'] == 24500
+    assert row['bids'] == [24500, 24000]
+    assert parquet_sink.flatten_auction(auction(1, ended='—'))['auction_ended'] is None
+
+
+def test_local_parts_are_partitioned_by_date(tmp_path):
+    sink = parquet_sink.ParquetSink(root=str(tmp_path / 'parquet'), batch_size=2)
+    for i in range(3):
+        sink.write(auction(i))
+    sink.write(auction(3, ended='soon'))
+
+    assert sink.close()
+    dated = pq.read_table(str(tmp_path / 'parquet' / 'auction_date=2025-06-07'))
+    assert sorted(dated.column('auction_id').to_pylist()) == ['a00000', 'a00001', 'a00002']
+    assert str(dated.schema.field('auction_ended').type) == 'date32[day]'
+    assert glob.glob(str(tmp_path / 'parquet' / 'auction_date=unknown' / '*.parquet'))
+
+
+def test_abort_deletes_local_parts(tmp_path):
+    sink = parquet_sink.ParquetSink(root=str(tmp_path / 'parquet'), batch_size=2)
+    for i in range(5):
+        sink.write(auction(i))
+    assert len(sink.written) == 2
+
+    sink.abort()
+
+    assert not sink.close()
+    assert glob.glob(str(tmp_path / 'parquet' / '**' / '*.parquet'), recursive=True) == []
+
+
+def test_abort_deletes_s3_parts(s3):
+    sink = parquet_sink.ParquetSink(s3_client=s3, bucket='raw-auctions', batch_size=2)
+    for i in range(5):
+        sink.write(auction(i))
+    assert len(s3.list_objects_v2(Bucket='raw-auctions')['Contents']) == 2
+
+    sink.abort()
+
+    assert 'Contents' not in s3.list_objects_v2(Bucket='raw-auctions')
+
+
+def test_s3_parts_on_close(s3):
+    sink = parquet_sink.ParquetSink(s3_client=s3, bucket='raw-auctions', batch_size=2)
+    for i in range(3):
+        sink.write(auction(i))
+
+    assert sink.close()
+    keys = [item['Key'] for item in s3.list_objects_v2(Bucket='raw-auctions')['Contents']]
+    assert len(keys) == 2 and all(key.startswith('parquet/auction_date=2025-06-07/') for key in keys)
+    body = s3.get_object(Bucket='raw-auctions', Key=keys[0])['Body'].read()
+    assert pq.read_table(io.BytesIO(body)).num_rows == 2
+
+
+def test_failed_ndjson_upload_discards_the_parquet_output(s3, tmp_path):
+    ndjson = sinks.S3NdjsonSink(s3, 'missing-bucket', 'auctions.ndjson')
+    parquet = parquet_sink.ParquetSink(root=str(tmp_path / 'parquet'), batch_size=2)
+    sink = sinks.MultiSink([ndjson, parquet])
+    for i in range(3):
+        sink.write(auction(i))
+
+    assert not sink.close()
+    assert glob.glob(str(tmp_path / 'parquet' / '**' / '*.parquet'), recursive=True) == []
@@ -0,0 +1,56 @@
+import pytest
+from run_benchmarks import AUCTION_FIXTURES, fixture_url, read_fixture
+
+from parse_auction import empty_auction_data, parse_auction_html
+
+
+def shape(value):
+    """The structure of an auction dict: its keys at every level, with lists and scalars left as a type name."""
+    if isinstance(value, dict):
+        return {key: shape(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return 'list'
+    return 'scalar'
+
+
+@pytest.mark.parametrize('fixture', AUCTION_FIXTURES)
+def test_parse_auction_html_shape(fixture):
+    url = f"https://carsandbids.com/auctions/fx0000/{fixture}"
+
+    assert shape(parse_auction_html(read_fixture(fixture), url)) == shape(empty_auction_data(url))
+
+
+def test_malformed_counts_become_none():
+    html = read_fixture('sold').replace('<span class="td">28</span>', '<span class="td">—</span>')
+    auction_data = parse_auction_html(html, "https://carsandbids.com/auctions/fx0000/sold")
+    stats = auction_data['auction_stats']
+
+    assert stats['bid_count'] is None
+    # the rest of the page is still parsed
+    assert (stats['view_count'], stats['watcher_count']) == (12611, 204)
+    assert auction_data['auction_quick_facts']['Make'] == 'Audi'
+
+
+@pytest.fixture(scope='module')
+def driver():
+    driver_setup = pytest.importorskip('driver_setup')
+    try:
+        driver = driver_setup.setup_driver()
+    except Exception as e:
+        pytest.skip(f"needs Chrome: {e}")
+    yield driver
+    driver_setup.driver_teardown(driver)
+
+
+@pytest.mark.parametrize('mode', ['webdriver', 'page_source', 'js'])
+@pytest.mark.parametrize('fixture', AUCTION_FIXTURES)
+def test_selenium_and_selectolax_parity(fixture_server, driver, mode, fixture):
+    import scrape_auction
+
+    url = fixture_url(fixture_server, fixture)
+    from_selenium = scrape_auction.scrape_auction_data(driver, url, mode=mode)
+    from_html = parse_auction_html(read_fixture(fixture), url)
+
+    assert shape(from_selenium) == shape(from_html)
+    assert from_selenium['auction_title'] == from_html['auction_title']
+    assert from_selenium['auction_stats']['bid_count'] == from_html['auction_stats']['bid_count']
@@ -0,0 +1,31 @@
+import pytest
+
+import rate_limit
+
+CHALLENGE = "<html><head><title>Just a moment...</title></head><body><div id='cf-chl-widget'></div></body></html>"
+WIDGET_ONLY = "<html><head><title>carsandbids.com</title></head><body><div class='cf-chl-widget'></div></body></html>"
+NORMAL = (
+    "<html><head><title>2016 Audi S4 auction</title>"
+    "<script src='/cdn-cgi/challenge-platform/scripts/jsd/main.js'></script></head>"
+    "<body><h1>2016 Audi S4</h1></body></html>"
+)
+
+
+@pytest.mark.parametrize('html, status_code, expected', [
+    (CHALLENGE, 403, True),
+    (CHALLENGE, 200, True),
+    (WIDGET_ONLY, 503, True),
+    (WIDGET_ONLY, 200, False),
+    (NORMAL, 200, False),
+    (NORMAL, 403, False),
+    ("", 403, False),
+    (None, None, False),
+])
+def test_is_challenge(html, status_code, expected):
+    assert rate_limit.is_challenge(html, status_code) is expected
+
+
+def test_is_challenge_title():
+    assert rate_limit.is_challenge_title("Attention Required! | Cloudflare")
+    assert not rate_limit.is_challenge_title("2016 Audi S4 auction - Cars & Bids")
+    assert not rate_limit.is_challenge_title("")
@@ -0,0 +1,64 @@
+import pytest
+
+import retries
+import utils
+
+
+def url(id:str) -> str:
+    return f"https://carsandbids.com/auctions/{id}/some-car"
+
+
+@pytest.fixture(autouse=True)
+def schedule(monkeypatch):
+    monkeypatch.setattr(retries, 'retry_max_attempts', 3)
+    monkeypatch.setattr(retries, 'retry_base_delay', 60)
+    monkeypatch.setattr(retries, 'retry_max_delay', 150)
+
+
+def test_backoff_doubles_up_to_the_max():
+    assert [retries.backoff(attempts) for attempts in (1, 2, 3, 4)] == [60, 120, 150, 150]
+
+
+def test_failure_is_scheduled_with_backoff(db):
+    _, _, cursor = db
+
+    assert not retries.record_failure(cursor, url('a1'), RuntimeError("timeout"))
+    attempts, error, wait = cursor.execute(
+        "SELECT attempts, last_error, (julianday(next_attempt_at) - julianday('now')) * 86400 FROM auction_retries"
+    ).fetchone()
+
+    assert (attempts, error) == (1, 'timeout')
+    assert 55 < wait <= 60
+    assert retries.due_urls(cursor, [url('a1')]) == []
+    assert 55 < retries.seconds_until_due(cursor, [url('a1'), url('a2')]) <= 60
+    assert retries.seconds_until_due(cursor, [url('a2')]) is None
+
+
+def test_due_urls(db):
+    _, _, cursor = db
+    retries.record_failure(cursor, url('a1'), RuntimeError())
+    retries.record_failure(cursor, url('a2'), RuntimeError())
+    cursor.execute("UPDATE auction_retries SET next_attempt_at = datetime('now', '-1 seconds') WHERE auction_id = 'a1'")
+
+    assert retries.due_urls(cursor, [url('a1'), url('a2'), url('a3')]) == [url('a1')]
+    assert retries.seconds_until_due(cursor, [url('a1'), url('a2')]) == 0.0
+
+
+def test_dead_letter_after_max_attempts(db):
+    _, _, cursor = db
+    utils.stage_urls(cursor, [url('a1')])
+
+    results = [retries.record_failure(cursor, url('a1'), RuntimeError(f"attempt {i}")) for i in range(3)]
+
+    assert results == [False, False, True]
+    assert cursor.execute("SELECT COUNT(*) FROM auction_retries").fetchone()[0] == 0
+    assert cursor.execute("SELECT attempts, last_error FROM auction_dead_letters").fetchone() == (3, 'attempt 2')
+    assert cursor.execute("SELECT state FROM auction_staging").fetchone()[0] == 'dead'
+
+
+def test_success_clears_the_retry_state(db):
+    _, _, cursor = db
+    retries.record_failure(cursor, url('a1'), RuntimeError())
+
+    assert retries.record_success(cursor, [url('a1'), url('a2')]) == 1
+    assert cursor.execute("SELECT COUNT(*) FROM auction_retries").fetchone()[0] == 0
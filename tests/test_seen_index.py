@@ -0,0 +1,83 @@
+import seen_index
+import utils
+
+
+def url(id:str) -> str:
+    return f"https://carsandbids.com/auctions/{id}/some-car"
+
+
+def test_auction_id():
+    assert seen_index.auction_id(url('3xYzAb12')) == '3xYzAb12'
+
+
+def test_load_from_db_without_a_snapshot(db, tmp_path):
+    _, conn, cursor = db
+    utils.insert_urls(cursor, [url('a1'), url('a2')])
+    conn.commit()
+
+    index = seen_index.SeenIndex().load(cursor, str(tmp_path / 'seen.zst'))
+
+    assert len(index) == 2 and 'a1' in index and 'zz' not in index
+    assert index.filter_new([url('a1'), url('b1'), url('b1'), url('a2'), url('b2')]) == [url('b1'), url('b2')]
+
+
+def test_snapshot_round_trip_picks_up_later_rows(db, tmp_path):
+    _, conn, cursor = db
+    path = str(tmp_path / 'seen.zst')
+    utils.insert_urls(cursor, [url('a1'), url('a2')])
+    conn.commit()
+    seen_index.SeenIndex().load(cursor, path).save_snapshot(cursor, path)
+
+    utils.insert_urls(cursor, [url('a3')])
+    conn.commit()
+    index = seen_index.SeenIndex().load(cursor, path)
+
+    assert index.ids == {'a1', 'a2', 'a3'}
+    assert index.max_rowid == 3
+
+
+def test_snapshot_out_of_sync_is_rebuilt(db, tmp_path):
+    _, conn, cursor = db
+    path = str(tmp_path / 'seen.zst')
+    utils.insert_urls(cursor, [url('a1'), url('a2')])
+    conn.commit()
+    seen_index.SeenIndex().load(cursor, path).save_snapshot(cursor, path)
+
+    cursor.execute("DELETE FROM urls WHERE auction_id = 'a2'")
+    conn.commit()
+    index = seen_index.SeenIndex().load(cursor, path)
+
+    assert index.ids == {'a1'}
+
+
+def test_unreadable_snapshot_falls_back_to_db(db, tmp_path):
+    _, conn, cursor = db
+    path = tmp_path / 'seen.zst'
+    path.write_bytes(b'not zstd')
+    utils.insert_urls(cursor, [url('a1')])
+    conn.commit()
+
+    assert seen_index.SeenIndex().load(cursor, str(path)).ids == {'a1'}
+
+
+def test_add_marks_urls_as_seen(db, tmp_path):
+    _, _, cursor = db
+    index = seen_index.SeenIndex().load(cursor, str(tmp_path / 'seen.zst'))
+    index.add([url('a1')])
+
+    assert index.filter_new([url('a1'), url('a2')]) == [url('a2')]
+
+
+def test_staged_filter_leaves_out_staged_auctions(db, tmp_path):
+    _, conn, cursor = db
+    utils.insert_urls(cursor, [url('a1')])
+    utils.stage_urls(cursor, [url('a2')])
+    conn.commit()
+    index = seen_index.SeenIndex().load(cursor, str(tmp_path / 'seen.zst'))
+
+    filter_new = index.staged_filter(cursor)
+
+    assert filter_new([url('a1'), url('a2'), url('a3')]) == [url('a3')]
+    # what's staged after the filter was made is still new to it, that's the run's own discovery
+    utils.stage_urls(cursor, [url('a3')])
+    assert filter_new([url('a3')]) == [url('a3')]
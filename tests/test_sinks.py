@@ -0,0 +1,137 @@
+import json
+import os
+import threading
+import time
+
+import sinks
+
+
+def records(count:int, padding:int=0) -> list:
+    return [{'auction_url': f"https://carsandbids.com/auctions/a{i:05d}/car", 'notes': 'x' * padding} for i in range(count)]
+
+
+def read_object(s3, key:str) -> list:
+    body = s3.get_object(Bucket='raw-auctions', Key=key)['Body'].read().decode('utf-8')
+    return [json.loads(line) for line in body.splitlines()]
+
+
+def test_s3_sink_small_run_is_a_single_put(s3):
+    sink = sinks.S3NdjsonSink(s3, 'raw-auctions', 'auctions.ndjson')
+    for record in records(3):
+        sink.write(record)
+
+    assert sink.close()
+    assert sink.upload_id is None
+    assert read_object(s3, 'auctions.ndjson') == records(3)
+
+
+def test_s3_sink_multipart_upload(s3):
+    # ~12MB with 5MB parts: two full parts and the rest uploaded by close()
+    sink = sinks.S3NdjsonSink(s3, 'raw-auctions', 'auctions.ndjson', part_size=sinks.MIN_PART_SIZE)
+    for record in records(120, padding=100_000):
+        sink.write(record)
+    assert len(sink.parts) == 2
+
+    assert sink.close()
+    assert len(sink.parts) == 3
+    assert read_object(s3, 'auctions.ndjson') == records(120, padding=100_000)
+    assert not s3.list_multipart_uploads(Bucket='raw-auctions').get('Uploads')
+
+
+def test_s3_sink_abort_discards_uploaded_parts(s3):
+    sink = sinks.S3NdjsonSink(s3, 'raw-auctions', 'auctions.ndjson', part_size=sinks.MIN_PART_SIZE)
+    for record in records(60, padding=100_000):
+        sink.write(record)
+    assert sink.parts
+
+    sink.abort()
+
+    assert not sink.close()
+    assert not s3.list_multipart_uploads(Bucket='raw-auctions').get('Uploads')
+    assert 'Contents' not in s3.list_objects_v2(Bucket='raw-auctions')
+
+
+def test_s3_sink_failed_upload_returns_false(s3):
+    sink = sinks.S3NdjsonSink(s3, 'missing-bucket', 'auctions.ndjson')
+    sink.write(records(1)[0])
+
+    assert not sink.close()
+    assert sink.failed
+
+
+def test_local_sink_only_appears_on_close(tmp_path):
+    sink = sinks.LocalNdjsonSink(str(tmp_path), 'auctions.ndjson')
+    for record in records(3):
+        sink.write(record)
+    assert not os.path.exists(sink.path)
+
+    assert sink.close()
+    assert sink.close()
+    with open(sink.path) as file:
+        assert [json.loads(line) for line in file] == records(3)
+    assert not os.path.exists(sink.part_path)
+
+
+def test_local_sink_replaces_an_earlier_file(tmp_path):
+    (tmp_path / 'auctions.ndjson').write_text('{"stale": true}\n')
+    sink = sinks.LocalNdjsonSink(str(tmp_path), 'auctions.ndjson')
+    sink.write(records(1)[0])
+    sink.close()
+
+    assert (tmp_path / 'auctions.ndjson').read_text().splitlines() == [json.dumps(records(1)[0], separators=(',', ':'))]
+
+
+def test_local_sink_abort_leaves_nothing_behind(tmp_path):
+    sink = sinks.LocalNdjsonSink(str(tmp_path), 'auctions.ndjson')
+    sink.write(records(1)[0])
+    sink.abort()
+
+    assert not sink.close()
+    assert os.listdir(tmp_path) == []
+
+
+class SlowFile:
+    """File wrapper that stalls inside write(), so an abort() lands in the middle of it."""
+
+    def __init__(self, file):
+        self.file = file
+        self.writing = threading.Event()
+
+    def write(self, data):
+        self.writing.set()
+        time.sleep(0.2)
+        return self.file.write(data)
+
+    def __getattr__(self, name):
+        return getattr(self.file, name)
+
+
+def test_local_sink_abort_waits_for_a_write_in_progress(tmp_path):
+    sink = sinks.LocalNdjsonSink(str(tmp_path), 'auctions.ndjson')
+    sink.file = SlowFile(sink.file)
+    errors = []
+
+    def write():
+        try:
+            sink.write(records(1)[0])
+        except Exception as e:
+            errors.append(e)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+    sink.file.writing.wait()
+    sink.abort()
+    writer.join()
+
+    assert errors == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_multi_sink_fails_if_any_sink_fails(s3, tmp_path):
+    local = sinks.LocalNdjsonSink(str(tmp_path), 'auctions.ndjson')
+    remote = sinks.S3NdjsonSink(s3, 'missing-bucket', 'auctions.ndjson')
+    sink = sinks.MultiSink([local, remote])
+    sink.write(records(1)[0])
+
+    assert not sink.close()
+    assert os.path.exists(local.path)
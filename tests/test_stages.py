@@ -0,0 +1,143 @@
+import json
+import os
+
+import pytest
+
+import metrics
+import seen_index
+import stages
+import utils
+
+
+def stage(cursor, count:int):
+    """Stages `count` discovered auctions, a0 to a<count - 1>."""
+    cursor.executemany(
+        "INSERT INTO auction_staging(auction_id, url) VALUES(?, ?)",
+        [(f"a{i}", f"https://carsandbids.com/auctions/a{i}/car") for i in range(count)]
+    )
+
+
+def batch_state(cursor, batch_id:int) -> str:
+    return cursor.execute("SELECT state FROM url_batches WHERE batch_id = ?", (batch_id,)).fetchone()[0]
+
+
+def test_create_batches_only_batches_new_auctions(db):
+    _, conn, cursor = db
+    stage(cursor, 5)
+
+    batch_ids = stages.create_batches(conn, cursor, batch_size=2)
+
+    assert len(batch_ids) == 3
+    assert stages.batch_urls(cursor, batch_ids[0]) == [
+        "https://carsandbids.com/auctions/a0/car", "https://carsandbids.com/auctions/a1/car"
+    ]
+    assert stages.create_batches(conn, cursor, batch_size=2) == []
+
+
+def test_claim_batches_hands_each_batch_out_once(db):
+    db_path, conn, cursor = db
+    stage(cursor, 4)
+    stages.create_batches(conn, cursor, batch_size=1)
+    other_conn, other_cursor = utils.db_connection(db_path)
+
+    first = stages.claim_batches(conn, cursor, 'pending', 'scraping', 3)
+    second = stages.claim_batches(other_conn, other_cursor, 'pending', 'scraping', 3)
+
+    assert first == [1, 2, 3] and second == [4]
+    assert stages.claim_batches(conn, cursor, 'pending', 'scraping', 3) == []
+    other_cursor.close()
+    other_conn.close()
+
+
+def test_claim_batches_takes_over_an_expired_lease(db):
+    _, conn, cursor = db
+    stage(cursor, 2)
+    stages.create_batches(conn, cursor, batch_size=1)
+    stages.claim_batches(conn, cursor, 'pending', 'scraping', 2)
+    cursor.execute("UPDATE url_batches SET lease_expires_at = datetime('now', '-1 minute') WHERE batch_id = 1")
+    conn.commit()
+
+    assert stages.claim_batches(conn, cursor, 'pending', 'scraping', 2) == [1]
+
+
+def test_claim_batches_waits_for_not_before(db):
+    _, conn, cursor = db
+    stage(cursor, 2)
+    stages.create_batches(conn, cursor, batch_size=1)
+    cursor.execute("UPDATE url_batches SET not_before = datetime('now', '+1 hour') WHERE batch_id = 1")
+    conn.commit()
+
+    assert stages.claim_batches(conn, cursor, 'pending', 'scraping', 2) == [2]
+
+
+def test_settle_batch(db):
+    _, conn, cursor = db
+    stage(cursor, 2)
+    batch_id, = stages.create_batches(conn, cursor, batch_size=2)
+    stages.claim_batches(conn, cursor, 'pending', 'scraping')
+    cursor.execute("UPDATE auction_staging SET state = 'scraped' WHERE auction_id = 'a0'")
+    cursor.execute(
+        "INSERT INTO auction_retries(auction_id, url, attempts, next_attempt_at) "
+        "VALUES('a1', 'https://carsandbids.com/auctions/a1/car', 1, datetime('now', '+1 hour'))"
+    )
+
+    assert not stages.settle_batch(cursor, batch_id)
+    state, not_before = cursor.execute(
+        "SELECT state, not_before FROM url_batches WHERE batch_id = ?", (batch_id,)
+    ).fetchone()
+    assert state == 'pending' and not_before is not None
+
+    cursor.execute("UPDATE auction_staging SET state = 'dead' WHERE auction_id = 'a1'")
+    assert stages.settle_batch(cursor, batch_id)
+    assert batch_state(cursor, batch_id) == 'scraped'
+
+
+@pytest.fixture
+def publish_db(db, tmp_path, monkeypatch):
+    db_path, conn, cursor = db
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(stages, 'db_path', db_path)
+    monkeypatch.setattr(stages, 'output_sink', 'local')
+    monkeypatch.setattr(stages, 'parquet_output', None)
+    monkeypatch.setattr(metrics, 'metrics_dir', str(tmp_path / 'metrics'))
+    monkeypatch.setattr(seen_index, '_index', None)
+    monkeypatch.setattr(seen_index, 'snapshot_path', str(tmp_path / 'seen.zst'))
+    return db
+
+
+def test_run_publish_writes_the_scraped_batches(publish_db, tmp_path):
+    _, conn, cursor = publish_db
+    stage(cursor, 3)
+    batch_ids = stages.create_batches(conn, cursor, batch_size=2)
+    cursor.execute("UPDATE auction_staging SET state = 'scraped', payload = json_object('auction_url', url)")
+    cursor.execute("UPDATE url_batches SET state = 'scraped'")
+    conn.commit()
+
+    assert stages.run_publish() == 3
+
+    with open(tmp_path / 'spool' / stages.batch_key(batch_ids)) as file:
+        assert [json.loads(line)['auction_url'] for line in file] == [
+            f"https://carsandbids.com/auctions/a{i}/car" for i in range(3)
+        ]
+    assert {batch_state(cursor, batch_id) for batch_id in batch_ids} == {'published'}
+    assert cursor.execute("SELECT COUNT(*) FROM urls").fetchone()[0] == 3
+    prom = (tmp_path / 'metrics' / 'carsnbids_scraper_publish.prom').read_text()
+    assert 'carsnbids_scraper_stage_duration_seconds{stage="upload",pipeline_stage="publish"}' in prom
+
+
+def test_stage_metrics_are_exported_when_the_stage_fails(publish_db, tmp_path, monkeypatch):
+    _, conn, cursor = publish_db
+    stage(cursor, 1)
+    stages.create_batches(conn, cursor)
+    cursor.execute("UPDATE url_batches SET state = 'scraped'")
+    conn.commit()
+    monkeypatch.setattr(stages, 'output_sink', 'ftp')
+
+    with pytest.raises(ValueError):
+        stages.run_publish()
+
+    reports = [name for name in os.listdir(tmp_path / 'metrics') if name.endswith('_publish.json')]
+    assert len(reports) == 1
+    with open(tmp_path / 'metrics' / reports[0]) as file:
+        report = json.load(file)
+    assert report['stage'] == 'publish' and report['success'] is False